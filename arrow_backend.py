@@ -0,0 +1,191 @@
+import os
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+from dtypes import parse_timestamps
+from monthly_sales_calculations import important_variables, translate_column, translated_col_and_values_sheet
+
+
+class ArrowBackend:
+    """
+    Calculations with pyarrow compute, which groups rows using every core
+
+    Gives the same per Resource ID state as the pandas backend: the first and last values of each column are the
+    first and last values which are not missing, found as the lowest and highest row numbers of each group so that
+    they do not depend on the order in which threads finish. Usage amounts may differ from pandas in the last digits,
+    as the sums are added up in a different order.
+    """
+    name = "arrow"
+
+    def translate(self, untranslated_df, translations, untranslated=None):
+        """
+        Translate the values in the columns with a translation worksheet, then rename the header titles
+
+        Each column is dictionary encoded so only its unique values are looked up, and columns are translated in parallel
+        """
+        if untranslated is None:
+            untranslated = {}
+        untranslated.setdefault("missing_columns", [])
+        untranslated.setdefault("values", {})
+
+        cols_to_translate = [
+            worksheet
+            for worksheet in translations
+            if worksheet not in [translated_col_and_values_sheet, "Header"]
+        ]
+
+        translated_df = untranslated_df.copy(deep=False)
+
+        cols_present = []
+        for col in cols_to_translate:
+            if col not in translated_df.columns:
+                untranslated["missing_columns"].append(col)
+            else:
+                cols_present.append(col)
+
+        with ThreadPoolExecutor(max_workers=min(len(cols_present), os.cpu_count() or 1) or 1) as executor:
+            results = list(executor.map(
+                lambda col: translate_arrow_column(translated_df[col], translations[col]),
+                cols_present,
+            ))
+
+        for col, (translated, missing_values) in zip(cols_present, results):
+            translated_df[col] = translated
+            # Only list each value once when chunks of the same worksheet are translated
+            for value in missing_values:
+                if value not in untranslated["values"].setdefault(col, []):
+                    untranslated["values"][col].append(value)
+
+        return translated_df.rename(columns=translations["Header"])
+
+    def sales_state(self, sales_df, translations, timestamp_formats=None):
+        """
+        Get the per Resource ID state of hourly and postpaid sales, in the same form as `monthly_sales_calculations.sales_state`
+        """
+        (
+            project_id,
+            resource_id,
+            resource_name,
+            resource_type,
+            region,
+            billing_method,
+            configuration,
+            order_type,
+            order_start_time,
+            order_end_time,
+            unit_price,
+            usage_amount,
+            monthly,
+            delete_refund
+        ) = important_variables(translations)
+
+        # Filter out hourly and postpaid sales and parse their times, in the same way as the pandas backend
+        hourly_and_postpaid_df = sales_df[sales_df[billing_method] != monthly]
+        hourly_and_postpaid_df = hourly_and_postpaid_df.assign(
+            **{
+                order_start_time: parse_timestamps(hourly_and_postpaid_df[order_start_time], timestamp_formats),
+                order_end_time: parse_timestamps(hourly_and_postpaid_df[order_end_time], timestamp_formats),
+            }
+        )
+
+        table = pa.Table.from_pandas(hourly_and_postpaid_df, preserve_index=False)
+        # Rows without a Resource ID are left out, as pandas does when grouping
+        table = table.filter(pc.is_valid(table[resource_id]))
+        keys, key_values = group_keys(table[resource_id])
+        rows = pa.array(np.arange(table.num_rows, dtype=np.int64))
+
+        first_cols = [col for col in table.column_names if col not in [resource_id, usage_amount]]
+        last_cols = [order_type, order_start_time, order_end_time]
+
+        # Row numbers of the values which are not missing, the lowest and highest of each group are its first and last values
+        columns = {"key": keys, "usage": table[usage_amount]}
+        aggregations = [("usage", "sum", pc.ScalarAggregateOptions(skip_nulls=True, min_count=0))]
+        for i, col in enumerate(first_cols):
+            columns[f"first_{i}"] = pc.if_else(pc.is_valid(table[col]), rows, None)
+            aggregations.append((f"first_{i}", "min"))
+        for i, col in enumerate(last_cols):
+            columns[f"last_{i}"] = pc.if_else(pc.is_valid(table[col]), rows, None)
+            aggregations.append((f"last_{i}", "max"))
+
+        grouped = pa.table(columns).group_by("key").aggregate(aggregations).sort_by("key")
+
+        # Take the first and last values of each group, groups without any value get a missing value
+        state = {}
+        for i, col in enumerate(first_cols):
+            state[col] = table[col].take(grouped[f"first_{i}_min"]).to_pandas()
+        for i, col in enumerate(last_cols):
+            state[col + "_last_row"] = table[col].take(grouped[f"last_{i}_max"]).to_pandas()
+        usage = grouped["usage_sum"]
+        state[usage_amount] = pc.fill_null(usage, pa.scalar(0, usage.type)).to_pandas()
+
+        state_df = pd.DataFrame(state)
+        state_df.index = pd.Index(key_values(grouped["key"]).to_pandas(), name=resource_id)
+        return state_df
+
+
+def group_keys(column):
+    """
+    Keys to group a column by, and a function turning the sorted keys back into the column's values
+
+    Categorical columns are grouped by their integer codes, which is faster than grouping by text and
+    sorts the groups in the order of the categories, as pandas does. Their values stay categorical, so that
+    states of several chunks are also merged in the order of the categories.
+    """
+    if not pa.types.is_dictionary(column.type):
+        return column, lambda keys: keys
+
+    # Chunks of a column can have different dictionaries, so give them all the same one first
+    column = column.unify_dictionaries() if isinstance(column, pa.ChunkedArray) else column
+    chunks = column.chunks if isinstance(column, pa.ChunkedArray) else [column]
+    if not chunks:
+        return column.cast(column.type.value_type), lambda keys: keys
+    dictionary = chunks[0].dictionary
+    indices = pa.chunked_array([chunk.indices for chunk in chunks], column.type.index_type)
+    return indices, lambda keys: pa.DictionaryArray.from_arrays(keys.combine_chunks(), dictionary)
+
+
+def translate_arrow_column(column, translation):
+    """
+    Map the unique values of a column through the translation with Arrow, returning the translated column and
+    the values without a translation in the same way as `monthly_sales_calculations.translate_column`
+    """
+    try:
+        array = pa.array(column, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        # Columns mixing numbers and text cannot be held by Arrow
+        return translate_column(column, translation)
+
+    # Categorical columns are already dictionary encoded
+    encoded = array if pa.types.is_dictionary(array.type) else pc.dictionary_encode(array)
+    uniques = encoded.dictionary.to_pylist()
+
+    english_values = set(translation.values())
+    translated_uniques = []
+    missing_values = []
+    for value in uniques:
+        if value in translation:
+            translated_uniques.append(translation[value])
+        else:
+            translated_uniques.append(value)
+            # Values which are already in English do not need a translation
+            if value not in english_values:
+                missing_values.append(value)
+
+    # Nothing to translate, keep the column as it is
+    if translated_uniques == uniques:
+        return column, missing_values
+
+    try:
+        dictionary = pa.array(translated_uniques, from_pandas=True)
+    except (pa.ArrowInvalid, pa.ArrowTypeError):
+        return translate_column(column, translation)
+
+    if len(set(translated_uniques)) == len(translated_uniques) and not any(pd.isna(translated_uniques)):
+        translated = pa.DictionaryArray.from_arrays(encoded.indices, dictionary).to_pandas()
+    else:
+        # Several values have the same translation, so the translations cannot be categories
+        translated = dictionary.take(encoded.indices).to_pandas()
+    translated.index = column.index
+    return translated.rename(column.name), missing_values
@@ -0,0 +1,205 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+from dtypes import apply_dtype_plan
+from generate_sample_data import english_billing_data, generate_billing_data, generated_translations
+from monthly_sales_calculations import (
+    backends,
+    combine_sales_states,
+    dtype_plan,
+    finalize_sales_state,
+    get_backend,
+    report_columns,
+)
+
+# Relative tolerance for float columns, sums of usage amounts are added up in a different order by each backend
+float_tolerance = 1e-9
+
+
+def edge_cases(df, seed=0):
+    """
+    Copies of generated billing data with values which the backends could handle differently
+    """
+    rng = np.random.default_rng(seed)
+    cases = {}
+
+    # Missing usage amounts and unit prices, and a resource whose usage amounts are all missing
+    missing_amounts = df.copy()
+    missing_amounts.loc[rng.random(len(df)) < 0.05, "使用金额"] = np.nan
+    missing_amounts.loc[rng.random(len(df)) < 0.05, "单价"] = np.nan
+    missing_amounts.loc[missing_amounts["资源ID"] == missing_amounts["资源ID"].iloc[-1], "使用金额"] = np.nan
+    cases["missing amounts"] = missing_amounts
+
+    # Rows without a billing method are neither monthly nor left out
+    missing_billing = df.copy()
+    missing_billing.loc[rng.random(len(df)) < 0.05, "计费方式"] = None
+    cases["missing billing method"] = missing_billing
+
+    # Rows without a Resource ID are left out of the report
+    missing_ids = df.copy()
+    missing_ids.loc[rng.random(len(df)) < 0.05, "资源ID"] = None
+    cases["missing resource ID"] = missing_ids
+
+    # Details missing from the first rows of a resource are taken from its next rows
+    missing_details = df.copy()
+    first_rows = ~missing_details["资源ID"].duplicated()
+    missing_details.loc[first_rows, "地域"] = None
+    missing_details.loc[first_rows, "订单开始时间"] = None
+    missing_details.loc[rng.random(len(df)) < 0.05, "订单类型"] = None
+    cases["missing details"] = missing_details
+
+    # Values without a translation, and a column which is not translated
+    untranslated_values = df.copy()
+    untranslated_values.loc[rng.random(len(df)) < 0.01, "地域"] = "新区域"
+    untranslated_values["备注"] = rng.choice(["无", "测试"], size=len(df))
+    cases["untranslated values"] = untranslated_values
+
+    return cases
+
+
+def unsorted_categories(df):
+    """
+    Copy of a DataFrame with the categories of its categorical columns in reverse order
+    """
+    df = df.copy()
+    for col in df.columns:
+        if isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].cat.reorder_categories(df[col].cat.categories[::-1])
+    return df
+
+
+def compare_frames(expected, actual):
+    """
+    Describe the first difference between two DataFrames, None if they are the same
+
+    Float columns may differ by `float_tolerance`, every other column must be exactly the same
+    """
+    if list(expected.columns) != list(actual.columns):
+        return f"columns differ: {list(expected.columns)} != {list(actual.columns)}"
+    if len(expected) != len(actual):
+        return f"{len(expected)} rows != {len(actual)} rows"
+    if not expected.index.astype(object).equals(actual.index.astype(object)):
+        return "index differs"
+
+    for col in expected.columns:
+        left = expected[col]
+        right = actual[col]
+        if pd.api.types.is_float_dtype(left) and pd.api.types.is_float_dtype(right):
+            same = np.isclose(left.to_numpy(), right.to_numpy(), rtol=float_tolerance, atol=0, equal_nan=True)
+        else:
+            left = left.astype(object).to_numpy()
+            right = right.astype(object).to_numpy()
+            same = (left == right) | (pd.isna(left) & pd.isna(right))
+        if not same.all():
+            row = int(np.argmin(same))
+            return f"column {col} differs at row {row}: {left[row]!r} != {right[row]!r}"
+    return None
+
+
+def run_backend(backend, raw_df, translations, already_translated=False, chunk_size=None):
+    """
+    Translate raw data and calculate its report with a backend, in chunks of rows if `chunk_size` is given
+
+    Returns the report, the translated raw data (None if it was already translated) and the untranslated values
+    """
+    backend = get_backend(backend)
+    untranslated = {}
+    translated_parts = []
+    state = None
+    timestamp_formats = {}
+
+    chunks = [raw_df] if not chunk_size else [raw_df.iloc[i:i + chunk_size] for i in range(0, len(raw_df), chunk_size)]
+    for chunk in chunks:
+        if not already_translated:
+            chunk = backend.translate(chunk, translations, untranslated)
+            translated_parts.append(chunk)
+        state = combine_sales_states([state, backend.sales_state(chunk, translations, timestamp_formats)], translations)
+
+    report = finalize_sales_state(state, translations)[report_columns(translations)]
+    translated = pd.concat(translated_parts) if translated_parts else None
+    return report, translated, untranslated
+
+
+def check_case(raw_df, translations, already_translated=False, chunk_size=None, other="arrow"):
+    """
+    Compare the results of the pandas backend and another backend on the same raw data, returning the differences found
+    """
+    expected = run_backend("pandas", raw_df, translations, already_translated, chunk_size)
+    actual = run_backend(other, raw_df, translations, already_translated, chunk_size)
+
+    differences = []
+    difference = compare_frames(expected[0], actual[0])
+    if difference:
+        differences.append(f"report: {difference}")
+    if expected[1] is not None:
+        difference = compare_frames(expected[1], actual[1])
+        if difference:
+            differences.append(f"translated raw data: {difference}")
+    if expected[2] != actual[2]:
+        differences.append(f"untranslated values: {expected[2]} != {actual[2]}")
+    return differences
+
+
+def cases(rows, seeds):
+    """
+    Raw data to compare the backends on, named after how it was made
+    """
+    for size in rows:
+        for seed in seeds:
+            df = generate_billing_data(size, seed)
+            yield f"{size} rows, seed {seed}", df, False
+            yield f"{size} rows, seed {seed}, English", english_billing_data(df), True
+            for name, case in edge_cases(df, seed).items():
+                yield f"{size} rows, seed {seed}, {name}", case, False
+
+
+def column_variants(df, plan):
+    """
+    Raw data with the column dtypes it can be read with, named after them
+
+    Raw data is read with categorical columns by total_sales, and with plain columns from some caches.
+    Categories which are not sorted (as in states saved before merged categories were sorted) change the order of the report's rows
+    """
+    categorical = apply_dtype_plan(df.copy(), plan)
+    return {
+        "plain": df,
+        "categorical": categorical,
+        "unsorted categorical": unsorted_categories(categorical),
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Check that every calculation backend gives the same reports as the pandas backend.")
+    parser.add_argument("-r", "--rows", type=int, nargs="+", default=[1000, 20000], help="Sizes of the generated datasets (default: 1000 20000)")
+    parser.add_argument("--seeds", type=int, default=3, help="Number of generated datasets of each size (default: 3)")
+    parser.add_argument("--chunk-size", type=int, default=700, help="Also compare the backends processing the data this many rows at a time (default: 700)")
+    parser.add_argument("--backend", nargs="+", default=[backend for backend in backends if backend != "pandas"], choices=backends, help="Backends to compare against the pandas backend (default: all of them)")
+    args = parser.parse_args(argv)
+
+    translations = generated_translations()
+    plan = dtype_plan(translations)
+    failures = 0
+    checks = 0
+    start = time.perf_counter()
+
+    for name, df, already_translated in cases(args.rows, range(args.seeds)):
+        for variant, raw_df in column_variants(df, plan).items():
+            for chunk_size in [None, args.chunk_size]:
+                for backend in args.backend:
+                    label = f"{backend}: {name}, {variant} columns" + (f", chunks of {chunk_size}" if chunk_size else "")
+                    differences = check_case(raw_df, translations, already_translated, chunk_size, backend)
+                    checks += 1
+                    if differences:
+                        failures += 1
+                        print(f"MISMATCH {label}")
+                        for difference in differences:
+                            print(f"       {difference}")
+
+    print(f"{checks - failures}/{checks} case(s) match the pandas backend in {time.perf_counter() - start:.2f}s")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,222 @@
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from monthly_sales_calculations import backends, total_sales, parse_translations
+from excel_io import output_formats, worksheets_by_name_or_index
+from instrumentation import RunReport
+
+# Translations parsed once by each worker process
+worker_translations = None
+
+
+def init_worker(translation_sheet, use_cache=True):
+    """
+    Parse the translation source once when a worker process starts
+    """
+    global worker_translations
+    worker_translations = parse_translations(translation_sheet, use_cache)
+
+
+def process_file(file_path, sheet_name, options, run_report_path=None):
+    """
+    Run total sales for a single workbook, returning the wall time taken, the error message if it failed,
+    the columns and values that could not be translated and the run report
+
+    If `run_report_path` is given, the time, memory use and rows of each stage are recorded and saved there
+    """
+    start = time.perf_counter()
+    untranslated = {}
+    run_report = RunReport(trace_memory=True) if run_report_path else None
+    try:
+        sheet_name = worksheets_by_name_or_index(file_path, sheet_name)
+        total_sales(
+            file_path,
+            sheet_name,
+            translations=worker_translations,
+            untranslated=untranslated,
+            run_report=run_report,
+            **options,
+        )
+        error = None
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+
+    if run_report:
+        run_report.details["error"] = error
+        run_report.save(run_report_path)
+    return time.perf_counter() - start, error, untranslated, run_report.summary() if run_report else None
+
+
+def print_untranslated(untranslated):
+    """
+    Print the columns and values that could not be translated
+    """
+    for col in untranslated.get("missing_columns", []):
+        print(f"       Values in column {col} not translated!")
+    for col, values in untranslated.get("values", {}).items():
+        print(f"       {len(values)} value(s) in column {col} without translation: {', '.join(map(str, values[:10]))}")
+
+
+def expand_inputs(patterns):
+    """
+    Expand file paths and globs into a sorted list of unique workbooks
+    """
+    files = set()
+    for pattern in patterns:
+        matches = glob.glob(pattern, recursive=True)
+        # Keep paths without matches so that they are reported as failures
+        files.update(matches if matches else [pattern])
+    # Skip lock files that Excel creates for open workbooks
+    return sorted(file for file in files if not os.path.basename(file).startswith("~$"))
+
+
+def output_path(file_path, output_dir, output_format="xlsx"):
+    """
+    Filepath of the new spreadsheet created for an input workbook
+    """
+    folder = output_dir if output_dir else os.path.dirname(file_path)
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    return os.path.join(folder, "result_" + filename + "." + output_format)
+
+
+def state_path(file_path, sheet_name, state_dir):
+    """
+    Filepath of the saved state for a worksheet of an input workbook, None if states are not saved
+
+    When several worksheets are processed together, total_sales adds each worksheet's name to the filepath
+    """
+    if not state_dir:
+        return None
+    filename = os.path.splitext(os.path.basename(file_path))[0]
+    if isinstance(sheet_name, list):
+        return os.path.join(state_dir, f"{filename}.state.pickle")
+    return os.path.join(state_dir, f"{filename}.{sheet_name}.state.pickle")
+
+
+def colliding_inputs(files, sheet_name, output_dir, output_format, state_dir):
+    """
+    Groups of workbooks whose new spreadsheets or states would be saved to the same filepath, and would overwrite
+    each other, as they are named after the workbook's filename only (such as march.xlsx in two folders, or march.xlsx and march.xls)
+    """
+    by_path = {}
+    for file in files:
+        paths = {output_path(file, output_dir, output_format), state_path(file, sheet_name, state_dir)}
+        for path in paths - {None}:
+            by_path.setdefault(os.path.normcase(os.path.abspath(path)), []).append(file)
+    groups = []
+    for group in by_path.values():
+        if len(group) > 1 and group not in groups:
+            groups.append(group)
+    return groups
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Generate monthly sales reports for many workbooks without the user interface."
+    )
+    parser.add_argument("inputs", nargs="+", help="Workbooks or glob patterns of workbooks to process")
+    parser.add_argument("-s", "--sheet", nargs="+", default=["0"], help="Worksheet names or 0-based indexes to process in every workbook (a number is a name if a worksheet has that name), several worksheets are saved as worksheets of one new spreadsheet (default: first worksheet)")
+    parser.add_argument("-t", "--translation", default="Language Translation.xlsx", help="Translation source file")
+    parser.add_argument("--already-translated", action="store_true", help="Raw data is already in English")
+    parser.add_argument("--save-translations", action="store_true", help="Save translation of raw data")
+    parser.add_argument("--translate-only", action="store_true", help="Only translate the raw data")
+    parser.add_argument("--add-to", metavar="WORKSHEET", help="Add the report as a new worksheet to each input workbook")
+    parser.add_argument("--no-new-spreadsheet", action="store_true", help="Do not create a new spreadsheet for each report")
+    parser.add_argument("-o", "--output-dir", help="Folder to save new spreadsheets in (default: folder of each input)")
+    parser.add_argument("-f", "--format", default="xlsx", choices=output_formats, help="File format of the new spreadsheets and translated raw data (default: xlsx)")
+    parser.add_argument("--new-worksheet", default="Sheet1", help="Worksheet name in the new spreadsheets")
+    parser.add_argument("--rollups", action="store_true", help="Also save totals and subtotals by project, region, resource type and billing method, as a Rollup worksheet (or a _Rollup file for other formats)")
+    parser.add_argument("--state-dir", help="Save the state of each workbook in this folder and on later runs only process rows added since then")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read from or save to the cache of parsed worksheets and translations")
+    parser.add_argument("--chunk-size", type=int, help="Read worksheets this many rows at a time to limit memory use on very large worksheets")
+    parser.add_argument("--backend", default="pandas", choices=backends, help="Library which translates and calculates the reports, arrow needs pyarrow (default: pandas)")
+    parser.add_argument("--run-report", action="store_true", help="Print the time, memory use and rows of each stage, and save them as result_filename.run.json next to each output")
+    parser.add_argument("-w", "--workers", type=int, default=os.cpu_count(), help="Number of worker processes (default: number of CPUs)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    files = expand_inputs(args.inputs)
+    # Numbers are worksheet indexes unless a workbook has a worksheet of that name, which is worked out for each workbook
+    sheet_name = args.sheet[0] if len(args.sheet) == 1 else args.sheet
+
+    collisions = colliding_inputs(files, sheet_name, args.output_dir, args.format, args.state_dir)
+    if collisions:
+        print("These workbooks have the same filename, and their results would overwrite each other:")
+        for group in collisions:
+            print("       " + ", ".join(group))
+        print("Rename them, or process them in separate runs with different --output-dir and --state-dir folders.")
+        return 1
+
+    if args.output_dir:
+        os.makedirs(args.output_dir, exist_ok=True)
+
+    options = dict(
+        already_translated=args.already_translated,
+        output_translations=args.save_translations or args.translate_only,
+        translate_only=args.translate_only,
+        add_to=bool(args.add_to),
+        worksheet_to_add=args.add_to,
+        create_new_spreadsheet=not args.no_new_spreadsheet,
+        new_worksheet=args.new_worksheet,
+        chunk_size=args.chunk_size,
+        use_cache=not args.no_cache,
+        output_format=args.format,
+        backend=args.backend,
+        rollups=args.rollups,
+    )
+
+    print(f"Processing {len(files)} file(s) with {args.workers} worker(s)...")
+    batch_start = time.perf_counter()
+    failures = []
+
+    with ProcessPoolExecutor(
+        max_workers=args.workers,
+        initializer=init_worker,
+        initargs=(args.translation, not args.no_cache),
+    ) as executor:
+        futures = {
+            executor.submit(
+                process_file,
+                file,
+                sheet_name,
+                dict(
+                    options,
+                    new_filename=output_path(file, args.output_dir, args.format),
+                    state_file=state_path(file, sheet_name, args.state_dir),
+                ),
+                output_path(file, args.output_dir, "run.json") if args.run_report else None,
+            ): file
+            for file in files
+        }
+        # Report each file as soon as it is done, without stopping the batch on failures
+        for future in as_completed(futures):
+            file = futures[future]
+            try:
+                elapsed, error, untranslated, summary = future.result()
+            except Exception as e:
+                # Worker process died or the translation source could not be parsed
+                elapsed, error, untranslated, summary = 0.0, f"{type(e).__name__}: {e}", {}, None
+            if error:
+                failures.append(file)
+                print(f"FAILED {file} ({elapsed:.2f}s): {error}")
+            else:
+                print(f"OK     {file} ({elapsed:.2f}s)")
+            print_untranslated(untranslated)
+            if summary:
+                print("       " + summary.replace("\n", "\n       "))
+
+    print(
+        f"Processed {len(files) - len(failures)}/{len(files)} file(s) "
+        f"in {time.perf_counter() - batch_start:.2f}s"
+    )
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
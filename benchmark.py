@@ -0,0 +1,175 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import numpy as np
+import openpyxl
+import pandas as pd
+from dtypes import memory_usage_mb
+from excel_io import excel_engine, list_worksheets, write_dataframe
+from generate_sample_data import generate_sample_data
+from monthly_sales_calculations import (
+    backends,
+    dtype_plan,
+    get_backend,
+    hourly_and_postpaid_sales,
+    parse_translations,
+    read_worksheet,
+)
+
+# Stages of total_sales which are timed, in the order they run
+stages = [
+    "parse_translations",
+    "read",
+    "read_with_dtype_plan",
+    "translate_spreadsheet_data",
+    "hourly_and_postpaid_sales",
+    "write",
+]
+
+
+def time_stage(function, *args, repeat=1):
+    """
+    Run a function `repeat` times, returning its fastest time in seconds and its result
+    """
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return best, result
+
+
+def read_data_worksheets(file_path, plan=None):
+    """
+    Read every data worksheet of a generated spreadsheet (large datasets are split over several worksheets)
+    """
+    sheets = [name for name, _, _ in list_worksheets(file_path) if name.startswith("Data")]
+    worksheets = [read_worksheet(file_path, sheet, use_cache=False, plan=plan) for sheet in sheets]
+    if len(worksheets) == 1:
+        return worksheets[0]
+    return pd.concat(worksheets, ignore_index=True)
+
+
+def benchmark_dataset(file_path, translation_file, repeat=1, backend="pandas"):
+    """
+    Time each stage of the report pipeline on a generated spreadsheet, translating and calculating with `backend`
+    """
+    backend = get_backend(backend)
+    timings = {}
+
+    timings["parse_translations"], translations = time_stage(
+        parse_translations, translation_file, False, repeat=repeat
+    )
+    # Read as pandas would by default, and with the compact dtypes used by total_sales
+    timings["read"], default_df = time_stage(read_data_worksheets, file_path, repeat=repeat)
+    timings["read_with_dtype_plan"], raw_df = time_stage(
+        read_data_worksheets, file_path, dtype_plan(translations), repeat=repeat
+    )
+    memory = {"default_mb": memory_usage_mb(default_df), "dtype_plan_mb": memory_usage_mb(raw_df)}
+    del default_df
+    # Translation without the read, which is timed separately
+    timings["translate_spreadsheet_data"], sales_df = time_stage(
+        backend.translate, raw_df, translations, repeat=repeat
+    )
+    timings["hourly_and_postpaid_sales"], output = time_stage(
+        hourly_and_postpaid_sales, sales_df, translations, backend, repeat=repeat
+    )
+
+    with tempfile.TemporaryDirectory() as folder:
+        timings["write"], _ = time_stage(
+            write_dataframe, output, os.path.join(folder, "Result.xlsx"), repeat=repeat
+        )
+
+    return {
+        "rows": len(raw_df),
+        "resources": len(output),
+        "excel_engine": excel_engine(file_path),
+        "seconds": timings,
+        "memory": memory,
+    }
+
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pd.__version__,
+        "numpy": np.__version__,
+        "openpyxl": openpyxl.__version__,
+    }
+
+
+def find_regressions(results, baseline, threshold=0.2, min_seconds=0.05):
+    """
+    List the stages which are more than `threshold` (as a fraction) slower than in the baseline
+
+    Stages faster than `min_seconds` in the baseline are skipped as their timings are mostly noise
+    """
+    regressions = []
+    for rows, result in results["datasets"].items():
+        baseline_result = baseline.get("datasets", {}).get(rows)
+        if not baseline_result:
+            continue
+        for stage, seconds in result["seconds"].items():
+            baseline_seconds = baseline_result["seconds"].get(stage)
+            if baseline_seconds is None or baseline_seconds < min_seconds:
+                continue
+            if seconds > baseline_seconds * (1 + threshold):
+                regressions.append((rows, stage, baseline_seconds, seconds))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time each stage of the report pipeline on generated billing data.")
+    parser.add_argument("-r", "--rows", type=int, nargs="+", default=[10000], help="Dataset sizes to benchmark (default: 10000)")
+    parser.add_argument("-d", "--data-dir", default="sample_data", help="Folder of generated spreadsheets, missing datasets are generated (default: sample_data)")
+    parser.add_argument("--repeat", type=int, default=3, help="Run each stage this many times and keep the fastest (default: 3)")
+    parser.add_argument("-o", "--output", default="benchmark_results.json", help="File to save results in (default: benchmark_results.json)")
+    parser.add_argument("-b", "--baseline", help="Results of an earlier run to compare against")
+    parser.add_argument("--backend", default="pandas", choices=backends, help="Library which translates and calculates the report, compare against a baseline of the other backend to see which is faster (default: pandas)")
+    parser.add_argument("--threshold", type=float, default=0.2, help="Flag stages more than this fraction slower than the baseline (default: 0.2)")
+    args = parser.parse_args(argv)
+
+    translation_file = os.path.join(args.data_dir, "Language Translation.xlsx")
+    results = {"environment": environment(), "backend": args.backend, "datasets": {}}
+
+    for rows in args.rows:
+        file_path = os.path.join(args.data_dir, f"billing_{rows}_zh.xlsx")
+        if not os.path.exists(file_path) or not os.path.exists(translation_file):
+            print(f"Generating {rows:,} rows...")
+            generate_sample_data(rows, args.data_dir)
+
+        print(f"Benchmarking {rows:,} rows with the {args.backend} backend...")
+        result = benchmark_dataset(file_path, translation_file, args.repeat, args.backend)
+        results["datasets"][str(rows)] = result
+        for stage in stages:
+            print(f"    {stage:<28}{result['seconds'][stage]:>10.3f}s")
+        print(
+            f"    {'raw data memory':<28}{result['memory']['default_mb']:>10.1f} MB"
+            f" -> {result['memory']['dtype_plan_mb']:.1f} MB with the dtype plan"
+        )
+
+    with open(args.output, "w") as file:
+        json.dump(results, file, indent=2)
+    print(f"Saved results to {args.output}")
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            baseline = json.load(file)
+        regressions = find_regressions(results, baseline, args.threshold)
+        for rows, stage, baseline_seconds, seconds in regressions:
+            print(f"REGRESSION {int(rows):,} rows, {stage}: {baseline_seconds:.3f}s -> {seconds:.3f}s")
+        if regressions:
+            return 1
+        print("No regressions against the baseline.")
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
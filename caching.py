@@ -0,0 +1,358 @@
+import argparse
+import hashlib
+import os
+import pickle
+import shutil
+import tempfile
+import threading
+from collections import OrderedDict
+import pandas as pd
+
+# Folder to keep cached files in, can be changed with the SALES_REPORT_CACHE_DIR environment variable
+default_cache_dir = os.path.join(os.path.expanduser("~"), ".cache", "monthly_sales_report_generator")
+
+# Maximum size of the worksheet cache, can be changed with the SALES_REPORT_CACHE_SIZE_MB environment variable
+default_worksheet_cache_size_mb = 2048
+
+# Changed whenever worksheets are parsed differently, so that entries parsed by older versions are not used
+worksheet_cache_version = 3
+
+
+def cache_dir(*subfolders):
+    """
+    Get (and create if needed) the cache folder
+    """
+    folder = os.path.join(os.environ.get("SALES_REPORT_CACHE_DIR", default_cache_dir), *subfolders)
+    os.makedirs(folder, exist_ok=True)
+    return folder
+
+
+def file_hash(file_path, chunk_size=1024 * 1024):
+    """
+    SHA-256 hash of a file's contents
+    """
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as file:
+        for chunk in iter(lambda: file.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def file_signature(file_path):
+    """
+    Size and modification time of a file, None if it no longer exists
+    """
+    try:
+        stat = os.stat(file_path)
+    except OSError:
+        return None
+    return stat.st_size, stat.st_mtime_ns
+
+
+def atomic_write_bytes(file_path, data):
+    """
+    Write to a temporary file in the same folder and rename it, so readers never see a partially written file
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(file_path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(data)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def load_cached_translations(file_path, parse):
+    """
+    Load translations compiled from the translation source on a previous run
+
+    The cache entry is keyed by the absolute path of the source. It is used directly if the source's
+    modification time and size are unchanged, and otherwise only if the content hash still matches.
+    If the source has changed, `parse` is called to rebuild the translations and the cache is updated.
+    """
+    file_path = os.path.abspath(file_path)
+    stat = os.stat(file_path)
+
+    try:
+        entry_path = os.path.join(
+            cache_dir("translations"),
+            hashlib.sha256(file_path.encode("utf-8")).hexdigest() + ".pickle",
+        )
+    except OSError:
+        # Cache folder cannot be created, parse without caching
+        return parse(file_path)
+
+    entry = None
+    try:
+        with open(entry_path, "rb") as file:
+            entry = pickle.load(file)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        pass
+
+    # Fast path, source file is untouched since it was cached
+    if entry and entry["mtime_ns"] == stat.st_mtime_ns and entry["size"] == stat.st_size:
+        return entry["translations"]
+
+    content_hash = file_hash(file_path)
+    if entry and entry["sha256"] == content_hash:
+        translations = entry["translations"]
+    else:
+        translations = parse(file_path)
+
+    try:
+        atomic_write_bytes(
+            entry_path,
+            pickle.dumps(
+                {
+                    "path": file_path,
+                    "mtime_ns": stat.st_mtime_ns,
+                    "size": stat.st_size,
+                    "sha256": content_hash,
+                    "translations": translations,
+                },
+                protocol=pickle.HIGHEST_PROTOCOL,
+            ),
+        )
+    except OSError as e:
+        print(f"Unable to cache translations: {e}")
+
+    return translations
+
+
+def worksheet_cache_size():
+    """
+    Maximum size of the worksheet cache in bytes
+    """
+    return int(os.environ.get("SALES_REPORT_CACHE_SIZE_MB", default_worksheet_cache_size_mb)) * 1024 * 1024
+
+
+def load_cached_worksheet(file_path, sheet_name, read, content_hash=None):
+    """
+    Load a parsed worksheet from the worksheet cache
+
+    The cache entry is keyed by the content hash of the spreadsheet (which can be passed in as `content_hash`
+    when several worksheets of the same spreadsheet are loaded) and the worksheet name. If there is no entry,
+    `read` is called to parse the worksheet and the result is saved as a Feather file (or a pickle when pyarrow
+    is not installed or the data cannot be stored as Feather). The least recently used entries are removed once
+    the cache is larger than `worksheet_cache_size()`.
+    """
+    try:
+        folder = cache_dir("worksheets")
+    except OSError:
+        # Cache folder cannot be created, read without caching
+        return read(file_path, sheet_name)
+
+    key = hashlib.sha256(
+        f"{worksheet_cache_version}\0{content_hash or file_hash(file_path)}\0{sheet_name}".encode("utf-8")
+    ).hexdigest()
+
+    for extension, load in ((".feather", pd.read_feather), (".pickle", pd.read_pickle)):
+        entry_path = os.path.join(folder, key + extension)
+        if os.path.exists(entry_path):
+            try:
+                df = load(entry_path)
+            except Exception as e:
+                print(f"Unable to read cached worksheet, reading spreadsheet instead: {e}")
+                break
+            # Mark entry as recently used
+            os.utime(entry_path)
+            return df
+
+    df = read(file_path, sheet_name)
+
+    try:
+        save_cached_worksheet(df, os.path.join(folder, key))
+        evict_worksheet_cache(folder, worksheet_cache_size())
+    except OSError as e:
+        print(f"Unable to cache worksheet: {e}")
+
+    return df
+
+
+def save_cached_worksheet(df, entry_path):
+    """
+    Save a worksheet to the cache as Feather, falling back to a pickle
+    """
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(entry_path), suffix=".tmp")
+    os.close(fd)
+    try:
+        try:
+            df.to_feather(temp_path)
+            extension = ".feather"
+        except Exception:
+            # pyarrow is not installed, or columns have mixed types or non-string names
+            df.to_pickle(temp_path, compression=None)
+            extension = ".pickle"
+        os.replace(temp_path, entry_path + extension)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def evict_worksheet_cache(folder, max_size):
+    """
+    Remove least recently used worksheets until the cache is no larger than `max_size` bytes
+    """
+    entries = []
+    for entry in os.scandir(folder):
+        if entry.is_file() and not entry.name.endswith(".tmp"):
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total_size <= max_size:
+            break
+        os.remove(path)
+        total_size -= size
+
+
+def value_size(value):
+    """
+    Approximate memory used by a cached value in bytes
+    """
+    if isinstance(value, pd.DataFrame):
+        return int(value.memory_usage(deep=True).sum())
+    return len(pickle.dumps(value))
+
+
+class MemoryCache:
+    """
+    Keeps parsed worksheets and translations in memory between runs in the same process, removing the least
+    recently used values once they use more than `max_size_mb`
+
+    Each value is stored with the size and modification time of the file it was read from, and is only
+    used while the file is unchanged. Values are shared between runs, so they must not be changed in place.
+    A value being read by one thread is not read again by others, which wait for it instead.
+    """
+    def __init__(self, max_size_mb=1024):
+        self.max_size = int(max_size_mb * 1024 * 1024)
+        self.size = 0
+        self.hits = 0
+        self.misses = 0
+        self.entries = OrderedDict()
+        self.loading = {}
+        self.lock = threading.Lock()
+
+    def get(self, key, file_path):
+        """
+        Get a value read from `file_path`, None if it is not cached or the file has changed since
+        """
+        signature = file_signature(file_path)
+        with self.lock:
+            return self.cached(key, signature)
+
+    def cached(self, key, signature):
+        entry = self.entries.get(key)
+        if entry is None or entry[0] != signature:
+            self.misses += 1
+            return None
+        self.entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, file_path, value, signature=None):
+        """
+        Cache a value read from `file_path`, values larger than the whole cache are not kept
+
+        Pass the file's `signature` from before it was read, so that changes made while reading it are noticed
+        """
+        signature = signature if signature is not None else file_signature(file_path)
+        size = value_size(value)
+        with self.lock:
+            self.remove(key)
+            if size > self.max_size or signature is None:
+                return
+            self.entries[key] = (signature, value, size)
+            self.size += size
+            while self.size > self.max_size:
+                self.remove(next(iter(self.entries)))
+
+    def load(self, key, file_path, read):
+        """
+        Get a value read from `file_path`, calling `read` to read it and caching the result if it is not cached
+
+        If another thread is already reading the value, wait for it. If that thread fails or is cancelled, read it here.
+        """
+        while True:
+            signature = file_signature(file_path)
+            with self.lock:
+                value = self.cached(key, signature)
+                if value is not None:
+                    return value
+                reading = self.loading.get(key)
+                if reading is None:
+                    reading = self.loading[key] = threading.Event()
+                    break
+            reading.wait()
+
+        try:
+            value = read()
+            self.put(key, file_path, value, signature)
+            return value
+        finally:
+            with self.lock:
+                del self.loading[key]
+            reading.set()
+
+    def remove(self, key):
+        entry = self.entries.pop(key, None)
+        if entry is not None:
+            self.size -= entry[2]
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+            self.size = 0
+
+    def info(self):
+        """
+        Number of values, memory used and hits and misses of the cache
+        """
+        with self.lock:
+            return {
+                "entries": len(self.entries),
+                "size_mb": self.size / 1024 / 1024,
+                "max_size_mb": self.max_size / 1024 / 1024,
+                "hits": self.hits,
+                "misses": self.misses,
+            }
+
+
+def clear_cache():
+    """
+    Remove every cached translation and worksheet
+    """
+    folder = os.environ.get("SALES_REPORT_CACHE_DIR", default_cache_dir)
+    if os.path.isdir(folder):
+        shutil.rmtree(folder)
+
+
+def cache_info():
+    """
+    Number of entries and total size in bytes of each cache
+    """
+    info = {}
+    for name in ["translations", "worksheets"]:
+        folder = os.path.join(os.environ.get("SALES_REPORT_CACHE_DIR", default_cache_dir), name)
+        sizes = [entry.stat().st_size for entry in os.scandir(folder)] if os.path.isdir(folder) else []
+        info[name] = (len(sizes), sum(sizes))
+    return info
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Manage the cache of translations and worksheets.")
+    parser.add_argument("command", choices=["info", "clear"], help="Show the size of the cache or remove everything in it")
+    args = parser.parse_args(argv)
+
+    if args.command == "clear":
+        clear_cache()
+        print("Cache cleared!")
+    else:
+        for name, (count, size) in cache_info().items():
+            print(f"{name}: {count} file(s), {size / 1024 / 1024:.1f} MB")
+
+
+if __name__ == "__main__":
+    main()
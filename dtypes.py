@@ -0,0 +1,156 @@
+import datetime
+import numpy as np
+import pandas as pd
+from pandas.api.types import union_categoricals
+
+# Kinds of columns in a dtype plan
+category = "category" # Text with a few distinct values repeated on many rows
+amount = "amount" # Amounts of money, checked to be numbers
+price = "price" # Prices, values which are not numbers are left blank
+
+# Timestamp formats of billing exports, tried in order when detecting the format of a column.
+# Month first comes before day first, as it does when pandas works out the format
+timestamp_formats = [
+    "%Y-%m-%d %H:%M:%S",
+    "%Y/%m/%d %H:%M:%S",
+    "%Y-%m-%dT%H:%M:%S",
+    "%Y-%m-%d %H:%M",
+    "%Y/%m/%d %H:%M",
+    "%Y年%m月%d日 %H:%M:%S",
+    "%m/%d/%Y %H:%M:%S",
+    "%d/%m/%Y %H:%M:%S",
+    "%Y-%m-%d",
+    "%Y/%m/%d",
+]
+
+
+def read_dtypes(plan):
+    """
+    Dtypes which pandas can apply while parsing a worksheet, for the `dtype` argument of `pd.read_excel`
+    """
+    return {col: "category" for col, kind in plan.items() if kind == category}
+
+
+def apply_dtype_plan(df, plan):
+    """
+    Convert the columns of a DataFrame named in the plan to their compact dtype, in place
+
+    Columns which already have their compact dtype are left as they are.
+    Raises ValueError if an amount column holds values which are not numbers.
+    Price columns are only shown in the report, so values which are not numbers do not stop it, they are left blank.
+    """
+    for col, kind in plan.items():
+        if col not in df.columns:
+            continue
+        if kind == category and not isinstance(df[col].dtype, pd.CategoricalDtype):
+            df[col] = df[col].astype("category")
+        elif kind == amount:
+            df[col] = compact_amounts(df[col])
+        elif kind == price:
+            df[col] = compact_amounts(df[col], strict=False)
+    return df
+
+
+def compact_amounts(column, strict=True):
+    """
+    Validate that a column only holds numbers, and store them as float64
+
+    If `strict` is False, values which are not numbers become missing values instead of raising ValueError.
+    Amounts are not stored as float32 even when every value fits, as sums of millions of float32 values lose cents
+    """
+    if column.dtype == np.float64:
+        return column
+
+    values = pd.to_numeric(column, errors="coerce")
+    invalid = values.isna() & column.notna()
+    if strict and invalid.any():
+        examples = ", ".join(map(str, column[invalid].unique()[:5]))
+        raise ValueError(f"Column {column.name} should only hold numbers, but has {examples}")
+
+    return values.astype("float64")
+
+
+def concat_chunks(chunks):
+    """
+    Concatenate chunks of rows of the same worksheet, keeping categorical columns categorical
+    by merging the categories found in each chunk
+
+    Merged categories are sorted, as they are when the worksheet is read whole, so grouped rows come out in the same order
+    """
+    df = pd.concat(chunks, ignore_index=True)
+    for col in chunks[0].columns:
+        if all(isinstance(chunk[col].dtype, pd.CategoricalDtype) for chunk in chunks) and len(chunks) > 1:
+            df[col] = union_categoricals([chunk[col] for chunk in chunks], sort_categories=True)
+    return df
+
+
+def memory_usage_mb(df):
+    """
+    Memory used by a DataFrame including the text it holds, in MB
+    """
+    return df.memory_usage(deep=True).sum() / 1024 / 1024
+
+
+def detect_timestamp_format(values, sample_size=20):
+    """
+    Find the first known timestamp format which matches every string in the values,
+    None if there are no strings or no format matches them all
+
+    Formats are first tried on a sample spread over the strings, and only those matching it are checked against every string
+    """
+    strings = [value for value in values if isinstance(value, str)]
+    if not strings:
+        return None
+    sample = strings[::max(1, len(strings) // sample_size)]
+
+    for timestamp_format in timestamp_formats:
+        try:
+            for value in sample:
+                datetime.datetime.strptime(value, timestamp_format)
+        except ValueError:
+            continue
+        if pd.to_datetime(pd.Series(strings), format=timestamp_format, errors="coerce").notna().all():
+            return timestamp_format
+    return None
+
+
+def parse_timestamps(column, timestamp_formats=None):
+    """
+    Parse a column of timestamps, parsing each distinct value only once
+
+    Strings are parsed with the known format matching all of them. Otherwise (unknown formats, or exports mixing
+    several formats) they are parsed by pandas as before, working out the format of each one if there is no single format.
+    Columns which are already datetimes are returned as they are.
+
+    Chunks of rows of the same worksheet should share a `timestamp_formats` dictionary. The format detected in the
+    first chunk is kept in it by column name and used for the chunks after it, so that a chunk with only ambiguous
+    dates (such as 01/02/2024) is read the same way as the rest of the worksheet.
+    """
+    if pd.api.types.is_datetime64_any_dtype(column):
+        return column
+
+    codes, uniques = pd.factorize(column)
+    uniques = pd.Series(np.asarray(uniques, dtype=object))
+
+    if timestamp_formats is not None and column.name in timestamp_formats:
+        timestamp_format = timestamp_formats[column.name]
+    else:
+        timestamp_format = detect_timestamp_format(uniques)
+        if timestamp_formats is not None and timestamp_format:
+            timestamp_formats[column.name] = timestamp_format
+    if timestamp_format:
+        parsed = pd.to_datetime(uniques, format=timestamp_format, errors="coerce")
+        # Values which are not strings (such as dates read from Excel cells), or which do not match the format
+        # detected in an earlier chunk
+        unparsed = parsed.isna() & uniques.notna()
+        if unparsed.any():
+            parsed[unparsed] = pd.to_datetime(uniques[unparsed], format="mixed")
+    else:
+        try:
+            parsed = pd.to_datetime(uniques)
+        except ValueError:
+            parsed = pd.to_datetime(uniques, format="mixed")
+
+    # Missing values have code -1, which picks the NaT added at the end
+    values = np.append(parsed.to_numpy(), np.datetime64("NaT")).take(codes)
+    return pd.Series(values, index=column.index, name=column.name)
@@ -1,10 +1,25 @@
 import sys
-import openpyxl
 import os
-from monthly_sales_calculations import total_sales
 import styles
-from helpers import LoadingScreen, FileProcessor
-from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QPushButton, QFileDialog, QVBoxLayout, QComboBox, QCheckBox, QMessageBox
+from helpers import FileProcessor, JobQueuePanel, TranslationSourceFinder, ModuleLoader
+from job_queue import JobQueue
+from PyQt5.QtCore import QSettings, QTimer
+from PyQt5.QtWidgets import QApplication, QWidget, QLabel, QLineEdit, QPushButton, QFileDialog, QVBoxLayout, QComboBox, QCheckBox, QMessageBox, QListWidget, QAbstractItemView
+
+# Time to wait after the selection changes before reading the selected worksheets in the background
+prefetch_delay_ms = 300
+# Reports generated at the same time, each in its own worker process
+report_workers = 2
+
+def list_workbook_worksheets(excel_file):
+    """
+    Get the name, number of rows and number of columns of every worksheet in a spreadsheet
+    """
+    # Waits for the background import if it has not finished yet
+    from excel_io import list_worksheets
+
+    return list_worksheets(excel_file)
+
 
 class ExcelForm(QWidget):
     def __init__(self):
@@ -25,17 +40,27 @@ class ExcelForm(QWidget):
         self.excel_file_button = QPushButton('Browse')
         self.excel_file_button.clicked.connect(self.get_excel_file)
 
-        # Select Worksheet
-        self.worksheet_label = QLabel('Select Worksheet:')
-        self.worksheet_combo = QComboBox()
+        # Select Worksheets, several worksheets can be selected with Ctrl or Shift and are processed together
+        self.worksheet_label = QLabel('Select Worksheet(s):')
+        self.worksheet_list = QListWidget()
+        self.worksheet_list.setSelectionMode(QAbstractItemView.ExtendedSelection)
+        self.worksheet_list.setMaximumHeight(100)
+        self.worksheet_list.itemSelectionChanged.connect(self.show_worksheet_size)
+        self.worksheet_list.itemSelectionChanged.connect(self.schedule_prefetch)
+
+        # Number of rows and columns of the selected worksheet
+        self.worksheet_sizes = {}
+        self.worksheet_size_label = QLabel('')
+
+        # Progress of reading the selected worksheets in the background before Submit is pressed
+        self.prefetch_label = QLabel('')
 
         # Translation Source File
         self.translation_source_label = QLabel('Select Translation Source Excel File:')
-        # Search for translation source and autofill if possible
-        search_results = ExcelForm.autofill_translation_source()
-        self.translation_source_edit = QLineEdit(search_results if search_results else '')
+        self.translation_source_edit = QLineEdit()
         self.translation_source_button = QPushButton('Browse')
         self.translation_source_button.clicked.connect(self.get_translation_source)
+        self.translation_source_edit.textChanged.connect(self.schedule_prefetch)
 
         # Option to specify if raw data is already translated
         self.already_translated_checkbox = QCheckBox('Raw Data in English')
@@ -48,6 +73,15 @@ class ExcelForm(QWidget):
         self.translate_only_checkbox = QCheckBox('Translate Raw Data Only')
         self.translate_only_checkbox.stateChanged.connect(self.toggle_translate_only)
 
+        # File format of the new spreadsheet and the translated raw data
+        # The other formats are added once the calculation engine has been loaded
+        self.output_format_label = QLabel('Output File Format:')
+        self.output_format_combo = QComboBox()
+        self.output_format_combo.addItem('xlsx')
+
+        # Option to also save totals and subtotals of the report
+        self.rollups_checkbox = QCheckBox('Save Totals by Project, Region, Type and Billing Method')
+
         self.output_method_label = QLabel('Select Output Method Below:')
 
         # Option to add the data into the existing spreadsheet
@@ -90,8 +124,36 @@ class ExcelForm(QWidget):
         # Set default value for Worksheet to Add
         self.worksheet_to_add_edit.setText('Monthly Sales Calculations')
 
-        # Loading screen
-        self.loading_screen = LoadingScreen()
+        # Reports are queued and generated in worker processes, so more can be submitted while they run
+        self.job_queue = JobQueue(min(report_workers, os.cpu_count() or 1))
+        self.jobs_label = QLabel('Reports:')
+        self.job_panel = JobQueuePanel(self.job_queue)
+
+        # Worksheet names of the selected file are read in the background
+        self.worksheet_lister = None
+        self.stale_worksheet_listers = []
+
+        # Selected worksheets are read in the background into the worksheet cache, which the report then reads from.
+        # Reading starts once the calculation engine has been loaded
+        self.engine_ready = False
+        self.prefetcher = None
+        self.prefetch_job = None
+        self.stale_prefetchers = []
+        # Wait for the selection to settle, so that going through the list does not start a read for every worksheet
+        self.prefetch_timer = QTimer(self)
+        self.prefetch_timer.setSingleShot(True)
+        self.prefetch_timer.setInterval(prefetch_delay_ms)
+        self.prefetch_timer.timeout.connect(self.start_prefetch)
+
+        # Search for translation source and autofill if possible
+        self.settings = QSettings('Scloud', 'Monthly Sales Report Generator')
+        self.translation_source_finder = None
+        self.autofill_translation_source()
+
+        # Import pandas, openpyxl and the calculations in the background so the window shows up straight away
+        self.engine_loader = ModuleLoader('monthly_sales_calculations')
+        self.engine_loader.loaded.connect(self.engine_loaded)
+        self.engine_loader.start()
 
         layout = QVBoxLayout()
         layout.addWidget(self.excel_file_label)
@@ -99,7 +161,9 @@ class ExcelForm(QWidget):
         layout.addWidget(self.excel_file_button)
 
         layout.addWidget(self.worksheet_label)
-        layout.addWidget(self.worksheet_combo)
+        layout.addWidget(self.worksheet_list)
+        layout.addWidget(self.worksheet_size_label)
+        layout.addWidget(self.prefetch_label)
 
         layout.addWidget(self.translation_source_label)
         layout.addWidget(self.translation_source_edit)
@@ -109,6 +173,10 @@ class ExcelForm(QWidget):
         layout.addWidget(self.save_translations_checkbox)
         layout.addWidget(self.translate_only_checkbox)
 
+        layout.addWidget(self.output_format_label)
+        layout.addWidget(self.output_format_combo)
+        layout.addWidget(self.rollups_checkbox)
+
         layout.addWidget(self.output_method_label)
 
         layout.addWidget(self.add_to_existing_checkbox)
@@ -130,8 +198,22 @@ class ExcelForm(QWidget):
 
         layout.addWidget(self.submit_button)
 
+        layout.addWidget(self.jobs_label)
+        layout.addWidget(self.job_panel)
+
         self.setLayout(layout)
     
+    def engine_loaded(self):
+        from excel_io import output_formats
+
+        for output_format in output_formats:
+            if self.output_format_combo.findText(output_format) < 0:
+                self.output_format_combo.addItem(output_format)
+
+        self.engine_ready = True
+        # Worksheets may have been selected while the engine was loading
+        self.schedule_prefetch()
+
     def toggle_translate_only(self, state):
         if state == 2:  # Checked
             # Disable already translated field
@@ -184,35 +266,38 @@ class ExcelForm(QWidget):
             selected_file = file_dialog.selectedFiles()[0]
             self.excel_file_edit.setText(selected_file)
 
-            # Processor for loading worksheets into the combo box
-            self.worksheet_processor = FileProcessor(self.load_worksheets, selected_file)
-
-            # Temporarily disable submit button
-            self.submit_button.setEnabled(False)
-
-            # Show loading screen before starting processing and start processor
-            self.loading_screen.show()
-            self.worksheet_processor.start()
-
-            # After processor is finished, close loading screen
-            self.worksheet_processor.finished.connect(self.loading_screen.close)
+            # Worksheet names are read in the background, as files which are not xlsx/xlsm are opened whole
+            self.load_worksheets(selected_file)
 
             # Autofill output location field with path for folder of the selected file
             self.output_location_edit.setText(os.path.dirname(selected_file))
 
-    @classmethod
-    def autofill_translation_source(cls):
+    def autofill_translation_source(self):
         """
-        Look in the present working directory for the translation file
+        Fill in the translation file used last time if it still exists,
+        else look in the present working directory for the translation file in the background
         """
-        # Get list of files in all the directory and subdirectory
-        for root, dirs, files in os.walk(os.getcwd()):
-            for file in files:
-                # Return file path if a matching file is found
-                if "language translation" in file.lower():
-                    return os.path.join(root, file)
-        # Else return None at the end
-        return None
+        last_translation_source = self.settings.value('translation_source', '', type=str)
+        if last_translation_source and os.path.isfile(last_translation_source):
+            self.translation_source_edit.setText(last_translation_source)
+            return
+
+        # A search is already running and will fill in the field when done
+        if self.translation_source_finder and self.translation_source_finder.isRunning():
+            return
+
+        self.translation_source_finder = TranslationSourceFinder(os.getcwd())
+        self.translation_source_finder.found.connect(self.set_found_translation_source)
+        self.translation_source_finder.start()
+
+    def set_found_translation_source(self, file_path):
+        # Do not replace a file the user has already selected
+        if not self.translation_source_edit.text():
+            self.translation_source_edit.setText(file_path)
+        self.remember_translation_source(file_path)
+
+    def remember_translation_source(self, file_path):
+        self.settings.setValue('translation_source', os.path.abspath(file_path))
     
     def get_translation_source(self):
         file_dialog = QFileDialog()
@@ -221,22 +306,114 @@ class ExcelForm(QWidget):
         if file_dialog.exec_():
             selected_file = file_dialog.selectedFiles()[0]
             self.translation_source_edit.setText(selected_file)
+            self.remember_translation_source(selected_file)
 
     def load_worksheets(self, excel_file):
-        self.worksheet_combo.clear()
-
-        print("Loading worksheets...")
-
-        try:
-            workbook = openpyxl.load_workbook(excel_file, read_only=True)
-            self.worksheet_combo.addItems(workbook.sheetnames)
-        except Exception as e:
-            print(f"Error loading worksheets: {e}")
+        self.worksheet_list.clear()
+        self.worksheet_sizes = {}
+        self.worksheet_size_label.setText('Reading worksheet names...')
+
+        # Keep threads listing worksheets of previously selected files until they have stopped
+        self.stale_worksheet_listers = [lister for lister in self.stale_worksheet_listers if lister.isRunning()]
+        if self.worksheet_lister and self.worksheet_lister.isRunning():
+            self.stale_worksheet_listers.append(self.worksheet_lister)
+        self.worksheet_lister = FileProcessor(list_workbook_worksheets, excel_file)
+        self.worksheet_lister.finished.connect(self.show_worksheets)
+        self.worksheet_lister.failed.connect(self.show_worksheets_error)
+        self.worksheet_lister.start()
+
+    def show_worksheets(self):
+        # Only show the worksheets of the file which is still selected
+        if self.sender() is not self.worksheet_lister:
+            return
+        worksheets = self.worksheet_lister.result
+        self.worksheet_size_label.setText('')
+
+        # Keep the size of each worksheet to show it when the worksheet is selected
+        for name, rows, cols in worksheets:
+            self.worksheet_sizes[name] = (rows, cols)
+        self.worksheet_list.addItems([name for name, _, _ in worksheets])
+        # Select the first worksheet by default
+        if self.worksheet_list.count():
+            self.worksheet_list.setCurrentRow(0)
+
+    def show_worksheets_error(self, error):
+        if self.sender() is not self.worksheet_lister:
+            return
+        print(f"Error loading worksheets: {error}")
+        self.worksheet_size_label.setText('')
+
+    def selected_worksheets(self):
+        # Selected worksheets in the order they appear in the spreadsheet
+        return [
+            self.worksheet_list.item(row).text()
+            for row in range(self.worksheet_list.count())
+            if self.worksheet_list.item(row).isSelected()
+        ]
+
+    def show_worksheet_size(self):
+        sizes = [self.worksheet_sizes.get(name, (None, None)) for name in self.selected_worksheets()]
+        if not sizes or any(rows is None for rows, _ in sizes):
+            self.worksheet_size_label.setText('')
+        elif len(sizes) == 1:
+            rows, cols = sizes[0]
+            self.worksheet_size_label.setText(f'{rows:,} rows x {cols:,} columns')
+        else:
+            total_rows = sum(rows for rows, _ in sizes)
+            self.worksheet_size_label.setText(f'{len(sizes)} worksheets, {total_rows:,} rows in total')
+
+    def schedule_prefetch(self):
+        # The selection has changed, so a read of the previous selection is no longer needed
+        self.cancel_prefetch()
+        self.prefetch_timer.start()
+
+    def cancel_prefetch(self):
+        self.prefetch_timer.stop()
+        if self.prefetcher and self.prefetcher.isRunning():
+            self.prefetcher.cancel()
+            # Keep the thread until it has stopped
+            self.stale_prefetchers.append(self.prefetcher)
+        self.prefetcher = None
+        self.prefetch_job = None
+        self.prefetch_label.setText('')
+
+    def start_prefetch(self):
+        """
+        Read the selected worksheets in the background, so that they are already in memory when Submit is pressed
+        """
+        excel_file = self.excel_file_edit.text()
+        worksheets = self.selected_worksheets()
+        translation_source = self.translation_source_edit.text()
+        if not self.engine_ready or not worksheets:
+            return
+        if not os.path.isfile(excel_file) or not os.path.isfile(translation_source):
+            return
 
-        print("Worksheets loaded!")
+        from monthly_sales_calculations import prefetch_worksheets
 
-        # Re-enable submit button after processor is finished
-        self.submit_button.setEnabled(True)
+        self.stale_prefetchers = [prefetcher for prefetcher in self.stale_prefetchers if prefetcher.isRunning()]
+        self.prefetch_job = (excel_file, worksheets, translation_source)
+        self.prefetcher = FileProcessor(
+            prefetch_worksheets,
+            excel_file,
+            worksheets,
+            translation_source,
+            track_progress=True,
+        )
+        self.prefetcher.progress.connect(self.show_prefetch_progress)
+        self.prefetcher.finished.connect(lambda: self.prefetch_label.setText('Worksheet read, ready to submit'))
+        self.prefetcher.failed.connect(lambda error: self.prefetch_label.setText(''))
+        self.prefetch_label.setText('Reading worksheet in the background...')
+        self.prefetcher.start()
+
+    def show_prefetch_progress(self, stage, rows_done, rows_total):
+        # Only show progress of the prefetch which is still wanted
+        if self.sender() is not self.prefetcher or stage != "read":
+            return
+        if rows_total > 0:
+            self.prefetch_label.setText(f'Reading worksheet in the background... {rows_done:,} / {rows_total:,} rows')
+        else:
+            self.prefetch_label.setText(f'Reading worksheet in the background... {rows_done:,} rows')
 
     def toggle_add_to_existing(self, state):
         self.worksheet_to_add_edit.setEnabled(state == 2)  # 2 is checked, 0 is unchecked
@@ -255,13 +432,18 @@ class ExcelForm(QWidget):
             self.output_location_edit.setText(selected_folder)
 
     def submit_form(self):
+        from monthly_sales_calculations import output_paths
+
         excel_file = self.excel_file_edit.text()
-        worksheet_name = self.worksheet_combo.currentText()
+        # A single worksheet is processed on its own, several are processed together into one output
+        worksheets = self.selected_worksheets()
+        worksheet_name = worksheets[0] if len(worksheets) == 1 else worksheets
         translation_source = self.translation_source_edit.text()
 
         already_translated = self.already_translated_checkbox.isChecked()
         save_translations = self.save_translations_checkbox.isChecked()
         translate_only = self.translate_only_checkbox.isChecked()
+        output_format = self.output_format_combo.currentText()
 
         add_to_existing = self.add_to_existing_checkbox.isChecked()
         worksheet_to_add = self.worksheet_to_add_edit.text() if add_to_existing else None
@@ -288,42 +470,44 @@ class ExcelForm(QWidget):
             self.show_message("Missing Fields", "If 'Add to Existing Spreadsheet' is checked, 'Worksheet to Add' field cannot be blank.")
             return
 
-        # Add xlsx extension to new filename if not present
-        if new_filename and not new_filename.endswith(".xlsx"):
-            new_filename += ".xlsx"
-
-        print("Generating Report...")
-        
-        # Disable submit button temporarily
-        self.submit_button.setEnabled(False)
-
-        # Save variables needed for running calculations
-        myvariables = (
-            excel_file,
-            worksheet_name,
-            translation_source,
-            already_translated,
-            save_translations,
-            translate_only,
-            add_to_existing,
-            worksheet_to_add,
-            create_new_spreadsheet,
-            os.path.join(output_location, new_filename) if new_filename else "",
-            new_worksheet_name,
+        # Replace the extension of the new filename with the one of the output format, "Result.xlsx" becomes "Result.csv"
+        if new_filename and not new_filename.endswith("." + output_format):
+            new_filename = os.path.splitext(new_filename)[0] + "." + output_format
+
+        # A prefetch of other worksheets or translations is no longer needed.
+        # A prefetch of these worksheets keeps running and the report waits for it instead of reading them again
+        prefetching = self.prefetch_job == (excel_file, worksheets, translation_source)
+        if not prefetching:
+            self.cancel_prefetch()
+        self.prefetch_timer.stop()
+
+        # Options of total_sales for the report
+        options = dict(
+            file_path=excel_file,
+            sheet_name=worksheet_name,
+            translation_sheet=translation_source,
+            already_translated=already_translated,
+            output_translations=save_translations,
+            translate_only=translate_only,
+            add_to=add_to_existing,
+            worksheet_to_add=worksheet_to_add,
+            create_new_spreadsheet=create_new_spreadsheet,
+            new_filename=os.path.join(output_location, new_filename) if new_filename else "",
+            new_worksheet=new_worksheet_name,
+            output_format=output_format,
+            rollups=self.rollups_checkbox.isChecked() and not translate_only,
         )
-        # Create processor for running code
-        self.report_processor = FileProcessor(total_sales, *myvariables)
-
-        # Show loading screen before starting processing
-        self.loading_screen.show()
-        # Start running total sales function
-        self.report_processor.start()
-
-        # Afterwards, close loading screen and show processed message
-        self.report_processor.finished.connect(self.loading_screen.close)
-        self.report_processor.finished.connect(self.show_processed_message)
-        self.report_processor.finished.connect(lambda: print("Report generated!"))
-
+        description = f"{os.path.basename(excel_file)} - {', '.join(worksheets)}"
+        job = self.job_queue.submit(options, description, output_paths(options), hold=prefetching)
+        print(f"Queued report {description}")
+
+        if prefetching:
+            # Start the report once its worksheets have been read, or straight away if reading them stops
+            for signal in (self.prefetcher.finished, self.prefetcher.cancelled, self.prefetcher.failed):
+                signal.connect(lambda *_: self.job_queue.release(job))
+            if not self.prefetcher.isRunning():
+                self.job_queue.release(job)
+        self.job_panel.refresh()
 
     def show_message(self, title, text):
         msg_box = QMessageBox()
@@ -332,49 +516,27 @@ class ExcelForm(QWidget):
         msg_box.setText(text)
         msg_box.exec_()
 
-    def show_processed_message(self):
-        msg_box = QMessageBox()
-        msg_box.setIcon(QMessageBox.Information)
-        msg_box.setWindowTitle("Files Processed")
-        msg_box.setText("Files have been processed!")
-        msg_box.setStandardButtons(QMessageBox.Ok)
-        msg_box.finished.connect(self.clear_fields)
-        msg_box.exec_()
-
-    def clear_fields(self):
-        # Clear all fields
-        self.excel_file_edit.clear()
-        self.worksheet_combo.clear()
-        self.translation_source_edit.clear()
-
-        self.already_translated_checkbox.setChecked(False)
-
-        self.save_translations_checkbox.setEnabled(True)
-        self.save_translations_checkbox.setChecked(False)
-
-        self.translate_only_checkbox.setEnabled(True)
-        self.translate_only_checkbox.setChecked(False)
-
-        self.add_to_existing_checkbox.setEnabled(True)
-        self.add_to_existing_checkbox.setChecked(False)
-        self.worksheet_to_add_edit.clear()
-        self.worksheet_to_add_edit.setEnabled(False)
-        
-        self.create_new_spreadsheet_checkbox.setEnabled(True) 
-        self.create_new_spreadsheet_checkbox.setChecked(True)  # Set back to default state
-        self.new_filename_edit.clear()
-        self.output_location_edit.clear()
-        self.new_worksheet_edit.clear()
-
-        # Set default values for specific fields
-        search_results = ExcelForm.autofill_translation_source()
-        self.translation_source_edit.setText(search_results if search_results else '')
-        self.new_filename_edit.setText('Result.xlsx')
-        self.worksheet_to_add_edit.setText('Monthly Sales Calculation')
-        self.new_worksheet_edit.setText('Sheet1')
-        
-        # Re-enable submit button
-        self.submit_button.setEnabled(True)
+    def closeEvent(self, event):
+        if self.job_queue.running_jobs():
+            answer = QMessageBox.question(
+                self,
+                "Reports Running",
+                "Reports are still being generated. Cancel them and quit?",
+                QMessageBox.Yes | QMessageBox.No,
+            )
+            if answer != QMessageBox.Yes:
+                event.ignore()
+                return
+        self.job_queue.shutdown()
+
+        # Stop reading worksheets in the background before the window is closed
+        self.cancel_prefetch()
+        for prefetcher in self.stale_prefetchers:
+            prefetcher.wait()
+        for lister in self.stale_worksheet_listers + [self.worksheet_lister]:
+            if lister:
+                lister.wait()
+        super().closeEvent(event)
 
 if __name__ == '__main__':
     app = QApplication(sys.argv)
@@ -0,0 +1,818 @@
+import datetime
+import importlib.util
+import itertools
+import os
+import posixpath
+import re
+import shutil
+import struct
+import tempfile
+import threading
+import zipfile
+import xml.etree.ElementTree as ET
+from xml.sax.saxutils import escape
+import openpyxl
+import pandas as pd
+from openpyxl.utils import get_column_letter, range_boundaries
+
+# XML namespaces used in the workbook manifest of xlsx/xlsm files
+main_ns = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+relationships_ns = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+package_relationships_ns = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+# The dimension of a worksheet is stored before its rows
+dimension_pattern = re.compile(rb'<(?:\w+:)?dimension\s+ref="([^"]+)"')
+sheet_data_pattern = re.compile(rb"<(?:\w+:)?sheetData[\s/>]")
+
+# Characters which are not allowed in XML
+illegal_xml_characters = re.compile("[\x00-\x08\x0b\x0c\x0e-\x1f]")
+
+# Characters which are not allowed in worksheet names, and the longest name Excel opens
+illegal_sheet_name_characters = re.compile(r"[\\/?*\[\]:]")
+max_sheet_name_length = 31
+
+worksheet_content_type = "application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"
+worksheet_relationship_type = "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+
+# Engines which read spreadsheets, fastest first. calamine (the python-calamine package) parses worksheets in Rust,
+# about 10 times faster than openpyxl on generated billing data (see reader_benchmark.py), and also reads xls, xlsb and ods files
+reader_engines = ["calamine", "openpyxl"]
+engine_modules = {"calamine": "python_calamine", "openpyxl": "openpyxl"}
+engine_file_types = {
+    "calamine": {".xlsx", ".xlsm", ".xlsb", ".xls", ".ods"},
+    "openpyxl": {".xlsx", ".xlsm"},
+}
+# calamine loads a whole worksheet before returning its first row, taking about 25 times the size of the file in memory.
+# Larger spreadsheets which are read a chunk of rows at a time to bound memory are streamed with openpyxl instead
+calamine_streaming_max_mb = 32
+
+
+def get_worksheet(workbook, sheet_name):
+    """
+    Get a worksheet by name or by 0-based index
+    """
+    if isinstance(sheet_name, int):
+        return workbook.worksheets[sheet_name]
+    return workbook[sheet_name]
+
+
+def installed_engines():
+    """
+    Engines in `reader_engines` whose package is installed, fastest first
+    """
+    return [engine for engine in reader_engines if importlib.util.find_spec(engine_modules[engine]) is not None]
+
+
+def excel_engine(file_path, engine=None, streaming=False):
+    """
+    Engine to read a spreadsheet with: `engine` (or the SALES_REPORT_EXCEL_ENGINE environment variable) if given,
+    else the fastest installed engine which reads the file type
+
+    With `streaming`, rows are read a chunk at a time to bound memory, so engines which load the whole worksheet
+    first are skipped for large files. Returns None if no engine here reads the file type, leaving pandas to pick one.
+    """
+    engine = engine or os.environ.get("SALES_REPORT_EXCEL_ENGINE") or "auto"
+    if engine != "auto":
+        if engine not in reader_engines:
+            raise ValueError(f"Unknown Excel engine {engine}, choose one of auto, {', '.join(reader_engines)}")
+        return engine
+
+    file_type = os.path.splitext(file_path)[1].lower()
+    for candidate in installed_engines():
+        if file_type not in engine_file_types[candidate]:
+            continue
+        if candidate == "calamine" and streaming and os.path.getsize(file_path) > calamine_streaming_max_mb * 1024 * 1024:
+            continue
+        return candidate
+    return None
+
+
+def read_excel(file_path, sheet_name=0, engine=None, **kwargs):
+    """
+    pd.read_excel with the engine chosen by `excel_engine`
+    """
+    return pd.read_excel(file_path, sheet_name=sheet_name, engine=excel_engine(file_path, engine), **kwargs)
+
+
+def open_workbook(file_path, engine="openpyxl"):
+    """
+    Open a spreadsheet with an engine to read its rows with `worksheet_values`, close it with `.close()`
+    """
+    if engine == "calamine":
+        from python_calamine import CalamineWorkbook
+        return CalamineWorkbook.from_path(file_path)
+    return openpyxl.load_workbook(file_path, read_only=True, data_only=True)
+
+
+def worksheet_values(workbook, sheet_name):
+    """
+    Iterate over the rows of a worksheet (by name or by 0-based index) as tuples of values, the same for every engine
+
+    Rows start at the first row and column of the worksheet, with None for empty cells
+    """
+    if isinstance(workbook, openpyxl.Workbook):
+        yield from get_worksheet(workbook, sheet_name).iter_rows(values_only=True)
+        return
+
+    if isinstance(sheet_name, int):
+        sheet = workbook.get_sheet_by_index(sheet_name)
+    else:
+        sheet = workbook.get_sheet_by_name(sheet_name)
+    # calamine leaves out empty columns before the first value, and returns numbers as floats and empty cells as ""
+    leading = (None,) * (sheet.start[1] if sheet.start else 0)
+    for row in sheet.iter_rows():
+        yield leading + tuple(calamine_value(value) for value in row)
+
+
+def calamine_value(value):
+    """
+    Convert a cell value read by calamine to the value openpyxl reads
+    """
+    if type(value) is float:
+        return int(value) if value.is_integer() else value
+    if type(value) is str:
+        return value if value else None
+    if type(value) is datetime.date:
+        return datetime.datetime(value.year, value.month, value.day)
+    return value
+
+
+def list_worksheets(file_path):
+    """
+    Get the name, number of rows and number of columns of every worksheet in a spreadsheet
+
+    For xlsx/xlsm files only the workbook manifest and the start of each worksheet are read from the zip container.
+    Other files (such as xls) are opened with pandas instead, and their sizes are not known (None).
+    """
+    try:
+        return list_zipped_worksheets(file_path)
+    except (zipfile.BadZipFile, KeyError, ET.ParseError):
+        with pd.ExcelFile(file_path, engine=excel_engine(file_path)) as workbook:
+            return [(sheet, None, None) for sheet in workbook.sheet_names]
+
+
+def worksheets_by_name_or_index(file_path, sheet_name):
+    """
+    Worksheets given by name or by 0-based index as text (such as on the command line), for the `sheet_name` of total_sales
+
+    Numbers are only taken as indexes when the spreadsheet has no worksheet with that name, so a worksheet named "2024"
+    is still found by its name. Takes and returns a single worksheet or a list of them.
+    """
+    sheet_names = sheet_name if isinstance(sheet_name, list) else [sheet_name]
+    numbers = [sheet for sheet in sheet_names if isinstance(sheet, str) and sheet.isdigit()]
+    if not numbers:
+        return sheet_name
+
+    existing = {name for name, _, _ in list_worksheets(file_path)}
+    resolved = [int(sheet) if sheet in numbers and sheet not in existing else sheet for sheet in sheet_names]
+    return resolved if isinstance(sheet_name, list) else resolved[0]
+
+
+def list_zipped_worksheets(file_path):
+    """
+    Read worksheet names and dimensions from the workbook manifest inside an xlsx/xlsm file
+    """
+    with zipfile.ZipFile(file_path) as archive:
+        workbook = ET.fromstring(archive.read("xl/workbook.xml"))
+        relationships = ET.fromstring(archive.read("xl/_rels/workbook.xml.rels"))
+
+        # Map relationship ids to the path of each worksheet part
+        targets = {}
+        for relationship in relationships.iter(package_relationships_ns + "Relationship"):
+            target = relationship.get("Target")
+            if target.startswith("/"):
+                targets[relationship.get("Id")] = target.lstrip("/")
+            else:
+                targets[relationship.get("Id")] = posixpath.normpath(posixpath.join("xl", target))
+
+        worksheets = []
+        for sheet in workbook.iter(main_ns + "sheet"):
+            part = targets.get(sheet.get(relationships_ns + "id"))
+            rows, cols = worksheet_dimension(archive, part) if part else (None, None)
+            worksheets.append((sheet.get("name"), rows, cols))
+
+    return worksheets
+
+
+def worksheet_dimension(archive, part, max_bytes=65536):
+    """
+    Get the number of rows and columns of a worksheet from the dimension stored before its rows
+    """
+    try:
+        with archive.open(part) as file:
+            head = b""
+            while len(head) < max_bytes:
+                block = file.read(4096)
+                if not block:
+                    break
+                head += block
+                match = dimension_pattern.search(head)
+                if match:
+                    min_col, min_row, max_col, max_row = range_boundaries(match.group(1).decode())
+                    return max_row - min_row + 1, max_col - min_col + 1
+                # Rows have started without a dimension
+                if sheet_data_pattern.search(head):
+                    break
+    except (KeyError, ValueError, TypeError):
+        pass
+    return None, None
+
+
+def read_excel_chunks(file_path, sheet_name, chunk_size=100000, skip_rows=0, workbook=None, engine=None, streaming=True):
+    """
+    Read a worksheet as DataFrames of at most `chunk_size` rows each, without loading the whole worksheet
+
+    The first row is used as the header. Rows with no values are skipped, as well as the first `skip_rows` rows after the header.
+    An already open `workbook` of the file (see `open_workbook`) can be given to read from, and is left open.
+    Otherwise the engine is chosen by `excel_engine`. Pass `streaming=False` when every row is kept anyway,
+    so that an engine which loads the whole worksheet at once can be used for large files too.
+    """
+    shared = workbook is not None
+    if not shared:
+        workbook = open_workbook(file_path, excel_engine(file_path, engine, streaming) or "openpyxl")
+    try:
+        rows = worksheet_values(workbook, sheet_name)
+
+        header = next(rows, None)
+        if header is None:
+            return
+        # Name blank headers the same way as pandas
+        columns = [
+            col if col is not None else f"Unnamed: {i}"
+            for i, col in enumerate(header)
+        ]
+
+        chunk = []
+        for row in rows:
+            if all(value is None for value in row):
+                continue
+            if skip_rows > 0:
+                skip_rows -= 1
+                continue
+            chunk.append(row)
+            if len(chunk) >= chunk_size:
+                yield pd.DataFrame(chunk, columns=columns)
+                chunk = []
+
+        if chunk:
+            yield pd.DataFrame(chunk, columns=columns)
+    finally:
+        if not shared:
+            workbook.close()
+
+
+class SharedWorkbook:
+    """
+    Read-only workbook which is opened the first time it is needed and shared by threads reading different worksheets
+
+    Only openpyxl workbooks are shared. calamine holds the worksheets it has read in the workbook,
+    so each read opens its own calamine workbook instead.
+    """
+    def __init__(self, file_path, engine=None):
+        self.file_path = file_path
+        self.engine = engine
+        self.workbook = None
+        self.lock = threading.Lock()
+
+    def get(self, streaming=True):
+        """
+        Get the shared openpyxl workbook, None if the file is read with another engine (see `excel_engine`)
+        """
+        if excel_engine(self.file_path, self.engine, streaming) not in (None, "openpyxl"):
+            return None
+        with self.lock:
+            if self.workbook is None:
+                self.workbook = openpyxl.load_workbook(self.file_path, read_only=True, data_only=True)
+            return self.workbook
+
+    def close(self):
+        with self.lock:
+            if self.workbook is not None:
+                self.workbook.close()
+                self.workbook = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def python_rows(df):
+    """
+    Rows of a DataFrame as tuples of Python values, with missing values as None
+    """
+    columns = [
+        df[col].astype(object).where(df[col].notna(), None).tolist()
+        for col in df.columns
+    ]
+    return zip(*columns)
+
+
+class ChunkWriter:
+    """
+    Base class for writers which append DataFrames one after another to a new file
+    """
+    def write(self, df):
+        raise NotImplementedError
+
+    def close(self):
+        raise NotImplementedError
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+
+class ExcelChunkWriter(ChunkWriter):
+    """
+    Write DataFrames one after another into a worksheet of a new spreadsheet
+
+    Rows are streamed to the file, so memory use does not grow with the number of rows written.
+    XlsxWriter is used in constant memory mode if it is installed, else openpyxl in write-only mode.
+    Further worksheets can be started with `add_worksheet`.
+    """
+    def __init__(self, file_path, sheet_name="Sheet1"):
+        self.file_path = file_path
+        try:
+            import xlsxwriter
+        except ImportError:
+            xlsxwriter = None
+
+        if xlsxwriter:
+            self.workbook = xlsxwriter.Workbook(
+                file_path,
+                {"constant_memory": True, "default_date_format": "yyyy-mm-dd hh:mm:ss"},
+            )
+        else:
+            self.workbook = openpyxl.Workbook(write_only=True)
+
+        if sheet_name is not None:
+            self.add_worksheet(sheet_name)
+
+    def add_worksheet(self, sheet_name):
+        """
+        Write the following DataFrames into a new worksheet
+        """
+        self.header_written = False
+        if isinstance(self.workbook, openpyxl.Workbook):
+            self.worksheet = self.workbook.create_sheet(sheet_name)
+            self.append = self.worksheet.append
+        else:
+            self.worksheet = self.workbook.add_worksheet(sheet_name)
+            self.row = 0
+            self.append = self.append_xlsxwriter
+
+    def append_xlsxwriter(self, row):
+        self.worksheet.write_row(self.row, 0, row)
+        self.row += 1
+
+    def write(self, df):
+        if not self.header_written:
+            self.append([str(col) for col in df.columns])
+            self.header_written = True
+
+        for row in python_rows(df):
+            self.append(row)
+
+    def close(self):
+        if isinstance(self.workbook, openpyxl.Workbook):
+            self.workbook.save(self.file_path)
+        else:
+            self.workbook.close()
+
+
+class CsvChunkWriter(ChunkWriter):
+    """
+    Write DataFrames one after another into a CSV file
+    """
+    def __init__(self, file_path):
+        self.header_written = False
+        # Byte order mark so that Excel opens Chinese text correctly
+        self.file = open(file_path, "w", encoding="utf-8-sig", newline="")
+
+    def write(self, df):
+        df.to_csv(self.file, index=False, header=not self.header_written)
+        self.header_written = True
+
+    def close(self):
+        self.file.close()
+
+
+class ArrowChunkWriter(ChunkWriter):
+    """
+    Write DataFrames one after another into a Parquet or Feather (Arrow IPC) file
+
+    Column types are normalised with `arrow_columns` before writing, as the types of the first DataFrame are used
+    for the whole file. Requires pyarrow.
+    """
+    def __init__(self, file_path, output_format="parquet"):
+        # Fail before any processing if pyarrow is not installed
+        import pyarrow
+
+        self.file_path = file_path
+        self.output_format = output_format
+        self.writer = None
+
+    def write(self, df):
+        import pyarrow
+        import pyarrow.ipc
+        import pyarrow.parquet
+
+        if self.writer is None:
+            df = arrow_columns(df)
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            self.schema = table.schema
+            if self.output_format == "parquet":
+                self.writer = pyarrow.parquet.ParquetWriter(self.file_path, self.schema)
+            else:
+                self.writer = pyarrow.ipc.new_file(self.file_path, self.schema)
+        else:
+            df = arrow_columns(df, self.schema)
+            table = pyarrow.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+        self.writer.write_table(table)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+
+
+def arrow_columns(df, schema=None):
+    """
+    Copy of a DataFrame with column types which stay the same from one chunk of rows to the next
+
+    Numbers are written as float64 (a chunk of whole numbers may be followed by one with decimals), and text,
+    categories and columns with only missing values as strings. Later chunks are converted to the `schema` of the file.
+    """
+    import pyarrow
+
+    converted = {}
+    for col in df.columns:
+        values = df[col]
+        if schema is not None:
+            arrow_type = schema.field(str(col)).type
+            if pyarrow.types.is_string(arrow_type) or pyarrow.types.is_large_string(arrow_type):
+                converted[col] = values.astype("string")
+            elif pyarrow.types.is_floating(arrow_type):
+                converted[col] = values.astype("float64")
+            elif pyarrow.types.is_timestamp(arrow_type):
+                converted[col] = pd.to_datetime(values)
+        elif pd.api.types.is_datetime64_any_dtype(values) or pd.api.types.is_bool_dtype(values):
+            continue
+        elif pd.api.types.is_numeric_dtype(values) and values.notna().any():
+            converted[col] = values.astype("float64")
+        else:
+            converted[col] = values.astype("string")
+    return df.assign(**converted) if converted else df
+
+
+# File formats which reports and translated raw data can be saved as
+output_formats = ["xlsx", "csv", "parquet", "feather"]
+
+
+def with_output_format(file_path, output_format="xlsx"):
+    """
+    Change the extension of a filepath to match the output format, Excel filepaths are kept as they are
+    """
+    if output_format == "xlsx":
+        return file_path
+    return os.path.splitext(file_path)[0] + "." + output_format
+
+
+def open_chunk_writer(file_path, output_format="xlsx", sheet_name="Sheet1"):
+    """
+    Open a writer for the output format, DataFrames passed to its `write` method are appended to the file
+    """
+    if output_format == "xlsx":
+        return ExcelChunkWriter(file_path, sheet_name)
+    if output_format == "csv":
+        return CsvChunkWriter(file_path)
+    if output_format in ["parquet", "feather"]:
+        return ArrowChunkWriter(file_path, output_format)
+    raise ValueError(f"Output format must be one of {', '.join(output_formats)}, not {output_format}")
+
+
+def write_dataframe(df, file_path, output_format="xlsx", sheet_name="Sheet1"):
+    """
+    Write a DataFrame into a new file of the output format
+    """
+    with open_chunk_writer(file_path, output_format, sheet_name) as writer:
+        writer.write(df)
+
+
+def write_dataframes(dataframes, file_path, output_format="xlsx"):
+    """
+    Write several DataFrames (a dictionary of worksheet name to DataFrame) in one pass
+
+    Excel files get one worksheet for each DataFrame. Other formats hold a single table, so each DataFrame
+    is written to its own file named after the worksheet. Returns the filepaths written.
+    """
+    if output_format == "xlsx":
+        with ExcelChunkWriter(file_path, None) as writer:
+            for sheet_name, df in dataframes.items():
+                writer.add_worksheet(sheet_name)
+                writer.write(df)
+        return [file_path]
+
+    file_paths = []
+    for sheet_name, df in dataframes.items():
+        sheet_path = worksheet_output_path(file_path, sheet_name, output_format)
+        write_dataframe(df, sheet_path, output_format)
+        file_paths.append(sheet_path)
+    return file_paths
+
+
+def worksheet_output_path(file_path, sheet_name, output_format="xlsx"):
+    """
+    Filepath for a single worksheet of a multi-worksheet output saved in a format holding one table per file
+    """
+    stem, _ = os.path.splitext(file_path)
+    safe_name = re.sub(r'[\\/:*?"<>|]+', "_", str(sheet_name)).strip()
+    return f"{stem}_{safe_name}.{output_format}"
+
+
+def append_worksheet(file_path, df, sheet_name):
+    """
+    Add a DataFrame as a new worksheet to an existing xlsx/xlsm spreadsheet without rewriting its other worksheets
+
+    A new worksheet part is added to the zip container and the workbook manifest, relationships, content types
+    (and styles, if there are dates) are updated. Every other part is copied over as it is, still compressed.
+    The new spreadsheet is written to a temporary file which then replaces the original, so the original is
+    never left half written. Files which are not zip containers (xls) are appended to with openpyxl instead.
+    """
+    append_worksheets(file_path, {sheet_name: df})
+
+
+def append_worksheets(file_path, dataframes):
+    """
+    Add several DataFrames (a dictionary of worksheet name to DataFrame) as new worksheets in one pass,
+    in the same way as `append_worksheet`
+
+    Raises ValueError before the spreadsheet is changed if a worksheet name is not allowed by Excel or is used twice
+    """
+    new_names = set()
+    for sheet_name in dataframes:
+        check_sheet_name(sheet_name)
+        if sheet_name.lower() in new_names:
+            raise ValueError(f"Sheet '{sheet_name}' is added more than once.")
+        new_names.add(sheet_name.lower())
+
+    if not zipfile.is_zipfile(file_path):
+        with pd.ExcelWriter(file_path, engine="openpyxl", mode="a") as writer:
+            for sheet_name, df in dataframes.items():
+                df.to_excel(writer, sheet_name=sheet_name, index=False)
+        return
+
+    fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(file_path)), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as temp_file, open(file_path, "rb") as source_file:
+            with zipfile.ZipFile(source_file) as source, zipfile.ZipFile(temp_file, "w", zipfile.ZIP_DEFLATED) as target:
+                # Add each worksheet to the manifest updated for the worksheets added before it
+                updated = UpdatedArchive(source)
+                worksheets = []
+                date_style = None
+                for sheet_name, df in dataframes.items():
+                    has_dates = any(pd.api.types.is_datetime64_any_dtype(df[col]) for col in df.columns)
+                    parts, worksheet_part, new_date_style, date1904 = add_worksheet_to_manifest(
+                        updated, sheet_name, has_dates=has_dates and date_style is None
+                    )
+                    if new_date_style is not None:
+                        date_style = new_date_style
+                    updated.parts.update(parts)
+                    updated.new_parts.append(worksheet_part)
+                    worksheets.append((worksheet_part, df, date_style if has_dates else None, date1904))
+
+                # Copy every part which does not change without decompressing it
+                for info in source.infolist():
+                    if info.filename in updated.parts:
+                        target.writestr(info.filename, updated.parts[info.filename])
+                    else:
+                        copy_zip_entry(source_file, target, info)
+
+                for worksheet_part, df, sheet_date_style, date1904 in worksheets:
+                    with target.open(worksheet_part, "w") as worksheet_file:
+                        write_worksheet_xml(worksheet_file, df, sheet_date_style, date1904)
+
+        shutil.copymode(file_path, temp_path)
+        os.replace(temp_path, file_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+
+
+def check_sheet_name(sheet_name):
+    """
+    Raise ValueError if Excel does not allow a worksheet name, in the same way as openpyxl
+    """
+    if not sheet_name:
+        raise ValueError("Sheet name cannot be empty.")
+    if illegal_sheet_name_characters.search(sheet_name):
+        raise ValueError(f"Sheet name '{sheet_name}' cannot contain any of / \\ ? * [ ] :")
+    if len(sheet_name) > max_sheet_name_length:
+        raise ValueError(f"Sheet name '{sheet_name}' is longer than {max_sheet_name_length} characters.")
+
+
+class UpdatedArchive:
+    """
+    View of a zip archive with some of its parts replaced and new parts added, which are not written yet
+    """
+    def __init__(self, archive):
+        self.archive = archive
+        self.parts = {}
+        self.new_parts = []
+
+    def read(self, name):
+        if name in self.parts:
+            return self.parts[name]
+        return self.archive.read(name)
+
+    def namelist(self):
+        return self.archive.namelist() + self.new_parts
+
+
+def add_worksheet_to_manifest(archive, sheet_name, has_dates=False):
+    """
+    Get the updated workbook manifest, relationships and content types (and styles) for a new worksheet
+
+    Returns the updated parts, the path of the new worksheet part, the style index for dates
+    and whether the workbook counts dates from 1904
+    """
+    workbook = archive.read("xl/workbook.xml")
+    relationships = archive.read("xl/_rels/workbook.xml.rels")
+    content_types = archive.read("[Content_Types].xml")
+
+    check_sheet_name(sheet_name)
+    # Worksheet names are case insensitive in Excel
+    workbook_root = ET.fromstring(workbook)
+    existing_names = [sheet.get("name").lower() for sheet in workbook_root.iter(main_ns + "sheet")]
+    if sheet_name.lower() in existing_names:
+        raise ValueError(f"Sheet '{sheet_name}' already exists.")
+
+    workbook_properties = workbook_root.find(main_ns + "workbookPr")
+    date1904 = workbook_properties is not None and workbook_properties.get("date1904") in ["1", "true"]
+
+    # Pick a worksheet part, relationship id and sheet id which are not used yet
+    names = set(archive.namelist())
+    number = 1
+    while f"xl/worksheets/sheet{number}.xml" in names:
+        number += 1
+    worksheet_part = f"xl/worksheets/sheet{number}.xml"
+
+    relationship_ids = set(re.findall(rb'Id="([^"]+)"', relationships))
+    relationship_number = len(relationship_ids) + 1
+    while f"rId{relationship_number}".encode() in relationship_ids:
+        relationship_number += 1
+    relationship_id = f"rId{relationship_number}"
+
+    sheet_ids = [int(i) for i in re.findall(rb'<(?:\w+:)?sheet\b[^>]*\ssheetId="(\d+)"', workbook)]
+    sheet_id = max(sheet_ids, default=0) + 1
+
+    # Use the same namespace prefixes as the rest of the workbook manifest
+    prefix = re.search(rb"</(\w+:)?sheets>", workbook).group(1) or b""
+    relationships_prefix = re.search(
+        rb'xmlns:(\w+)="http://schemas.openxmlformats.org/officeDocument/2006/relationships"', workbook
+    )
+    if relationships_prefix:
+        id_attribute = relationships_prefix.group(1) + b':id="' + relationship_id.encode() + b'"'
+    else:
+        id_attribute = (
+            b'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships" r:id="'
+            + relationship_id.encode() + b'"'
+        )
+
+    sheet = (
+        b"<" + prefix + b'sheet name="' + escape(sheet_name, {'"': "&quot;"}).encode("utf-8")
+        + b'" sheetId="' + str(sheet_id).encode() + b'" ' + id_attribute + b"/>"
+    )
+    updated_parts = {
+        "xl/workbook.xml": insert_before(workbook, b"</" + prefix + b"sheets>", sheet),
+        "xl/_rels/workbook.xml.rels": insert_before(
+            relationships,
+            re.search(rb"</(?:\w+:)?Relationships>", relationships).group(0),
+            f'<Relationship Id="{relationship_id}" Type="{worksheet_relationship_type}" '
+            f'Target="worksheets/{posixpath.basename(worksheet_part)}"/>'.encode(),
+        ),
+        "[Content_Types].xml": insert_before(
+            content_types,
+            re.search(rb"</(?:\w+:)?Types>", content_types).group(0),
+            f'<Override PartName="/{worksheet_part}" ContentType="{worksheet_content_type}"/>'.encode(),
+        ),
+    }
+
+    date_style = None
+    if has_dates:
+        updated_parts["xl/styles.xml"], date_style = add_date_style(archive.read("xl/styles.xml"))
+
+    return updated_parts, worksheet_part, date_style, date1904
+
+
+def add_date_style(styles):
+    """
+    Add a cell style with a date and time number format, returning the updated styles and the index of the new style
+    """
+    match = re.search(rb"<(\w+:)?cellXfs\b[^>]*>(.*?)</\1?cellXfs>", styles, re.S)
+    prefix = match.group(1) or b""
+    index = len(re.findall(rb"<" + re.escape(prefix) + rb"xf\b", match.group(2)))
+
+    # Built-in number format 22 is "m/d/yy h:mm"
+    xf = b"<" + prefix + b'xf numFmtId="22" fontId="0" fillId="0" borderId="0" xfId="0" applyNumberFormat="1"/>'
+    block = match.group(0)
+    new_block = insert_before(block, b"</" + prefix + b"cellXfs>", xf)
+    new_block = re.sub(rb'count="\d+"', b'count="' + str(index + 1).encode() + b'"', new_block, count=1)
+
+    return styles[:match.start()] + new_block + styles[match.end():], index
+
+
+def insert_before(xml, closing_tag, element):
+    """
+    Insert an element before the last occurrence of a closing tag
+    """
+    position = xml.rindex(closing_tag)
+    return xml[:position] + element + xml[position:]
+
+
+def copy_zip_entry(source_file, target, info):
+    """
+    Copy a zip entry's compressed data into another zip file without decompressing it
+    """
+    # Skip the entry's local header in the source file to get to its data
+    source_file.seek(info.header_offset)
+    local_header = source_file.read(zipfile.sizeFileHeader)
+    name_length, extra_length = struct.unpack("<HH", local_header[26:30])
+    source_file.seek(info.header_offset + zipfile.sizeFileHeader + name_length + extra_length)
+
+    new_info = zipfile.ZipInfo(info.filename, info.date_time)
+    new_info.compress_type = info.compress_type
+    new_info.external_attr = info.external_attr
+    new_info.create_system = info.create_system
+    new_info.CRC = info.CRC
+    new_info.compress_size = info.compress_size
+    new_info.file_size = info.file_size
+    new_info.header_offset = target.fp.tell()
+
+    target.fp.write(new_info.FileHeader())
+    remaining = info.compress_size
+    while remaining > 0:
+        block = source_file.read(min(remaining, 1024 * 1024))
+        if not block:
+            raise zipfile.BadZipFile(f"Unexpected end of data for {info.filename}")
+        target.fp.write(block)
+        remaining -= len(block)
+
+    target.filelist.append(new_info)
+    target.NameToInfo[new_info.filename] = new_info
+    # Following entries (and the central directory) are written after the copied data
+    target.start_dir = target.fp.tell()
+
+
+def excel_serial_date(value, date1904=False):
+    """
+    Convert a date or datetime to the number of days used by Excel to store it
+    """
+    epoch = datetime.datetime(1904, 1, 1) if date1904 else datetime.datetime(1899, 12, 30)
+    if not isinstance(value, datetime.datetime):
+        value = datetime.datetime(value.year, value.month, value.day)
+    return (value.replace(tzinfo=None) - epoch) / datetime.timedelta(days=1)
+
+
+def cell_xml(reference, value, date_style, date1904):
+    """
+    XML of a single cell, strings are stored inline so the shared strings of the spreadsheet are left untouched
+    """
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return f'<c r="{reference}" t="b"><v>{int(value)}</v></c>'
+    if isinstance(value, (int, float)):
+        if value != value or value in (float("inf"), float("-inf")):
+            return ""
+        return f'<c r="{reference}"><v>{value!r}</v></c>'
+    if isinstance(value, (datetime.datetime, datetime.date)):
+        style = f' s="{date_style}"' if date_style is not None else ""
+        return f'<c r="{reference}"{style}><v>{excel_serial_date(value, date1904)!r}</v></c>'
+    text = illegal_xml_characters.sub("", str(value))
+    space = ' xml:space="preserve"' if text != text.strip() else ""
+    return f'<c r="{reference}" t="inlineStr"><is><t{space}>{escape(text)}</t></is></c>'
+
+
+def write_worksheet_xml(file, df, date_style=None, date1904=False):
+    """
+    Stream a DataFrame (with its header) into a file as worksheet XML
+    """
+    columns = [get_column_letter(i + 1) for i in range(len(df.columns))]
+    last_cell = f"{columns[-1]}{len(df) + 1}" if columns else "A1"
+
+    file.write(
+        b'<?xml version="1.0" encoding="UTF-8" standalone="yes"?>\n'
+        b'<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+        + f'<dimension ref="A1:{last_cell}"/><sheetData>'.encode()
+    )
+
+    header = [str(col) for col in df.columns]
+    for row_number, row in enumerate(itertools.chain([header], python_rows(df)), start=1):
+        cells = "".join(cell_xml(f"{col}{row_number}", value, date_style, date1904) for col, value in zip(columns, row))
+        file.write(f'<row r="{row_number}">{cells}</row>'.encode("utf-8"))
+
+    file.write(b"</sheetData></worksheet>")
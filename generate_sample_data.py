@@ -0,0 +1,220 @@
+import argparse
+import os
+import numpy as np
+import pandas as pd
+from excel_io import ExcelChunkWriter
+
+# Most rows Excel allows in a worksheet, without the header
+max_worksheet_rows = 1048575
+
+# Chinese column names and their English translation, in the order of the "IMPT VARS - DO NOT DELETE" worksheet
+columns = {
+    "项目ID": "Project ID",
+    "资源ID": "Resource ID",
+    "资源名称": "Resource Name",
+    "资源类型": "Resource Type",
+    "地域": "Region",
+    "计费方式": "Billing Method",
+    "配置": "Configuration",
+    "订单类型": "Order Type",
+    "订单开始时间": "Order Start Time",
+    "订单结束时间": "Order End Time",
+    "单价": "Unit Price",
+    "使用金额": "Usage Amount",
+}
+
+# Values of the translated columns and their English translation
+billing_methods = {"包年包月": "Monthly", "按量计费": "Hourly", "后付费": "Postpaid"}
+order_types = {"新购": "New Purchase", "续费": "Renewal", "按量扣费": "Hourly Deduction", "删除退款": "Delete Refund"}
+regions = {"华北": "North China", "华东": "East China", "华南": "South China", "西南": "Southwest China", "香港": "Hong Kong"}
+resource_types = {"云服务器": "Cloud Server", "云硬盘": "Cloud Disk", "负载均衡": "Load Balancer", "云数据库": "Cloud Database"}
+
+# Configurations and hourly prices of each resource type
+configurations = {
+    "云服务器": [("2核4G", 0.32), ("4核8G", 0.64), ("8核16G", 1.28)],
+    "云硬盘": [("100GB", 0.05), ("500GB", 0.25)],
+    "负载均衡": [("标准型", 0.12)],
+    "云数据库": [("2核4G", 0.45), ("4核16G", 1.2)],
+}
+configuration_translations = {"标准型": "Standard"}
+
+
+def generate_billing_data(rows=10000, seed=0, month="2024-03"):
+    """
+    Generate raw billing data in Chinese with about `rows` rows
+
+    Hourly and postpaid resources have one row per hour used, monthly resources have a single row.
+    About a quarter of hourly and postpaid resources end with a cancellation (删除退款).
+    """
+    rng = np.random.default_rng(seed)
+
+    # Rows used by each resource, about 1 in 5 resources is paid monthly
+    resource_count = max(1, rows // 40)
+    billing = rng.choice(list(billing_methods), size=resource_count, p=[0.2, 0.6, 0.2])
+    counts = np.where(billing == "包年包月", 1, rng.integers(2, 150, size=resource_count))
+
+    # Trim or extend the number of rows used by the last resources to get exactly `rows` rows
+    counts = counts[np.cumsum(counts) - counts < rows]
+    counts[-1] -= counts.sum() - rows
+    billing = billing[:len(counts)]
+    resource_count = len(counts)
+
+    # Details of each resource
+    resource_type = rng.choice(list(resource_types), size=resource_count, p=[0.5, 0.25, 0.1, 0.15])
+    configuration = np.empty(resource_count, dtype=object)
+    hourly_price = np.empty(resource_count)
+    for kind, options in configurations.items():
+        is_kind = resource_type == kind
+        choice = rng.integers(0, len(options), size=is_kind.sum())
+        configuration[is_kind] = [options[i][0] for i in choice]
+        hourly_price[is_kind] = [options[i][1] for i in choice]
+
+    start_of_month = np.datetime64(month + "-01T00:00:00")
+    resource_start = start_of_month + rng.integers(0, 24 * 20, size=resource_count).astype("timedelta64[h]")
+    cancelled = (billing != "包年包月") & (rng.random(resource_count) < 0.25)
+
+    # Repeat resource details for every row
+    resource = np.repeat(np.arange(resource_count), counts)
+    hour = np.arange(rows) - np.repeat(np.cumsum(counts) - counts, counts)
+    is_last_row = hour == counts[resource] - 1
+    is_monthly = billing[resource] == "包年包月"
+
+    order_type = np.where(is_monthly, "新购", np.where(hour == 0, "新购", "按量扣费")).astype(object)
+    order_type[is_last_row & cancelled[resource]] = "删除退款"
+
+    start_time = resource_start[resource] + hour.astype("timedelta64[h]")
+    end_time = start_time + np.where(is_monthly, 24 * 30, 1).astype("timedelta64[h]")
+    # Cancellations are recorded at the time the resource is deleted
+    end_time = np.where(order_type == "删除退款", start_time, end_time)
+
+    unit_price = np.where(is_monthly, hourly_price[resource] * 24 * 30 * 0.8, hourly_price[resource])
+    usage_amount = np.where(order_type == "删除退款", 0.0, unit_price * rng.uniform(0.95, 1.0, size=rows))
+
+    return pd.DataFrame(
+        {
+            "项目ID": np.char.add("project-", (resource % 37).astype(str)),
+            "资源ID": np.char.add("ins-", np.char.zfill(resource.astype(str), 8)),
+            "资源名称": np.char.add("资源-", resource.astype(str)),
+            "资源类型": resource_type[resource],
+            "地域": rng.choice(list(regions), size=resource_count)[resource],
+            "计费方式": billing[resource],
+            "配置": configuration[resource],
+            "订单类型": order_type,
+            "订单开始时间": np.char.replace(np.datetime_as_string(start_time, unit="s"), "T", " "),
+            "订单结束时间": np.char.replace(np.datetime_as_string(end_time, unit="s"), "T", " "),
+            "单价": unit_price.round(4),
+            "使用金额": usage_amount.round(4),
+        }
+    )
+
+
+def translation_tables():
+    """
+    Worksheets of the translation source file matching the generated billing data
+    """
+    def table(mapping):
+        return pd.DataFrame({"Chinese": list(mapping), "English": list(mapping.values())})
+
+    return {
+        "IMPT VARS - DO NOT DELETE": pd.DataFrame(
+            {
+                "Variable": [
+                    "project_id", "resource_id", "resource_name", "resource_type", "region", "billing_method",
+                    "configuration", "order_type", "order_start_time", "order_end_time", "unit_price",
+                    "usage_amount", "monthly", "delete_refund",
+                ],
+                "English": list(columns.values()) + [billing_methods["包年包月"], order_types["删除退款"]],
+            }
+        ),
+        "Header": table(columns),
+        "资源类型": table(resource_types),
+        "地域": table(regions),
+        "计费方式": table(billing_methods),
+        "配置": table(configuration_translations),
+        "订单类型": table(order_types),
+    }
+
+
+def generated_translations():
+    """
+    Translations matching the generated billing data, in the form returned by `parse_translations`
+    """
+    return {
+        sheet: dict(zip(df.iloc[:, 0], df.iloc[:, 1]))
+        for sheet, df in translation_tables().items()
+    }
+
+
+def english_billing_data(df):
+    """
+    English version of the generated billing data
+    """
+    df = df.copy()
+    for col, mapping in [
+        ("资源类型", resource_types),
+        ("地域", regions),
+        ("计费方式", billing_methods),
+        ("配置", configuration_translations),
+        ("订单类型", order_types),
+    ]:
+        df[col] = df[col].map(lambda value: mapping.get(value, value))
+    return df.rename(columns=columns)
+
+
+def data_worksheet_names(rows):
+    """
+    Names of the worksheets holding `rows` rows of data, as Excel limits the number of rows in each worksheet
+    """
+    sheets = -(-rows // max_worksheet_rows)
+    return ["Data"] + [f"Data {i}" for i in range(2, sheets + 1)]
+
+
+def write_billing_workbook(df, file_path):
+    """
+    Write billing data into a spreadsheet, splitting it into several worksheets if needed
+    """
+    with ExcelChunkWriter(file_path, None) as writer:
+        for i, sheet_name in enumerate(data_worksheet_names(len(df))):
+            writer.add_worksheet(sheet_name)
+            writer.write(df.iloc[i * max_worksheet_rows:(i + 1) * max_worksheet_rows])
+
+
+def write_translation_workbook(file_path):
+    with pd.ExcelWriter(file_path, engine="openpyxl") as writer:
+        for sheet_name, df in translation_tables().items():
+            df.to_excel(writer, sheet_name=sheet_name, index=False)
+
+
+def generate_sample_data(rows, output_dir, seed=0):
+    """
+    Write Chinese and English billing spreadsheets with `rows` rows and the translation source file into a folder
+
+    Returns the filepaths of the Chinese and English spreadsheets
+    """
+    os.makedirs(output_dir, exist_ok=True)
+
+    df = generate_billing_data(rows, seed)
+    chinese_file = os.path.join(output_dir, f"billing_{rows}_zh.xlsx")
+    english_file = os.path.join(output_dir, f"billing_{rows}_en.xlsx")
+    write_billing_workbook(df, chinese_file)
+    write_billing_workbook(english_billing_data(df), english_file)
+    write_translation_workbook(os.path.join(output_dir, "Language Translation.xlsx"))
+
+    return chinese_file, english_file
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate synthetic raw billing data for testing and benchmarks.")
+    parser.add_argument("-r", "--rows", type=int, nargs="+", default=[10000], help="Number of rows of each dataset to generate (default: 10000)")
+    parser.add_argument("-o", "--output-dir", default="sample_data", help="Folder to save the spreadsheets in (default: sample_data)")
+    parser.add_argument("--seed", type=int, default=0, help="Seed for the random number generator")
+    args = parser.parse_args(argv)
+
+    for rows in args.rows:
+        print(f"Generating {rows:,} rows...")
+        for file_path in generate_sample_data(rows, args.output_dir, args.seed):
+            print(f"Saved {file_path}")
+
+
+if __name__ == "__main__":
+    main()
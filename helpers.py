@@ -1,62 +1,286 @@
-from PyQt5.QtWidgets import QDialog, QVBoxLayout, QProgressBar
+import fnmatch
+import importlib
+import os
+import threading
+import traceback
+import job_queue
+from PyQt5.QtWidgets import QWidget, QVBoxLayout, QHBoxLayout, QPushButton, QTableWidget, QTableWidgetItem, QAbstractItemView
 from PyQt5.QtCore import QThread, pyqtSignal, QTimer
 
-class LoadingScreen(QDialog):
+# Folders skipped when searching for the translation source
+excluded_folders = [".*", "__pycache__", "node_modules", "venv", "env", "build", "dist", "AppData", "Library"]
+
+# Names shown in the job queue for the stages reported by total_sales
+stage_names = {
+    "read": "Reading worksheet",
+    "translate": "Translating",
+    "write_translations": "Saving translations",
+    "calculate": "Calculating sales",
+    "add_to_existing_spreadsheet": "Adding worksheet",
+    "write_new_spreadsheet": "Saving new spreadsheet",
+}
+
+class JobQueuePanel(QWidget):
     """
-    Loading screen
+    Table of report jobs showing the state, duration and output of each, with buttons to cancel jobs or run them again
     """
-    def __init__(self):
+    columns = ["Job", "State", "Duration", "Output"]
+
+    def __init__(self, job_queue):
         super().__init__()
-        self.setWindowTitle("Loading...")
-        self.setFixedSize(300, 100)
-        
+        self.job_queue = job_queue
+
         layout = QVBoxLayout(self)
-        self.progress_bar = QProgressBar(self)
-        self.progress_bar.setStyleSheet("QProgressBar {"
-                                         "border: 2px solid grey;"
-                                         "border-radius: 5px;"
-                                         "text-align: center;"
-                                         "color: white;"
-                                         "padding: 1px;"
-                                         "background-color: #2196F3;"
-                                         "}")
-        self.progress_bar.setTextVisible(False)
-        self.progress_bar.setRange(0, 0)  # Set to infinite progress
-        layout.addWidget(self.progress_bar)
-        
+        layout.setContentsMargins(0, 0, 0, 0)
+
+        self.table = QTableWidget(0, len(self.columns), self)
+        self.table.setHorizontalHeaderLabels(self.columns)
+        self.table.setSelectionBehavior(QAbstractItemView.SelectRows)
+        self.table.setEditTriggers(QAbstractItemView.NoEditTriggers)
+        self.table.verticalHeader().setVisible(False)
+        self.table.horizontalHeader().setStretchLastSection(True)
+        self.table.setMinimumHeight(120)
+        self.table.itemSelectionChanged.connect(self.update_buttons)
+        layout.addWidget(self.table)
+
+        buttons = QHBoxLayout()
+        self.cancel_button = QPushButton("Cancel Job", self)
+        self.cancel_button.clicked.connect(self.cancel_selected)
+        buttons.addWidget(self.cancel_button)
+        self.rerun_button = QPushButton("Run Again", self)
+        self.rerun_button.clicked.connect(self.rerun_selected)
+        buttons.addWidget(self.rerun_button)
+        self.remove_button = QPushButton("Remove Finished", self)
+        self.remove_button.clicked.connect(self.remove_finished)
+        buttons.addWidget(self.remove_button)
+        layout.addLayout(buttons)
+
+        # Collect progress from the worker processes without blocking the window
         self.timer = QTimer(self)
-        self.timer.timeout.connect(self.update_progress)
-        self.timer.start(50)  # Update progress every 50 milliseconds
-        self.direction = 1  # 1 for forward, -1 for backward
-        self.position = 0
-     
-    def update_progress(self):
-        if self.direction == 1:
-            self.position += 1
-        else:
-            self.position -= 1
-        
-        if self.position >= 100:
-            self.direction = -1
-        elif self.position <= 0:
-            self.direction = 1
-        
-        self.progress_bar.setValue(self.position)
+        self.timer.timeout.connect(self.refresh)
+        self.timer.start(250)
+        self.refresh()
+
+    def selected_jobs(self):
+        rows = sorted({index.row() for index in self.table.selectedIndexes()})
+        return [self.job_queue.jobs[row] for row in rows if row < len(self.job_queue.jobs)]
+
+    def cancel_selected(self):
+        for job in self.selected_jobs():
+            self.job_queue.cancel(job)
+        self.refresh()
+
+    def rerun_selected(self):
+        for job in self.selected_jobs():
+            self.job_queue.rerun(job)
+        self.refresh()
+
+    def remove_finished(self):
+        self.job_queue.remove_finished()
+        self.refresh()
+
+    def refresh(self):
+        self.job_queue.poll()
+        jobs = self.job_queue.jobs
+        # Keep the selected jobs selected when rows move
+        selected = {job.job_id for job in self.selected_jobs()}
+        self.table.blockSignals(True)
+        self.table.setRowCount(len(jobs))
+        for row, job in enumerate(jobs):
+            cells = [
+                job.description,
+                job_state_text(job),
+                duration_text(job),
+                output_text(job.outputs),
+            ]
+            for col, text in enumerate(cells):
+                item = self.table.item(row, col)
+                if item is None:
+                    item = QTableWidgetItem()
+                    self.table.setItem(row, col, item)
+                item.setText(text)
+            # Errors, untranslated values and the time taken by each stage are shown when hovering over the state
+            tooltip = job.error or "\n\n".join(filter(None, [untranslated_text(job.untranslated), job.summary]))
+            self.table.item(row, 1).setToolTip(tooltip)
+            self.table.item(row, 3).setToolTip("\n".join(job.outputs))
+        self.table.clearSelection()
+        for row, job in enumerate(jobs):
+            if job.job_id in selected:
+                self.table.selectRow(row)
+        self.table.blockSignals(False)
+        self.update_buttons()
+
+    def update_buttons(self):
+        jobs = self.selected_jobs()
+        self.cancel_button.setEnabled(any(job.state not in job_queue.finished_states for job in jobs))
+        self.rerun_button.setEnabled(any(job.state in job_queue.finished_states for job in jobs))
+        self.remove_button.setEnabled(any(job.state in job_queue.finished_states for job in self.job_queue.jobs))
+
+
+def output_text(outputs):
+    """
+    First file written by a job, and how many more there are
+    """
+    if not outputs:
+        return ""
+    return outputs[0] + (f" (+{len(outputs) - 1} more)" if len(outputs) > 1 else "")
+
+
+def job_state_text(job):
+    """
+    State of a job as shown to the user, with the progress of the stage it is running
+    """
+    if job.state == job_queue.held:
+        return "Waiting for worksheet to be read"
+    if job.state == job_queue.done and untranslated_text(job.untranslated):
+        return "Done (some values not translated)"
+    if job.state != job_queue.running:
+        return job.state.capitalize()
+    if job.cancel is not None and job.cancel.is_set():
+        return "Cancelling..."
+    if job.stage is None:
+        return "Starting..."
+    name = stage_names.get(job.stage, job.stage.replace("_", " ").capitalize())
+    if job.rows_total:
+        return f"{name}... {min(100, int(job.rows_done * 100 / job.rows_total))}%"
+    return f"{name}..."
+
+
+def untranslated_text(untranslated):
+    """
+    Columns and values that could not be translated, one column per line
+    """
+    lines = [f"Values in column {col} not translated!" for col in untranslated.get("missing_columns", [])]
+    for col, values in untranslated.get("values", {}).items():
+        lines.append(f"{len(values)} value(s) in column {col} without translation: {', '.join(map(str, values[:10]))}")
+    return "\n".join(lines)
+
+
+def duration_text(job):
+    """
+    How long a job has been running, with an estimate of the time left in its current stage once there is one
+    """
+    duration = job.duration()
+    if duration is None:
+        return ""
+    seconds_left = job.seconds_left()
+    if seconds_left is None:
+        return format_duration(duration)
+    return f"{format_duration(duration)} (about {format_duration(seconds_left)} left)"
+
+
+def format_duration(seconds):
+    """
+    Duration as minutes and seconds, such as "2m 05s"
+    """
+    minutes, seconds = divmod(int(seconds + 0.5), 60)
+    return f"{minutes}m {seconds:02d}s" if minutes else f"{seconds}s"
+
 
 class FileProcessor(QThread):
     """
     Processor which performs some task and sends a signal when complete
+
+    If `track_progress` is set, the function is also passed a `progress` callback, which is relayed as the
+    `progress` signal, and a `cancel` event, which is set by `cancel()`. A function stopped by the cancel event
+    sends `cancelled` and one which raises an error sends `failed` with the error message, instead of `finished`.
+    The value returned by the function is kept in `result`.
     """
     finished = pyqtSignal()
+    progress = pyqtSignal(str, int, int)
+    cancelled = pyqtSignal()
+    failed = pyqtSignal(str)
 
-    def __init__(self, function, *args, **kwargs):
+    def __init__(self, function, *args, track_progress=False, **kwargs):
         super().__init__()
         self.function = function
         self.args = args
         self.kwargs = kwargs
+        self.result = None
+        self.cancel_event = threading.Event()
+        if track_progress:
+            self.kwargs["progress"] = self.send_progress
+            self.kwargs["cancel"] = self.cancel_event
+
+    def send_progress(self, stage, rows_done, rows_total):
+        # Signals need an int, -1 is sent when the total is not known
+        self.progress.emit(stage, int(rows_done), -1 if rows_total is None else int(rows_total))
+
+    def cancel(self):
+        """
+        Ask the function to stop at the next point it checks for cancellation
+        """
+        self.cancel_event.set()
 
     def run(self):
         # Run function
-        self.function(*self.args, **self.kwargs)
+        try:
+            self.result = self.function(*self.args, **self.kwargs)
+        except Exception as e:
+            if self.cancel_event.is_set():
+                self.cancelled.emit()
+            else:
+                traceback.print_exc()
+                self.failed.emit(str(e))
+            return
         
         self.finished.emit()
+
+
+def find_translation_source(folder, max_depth=3, exclude=excluded_folders):
+    """
+    Look in a folder and its subfolders (up to `max_depth` levels down) for the translation file
+
+    Subfolders matching any of the `exclude` patterns are skipped
+    """
+    folder = os.path.abspath(folder)
+    base_depth = folder.rstrip(os.sep).count(os.sep)
+
+    for root, dirs, files in os.walk(folder):
+        for file in files:
+            # Return file path if a matching file is found, skipping lock files of open spreadsheets
+            if "language translation" in file.lower() and not file.startswith("~$"):
+                return os.path.join(root, file)
+
+        # Do not go into excluded folders or deeper than the depth limit
+        if root.count(os.sep) - base_depth >= max_depth:
+            dirs[:] = []
+        else:
+            dirs[:] = [
+                d for d in dirs
+                if not any(fnmatch.fnmatch(d, pattern) for pattern in exclude)
+            ]
+    # Else return None at the end
+    return None
+
+
+class TranslationSourceFinder(QThread):
+    """
+    Searches for the translation file in the background and sends a signal with its path if found
+    """
+    found = pyqtSignal(str)
+
+    def __init__(self, folder):
+        super().__init__()
+        self.folder = folder
+
+    def run(self):
+        file_path = find_translation_source(self.folder)
+        if file_path:
+            self.found.emit(file_path)
+
+
+class ModuleLoader(QThread):
+    """
+    Imports modules in the background so that they are ready by the time they are needed, and sends a signal when done
+    """
+    loaded = pyqtSignal()
+
+    def __init__(self, *module_names):
+        super().__init__()
+        self.module_names = module_names
+
+    def run(self):
+        for module_name in self.module_names:
+            importlib.import_module(module_name)
+        self.loaded.emit()
@@ -0,0 +1,91 @@
+import datetime
+import json
+import time
+import tracemalloc
+from contextlib import contextmanager
+
+
+class RunReport:
+    """
+    Records the wall time, CPU time, peak memory and number of rows of each stage of a run
+
+    Pass `trace_memory=True` to also measure peak memory with tracemalloc, which slows down Python code
+    several times while it is tracing, so it is only used for diagnostic runs.
+    """
+    def __init__(self, trace_memory=False, **details):
+        self.trace_memory = trace_memory
+        self.details = details
+        self.started_at = datetime.datetime.now().isoformat(timespec="seconds")
+        self.stages = []
+
+    @contextmanager
+    def stage(self, name):
+        """
+        Measure the code run inside the `with` block as a stage, the number of rows can be set on the yielded dictionary
+        """
+        info = {"stage": name, "rows": None}
+
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            start_memory = tracemalloc.get_traced_memory()[0]
+
+        start_wall = time.perf_counter()
+        start_cpu = time.process_time()
+        try:
+            yield info
+        finally:
+            info["wall_seconds"] = time.perf_counter() - start_wall
+            info["cpu_seconds"] = time.process_time() - start_cpu
+            if self.trace_memory:
+                # Peak memory allocated during the stage, on top of what was allocated before it
+                info["peak_memory_mb"] = (tracemalloc.get_traced_memory()[1] - start_memory) / 1024 / 1024
+                if started_tracing:
+                    tracemalloc.stop()
+            self.stages.append(info)
+
+    def to_dict(self):
+        return {
+            "started_at": self.started_at,
+            **self.details,
+            "total_wall_seconds": sum(stage["wall_seconds"] for stage in self.stages),
+            "total_cpu_seconds": sum(stage["cpu_seconds"] for stage in self.stages),
+            "stages": self.stages,
+        }
+
+    def save(self, file_path):
+        """
+        Save the report as JSON
+        """
+        with open(file_path, "w") as file:
+            json.dump(self.to_dict(), file, indent=2, default=str)
+
+    def summary(self):
+        """
+        Report as a text table
+        """
+        lines = [f"{'Stage':<30}{'Rows':>12}{'Wall (s)':>10}{'CPU (s)':>10}{'Peak (MB)':>11}"]
+        for stage in self.stages:
+            rows = f"{stage['rows']:,}" if stage["rows"] is not None else "-"
+            peak = f"{stage['peak_memory_mb']:.1f}" if "peak_memory_mb" in stage else "-"
+            lines.append(
+                f"{stage['stage']:<30}{rows:>12}{stage['wall_seconds']:>10.2f}{stage['cpu_seconds']:>10.2f}{peak:>11}"
+            )
+        report = self.to_dict()
+        lines.append(f"{'Total':<30}{'':>12}{report['total_wall_seconds']:>10.2f}{report['total_cpu_seconds']:>10.2f}")
+        return "\n".join(lines)
+
+
+@contextmanager
+def measure(run_report, name):
+    """
+    Measure a stage if there is a run report, else run it as it is
+    """
+    if run_report is None:
+        yield {}
+    else:
+        with run_report.stage(name) as info:
+            yield info
@@ -0,0 +1,240 @@
+import multiprocessing
+import queue
+import signal
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+# States of a report job. Held jobs wait to be released (for example until their worksheet has been read in the background)
+held = "held"
+queued = "queued"
+running = "running"
+done = "done"
+failed = "failed"
+cancelled = "cancelled"
+finished_states = [done, failed, cancelled]
+
+
+def init_job_worker():
+    """
+    Import the calculations once when a worker process starts, so that the first job does not wait for them
+
+    Workers leave Ctrl+C to the user interface, which cancels their jobs
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    import monthly_sales_calculations  # noqa: F401
+
+
+def run_report_job(job_id, options, cancel, updates):
+    """
+    Run total_sales with the options of a job in a worker process, returning the summary of its stages
+    and the columns and values that could not be translated
+
+    Progress is sent to the `updates` queue as (job_id, stage, rows_done, rows_total), and the report stops
+    once the `cancel` event is set
+    """
+    from instrumentation import RunReport
+    from monthly_sales_calculations import total_sales
+
+    def progress(stage, rows_done, rows_total):
+        updates.put((job_id, stage, rows_done, rows_total))
+
+    run_report = RunReport(trace_memory=False)
+    untranslated = {}
+    total_sales(run_report=run_report, untranslated=untranslated, progress=progress, cancel=cancel, **options)
+    return run_report.summary(), untranslated
+
+
+class ReportJob:
+    """
+    A report to generate: the options of total_sales, a description shown to the user and the files it writes
+    """
+    def __init__(self, job_id, options, description="", outputs=()):
+        self.job_id = job_id
+        self.options = options
+        self.description = description
+        self.outputs = list(outputs)
+        self.reset()
+
+    def reset(self):
+        self.state = queued
+        self.stage = None
+        self.rows_done = 0
+        self.rows_total = None
+        # When the current stage started, and when its progress was last sent
+        self.stage_started = None
+        self.stage_updated = None
+        self.started = None
+        self.finished = None
+        self.error = None
+        self.summary = None
+        # Columns and values that could not be translated, once the job is done
+        self.untranslated = {}
+        self.future = None
+        self.cancel = None
+
+    def duration(self):
+        """
+        Seconds the job has been running for, None if it has not started
+        """
+        if self.started is None:
+            return None
+        return (self.finished or time.time()) - self.started
+
+    def seconds_left(self):
+        """
+        Estimate of the seconds until the current stage finishes, from the rate at which its rows have been done so far,
+        None if it cannot be estimated yet
+        """
+        if self.state != running or not self.rows_total or not 0 < self.rows_done < self.rows_total:
+            return None
+        elapsed = self.stage_updated - self.stage_started
+        if elapsed < 1:
+            return None
+        left = elapsed / self.rows_done * (self.rows_total - self.rows_done)
+        return max(0, left - (time.time() - self.stage_updated))
+
+
+class JobQueue:
+    """
+    Runs report jobs on a pool of at most `workers` processes, so that reports do not share the GIL with the user interface
+
+    Jobs run in the order they are submitted. Call `poll()` regularly to collect their progress and results.
+    Worker processes are started with "spawn", as forking a process running Qt threads is not safe.
+    """
+    def __init__(self, workers=2):
+        self.workers = max(1, workers)
+        self.jobs = []
+        self.next_id = 1
+        self.context = multiprocessing.get_context("spawn")
+        # The pool, and the manager process sharing cancel events and progress with workers, are started with the first job
+        self.executor = None
+        self.manager = None
+        self.updates = None
+
+    def submit(self, options, description="", outputs=(), hold=False):
+        """
+        Add a job running total_sales with `options`, held jobs only start once they are released
+        """
+        job = ReportJob(self.next_id, options, description, outputs)
+        self.next_id += 1
+        if hold:
+            job.state = held
+        self.jobs.append(job)
+        self.start_jobs()
+        return job
+
+    def release(self, job):
+        """
+        Let a held job start
+        """
+        if job.state == held:
+            job.state = queued
+            self.start_jobs()
+
+    def cancel(self, job):
+        """
+        Cancel a job, jobs which are running stop at the next point they check for cancellation
+        """
+        if job.state in (held, queued):
+            job.state = cancelled
+        elif job.state == running:
+            job.cancel.set()
+
+    def rerun(self, job):
+        """
+        Run a finished job again with the same options
+        """
+        if job.state in finished_states:
+            job.reset()
+            # Run after the jobs already waiting
+            self.jobs.remove(job)
+            self.jobs.append(job)
+            self.start_jobs()
+
+    def remove_finished(self):
+        self.jobs = [job for job in self.jobs if job.state not in finished_states]
+
+    def running_jobs(self):
+        return [job for job in self.jobs if job.state == running]
+
+    def start_jobs(self):
+        """
+        Hand queued jobs to the workers, keeping at most one job per worker in the pool so queued jobs can still be cancelled
+        """
+        slots = self.workers - len(self.running_jobs())
+        for job in self.jobs:
+            if slots <= 0:
+                break
+            if job.state != queued:
+                continue
+            if self.executor is None:
+                self.start_pool()
+            job.cancel = self.manager.Event()
+            job.future = self.executor.submit(run_report_job, job.job_id, job.options, job.cancel, self.updates)
+            job.state = running
+            job.started = time.time()
+            slots -= 1
+
+    def start_pool(self):
+        if self.manager is None:
+            self.manager = self.context.Manager()
+            self.updates = self.manager.Queue()
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=self.context,
+            initializer=init_job_worker,
+        )
+
+    def poll(self):
+        """
+        Collect the progress and results sent by the workers and start queued jobs, without waiting
+        """
+        if self.updates is not None:
+            jobs = {job.job_id: job for job in self.running_jobs()}
+            while True:
+                try:
+                    job_id, stage, rows_done, rows_total = self.updates.get_nowait()
+                except queue.Empty:
+                    break
+                job = jobs.get(job_id)
+                if job is not None:
+                    now = time.time()
+                    if stage != job.stage:
+                        job.stage_started = now
+                    job.stage, job.rows_done, job.rows_total = stage, rows_done, rows_total
+                    job.stage_updated = now
+
+        broken = False
+        for job in self.running_jobs():
+            if not job.future.done():
+                continue
+            job.finished = time.time()
+            try:
+                job.summary, job.untranslated = job.future.result()
+                job.state = done
+            except Exception as e:
+                # A worker process died, the pool is started again for the remaining jobs
+                broken = broken or isinstance(e, BrokenProcessPool)
+                job.state = cancelled if job.cancel.is_set() else failed
+                job.error = None if job.state == cancelled else f"{type(e).__name__}: {e}"
+
+        if broken:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        self.start_jobs()
+
+    def shutdown(self):
+        """
+        Cancel every job and stop the worker processes, waiting for running jobs to stop
+        """
+        for job in self.jobs:
+            self.cancel(job)
+        if self.executor is not None:
+            self.executor.shutdown(wait=True, cancel_futures=True)
+            self.executor = None
+        self.poll()
+        if self.manager is not None:
+            self.manager.shutdown()
+            self.manager = None
+            self.updates = None
@@ -1,12 +1,85 @@
+import hashlib
+import inspect
+import itertools
+import pickle
+import threading
+import zipfile
+import numpy as np
 import pandas as pd
-import openpyxl
 import os
+from concurrent.futures import ThreadPoolExecutor
+from caching import atomic_write_bytes, file_hash, load_cached_translations, load_cached_worksheet
+from dtypes import amount, apply_dtype_plan, category, concat_chunks, parse_timestamps, price, read_dtypes
+from excel_io import (
+    SharedWorkbook,
+    append_worksheet,
+    append_worksheets,
+    list_worksheets,
+    open_chunk_writer,
+    read_excel,
+    read_excel_chunks,
+    with_output_format,
+    worksheet_output_path,
+    write_dataframe,
+    write_dataframes,
+)
+from instrumentation import RunReport, measure
 
 translated_col_and_values_sheet = "IMPT VARS - DO NOT DELETE"
 
+# Rows read or written between progress updates and checks for cancellation
+progress_chunk_size = 50000
+
+# Worksheet of the new spreadsheet holding the rollup of the report, and the label of rolled up columns
+rollup_worksheet = "Rollup"
+rollup_total = "All"
+
+
+class ReportCancelled(Exception):
+    """
+    Raised when a report is cancelled before it is finished
+    """
+
+
+class PandasBackend:
+    """
+    Calculations with pandas, the default backend
+
+    A backend translates DataFrames of raw data and gets their per Resource ID state. Both results are plain pandas
+    objects, so chunks, saved states and the report itself are handled the same way whichever backend made them.
+    """
+    name = "pandas"
+
+    def translate(self, untranslated_df, translations, untranslated=None):
+        return translate_dataframe(untranslated_df, translations, untranslated)
+
+    def sales_state(self, sales_df, translations, timestamp_formats=None):
+        return sales_state(sales_df, translations, timestamp_formats)
+
+
+# Names of the backends which can be chosen for a run
+backends = ["pandas", "arrow"]
+
+
+def get_backend(backend=None):
+    """
+    Get a calculation backend from its name ("pandas" or "arrow"), backends which are already objects are returned as they are
+
+    The arrow backend needs the `pyarrow` library, which is only imported when it is chosen
+    """
+    if backend is None or backend == "pandas":
+        return PandasBackend()
+    if backend == "arrow":
+        from arrow_backend import ArrowBackend
+        return ArrowBackend()
+    if isinstance(backend, str):
+        raise ValueError(f"Unknown backend {backend}, choose one of {', '.join(backends)}")
+    return backend
+
+
 def total_sales(
     file_path, # File path of input
-    sheet_name, # Worksheet to process
+    sheet_name, # Worksheet to process, or a list of worksheets to process together
     translation_sheet="Language Translation.xlsx", # Translation Source
     already_translated=False, # Check if worksheet is already translated
     output_translations=False, # Output translation as a new worksheet
@@ -16,115 +89,430 @@ def total_sales(
     create_new_spreadsheet=True, # Output data into a new spreadsheet instead
     new_filename="Result.xlsx", # Filepath for new spreadsheet
     new_worksheet="Sheet1", # Name of worksheet in the new spreadsheet
+    translations=None, # Already parsed translations, skips reading the translation source
+    untranslated=None, # Dictionary to fill with the columns and values that could not be translated
+    chunk_size=None, # Read and process the worksheet this many rows at a time to limit memory use
+    use_cache=True, # Reuse parsed worksheets and translations from the local cache
+    output_format="xlsx", # File format of the new spreadsheet and translated raw data (xlsx, csv, parquet or feather)
+    state_file=None, # Save per Resource ID state to this file and only process rows added since the last run
+    run_report=None, # RunReport to record the time, memory use and rows of each stage in
+    progress=None, # Called with the stage name, rows done and total rows (None if unknown) as the report runs
+    cancel=None, # threading.Event which stops the report between chunks of rows when set
+    backend="pandas", # Library which translates and groups the raw data ("pandas" or "arrow"), the report is the same
+    memory_cache=None, # caching.MemoryCache keeping translations and parsed worksheets in memory between runs
+    rollups=False, # Also save totals and subtotals of usage and duration by project, region, resource type and billing method
 ):
     """
-    Calculate total sales from the inputted spreadsheet
-    """
-    # Function to calculate hourly and postpaid sales
-    def hourly_and_postpaid_sales(sales_df):
-        """
-        Calculate hourly and postpaid sales
-        """
-        # Filter out hourly and postpaid sales by getting all non-monthly sales
-        hourly_and_postpaid_df = sales_df[sales_df[billing_method] != monthly]
-
-        # Get the first row in which a particular id appears (Used to get key details and the Order Start Time)
-        first_row = hourly_and_postpaid_df.groupby(resource_id).first().reset_index()
-
-        # Get last row in which the Resource ID appears, used to get overall Order End Time
-        last_row = hourly_and_postpaid_df.groupby(resource_id).last().reset_index()
-
-        # Merge first row data with last row data (Resource ID, Order Type, Order Start Time, Order End Time columns only)
-        merged_df = pd.merge(
-            first_row,
-            last_row[[resource_id, order_type, order_start_time, order_end_time]],
-            on="Resource ID",
-            how="left",
-            suffixes=("_first_row", "_last_row"),
-        )
+    Calculate total sales from the inputted spreadsheet, returning the report (None if only translating)
 
-        # Update Order End Time
-        order_end_overall = order_end_time + "_first_row"
-        last_row_start = order_start_time + "_last_row"
-        last_row_end = order_end_time + "_last_row"
-        last_row_order_type = order_type + "_last_row"
-
-        # If last row is a cancellation, use the last row's Order Start Time (Order Start Time_last) as the overall Order End Time
-        # Else use the last row's Order End Time (Order End Time_last) as the overall Order End Time
-        merged_df[order_end_overall] = merged_df.apply(
-            lambda row: row[last_row_start]
-            if row[last_row_order_type] == delete_refund
-            else row[last_row_end],
-            axis=1,
-        )
+    If `cancel` is set while the report runs, ReportCancelled is raised and partially written files are removed
 
-        # Drop added columns from the merge
-        merged_df = merged_df.drop(
-            [last_row_order_type, last_row_start, last_row_end], axis=1
+    If `sheet_name` is a list, the worksheets are processed together by `total_sales_of_worksheets`
+    """
+    backend = get_backend(backend)
+    if run_report is not None:
+        run_report.details.setdefault("file_path", file_path)
+        run_report.details.setdefault("sheet_name", sheet_name)
+        run_report.details.setdefault("backend", backend.name)
+
+    # Get translations guidelines
+    if translations is None:
+        with measure(run_report, "parse_translations"):
+            translations = load_translations(translation_sheet, use_cache, memory_cache)
+
+    # Process several worksheets together, sharing the opened spreadsheet and the translations
+    if isinstance(sheet_name, (list, tuple)):
+        return total_sales_of_worksheets(
+            file_path,
+            sheet_name,
+            translations,
+            already_translated=already_translated,
+            output_translations=output_translations,
+            translate_only=translate_only,
+            add_to=add_to,
+            worksheet_to_add=worksheet_to_add,
+            create_new_spreadsheet=create_new_spreadsheet,
+            new_filename=new_filename,
+            untranslated=untranslated,
+            chunk_size=chunk_size,
+            use_cache=use_cache,
+            output_format=output_format,
+            state_file=state_file,
+            run_report=run_report,
+            progress=progress,
+            cancel=cancel,
+            backend=backend,
+            memory_cache=memory_cache,
+            rollups=rollups,
         )
 
-        # Rename columns for Start and End Time back to normal
-        merged_df = merged_df.rename(
-            columns={
-                order_start_time + "_first_row": order_start_time,
-                order_end_overall: order_end_time,
-            }
+    # Only process rows added to the worksheet since the last run, on top of the saved per Resource ID state
+    if state_file:
+        if output_translations or translate_only:
+            raise ValueError("Translated raw data cannot be saved when only processing new rows.")
+        with measure(run_report, "read_new_rows") as stage:
+            state = incremental_sales_state(
+                file_path,
+                sheet_name,
+                translations,
+                already_translated,
+                untranslated,
+                state_file,
+                chunk_size if chunk_size else 100000,
+                stage,
+                progress,
+                cancel,
+                backend=backend,
+            )
+        sales_df = None
+    # Stream the worksheet in chunks, only keeping the per Resource ID state in memory
+    elif chunk_size:
+        with measure(run_report, "read_in_chunks") as stage:
+            state = streamed_sales_state(
+                file_path,
+                sheet_name,
+                translations,
+                already_translated,
+                output_translations,
+                translate_only,
+                untranslated,
+                chunk_size,
+                output_format,
+                stage,
+                progress,
+                cancel,
+                backend=backend,
+            )
+        # If user only wants to translate the worksheet, return and exit out of program
+        if translate_only:
+            return
+        sales_df = None
+    # If file is not already translated, translate the worksheet data first
+    elif not already_translated:
+        sales_df = translate_spreadsheet_data(
+            file_path,
+            sheet_name,
+            translations,
+            output_translations,
+            untranslated,
+            use_cache,
+            output_format,
+            run_report,
+            progress,
+            cancel,
+            backend,
+            memory_cache,
         )
+        # If user only wants to translate the worksheet, return and exit out of program
+        if translate_only:
+            return
+    # If file has already been translated, directly read it
+    else:
+        with measure(run_report, "read") as stage:
+            sales_df = read_worksheet(
+                file_path, sheet_name, use_cache, progress, cancel, dtype_plan(translations), memory_cache
+            )
+            stage["rows"] = len(sales_df)
 
-        # Calculate duration in hours rounded off to 2 decimal places.
-        # Convert string columns to datetime
-        merged_df[order_start_time] = pd.to_datetime(merged_df[order_start_time])
-        merged_df[order_end_time] = pd.to_datetime(merged_df[order_end_time])
+    # Calculate hourly and postpaid sales
+    check_cancelled(cancel)
+    with measure(run_report, "hourly_and_postpaid_sales" if sales_df is not None else "finalize_sales_state") as stage:
+        if sales_df is None:
+            report_progress(progress, "calculate", 0, None)
+            output = finalize_sales_state(state, translations)
+            stage["rows"] = len(output)
+        else:
+            report_progress(progress, "calculate", 0, len(sales_df))
+            output = hourly_and_postpaid_sales(sales_df, translations, backend)
+            stage["rows"] = len(sales_df)
+        report_progress(progress, "calculate", stage["rows"], stage["rows"])
 
-        # Calculate the duration in hours
-        merged_df['Duration (Hours)'] = ((merged_df[order_end_time] - merged_df[order_start_time]).dt.total_seconds() / 3600)
+    # Reorganize columns and exclude columns not required for our final output
+    output = output[report_columns(translations)]
 
-        # Get usage amount by summing up the hourly charges for each Resource ID
-        usage_total = (
-            hourly_and_postpaid_df.groupby(resource_id)[usage_amount].sum().reset_index()
-        )
+    rollup = None
+    if rollups:
+        with measure(run_report, "rollups") as stage:
+            rollup = sales_rollup(output, translations)
+            stage["rows"] = len(rollup)
 
-        # Merge total usage amount dataframe
-        final_df = pd.merge(
-            merged_df,
-            usage_total,
-            on=resource_id,
-            how="left",
-            suffixes=("_hourly", "_total"),
-        )
+    if add_to:
+        # Write the DataFrame to a new worksheet, leaving the rest of the spreadsheet untouched
+        # The spreadsheet is replaced in one step, so this is the last point at which the report can be cancelled
+        check_cancelled(cancel)
+        with measure(run_report, "add_to_existing_spreadsheet") as stage:
+            report_progress(progress, "add_to_existing_spreadsheet", 0, len(output))
+            if rollup is not None:
+                append_worksheets(file_path, {worksheet_to_add: output, rollup_worksheet_name(worksheet_to_add): rollup})
+            else:
+                append_worksheet(file_path, output, worksheet_to_add)
+            stage["rows"] = len(output)
+            report_progress(progress, "add_to_existing_spreadsheet", len(output), len(output))
+    
+    if create_new_spreadsheet:
+        # Write the DataFrame to a new worksheet
+        with measure(run_report, "write_new_spreadsheet") as stage:
+            write_in_chunks(
+                output,
+                with_output_format(new_filename, output_format),
+                output_format,
+                new_worksheet,
+                "write_new_spreadsheet",
+                progress,
+                None if add_to else cancel,
+                {rollup_worksheet: rollup} if rollup is not None else None,
+            )
+            stage["rows"] = len(output)
 
-        # Rename columns back to normal
-        final_df = final_df.rename(columns={usage_amount + "_total": usage_amount})
+    return output
 
-        # Drop hourly usage column (there is already a column for unit price)
-        final_df = final_df.drop([usage_amount + "_hourly"], axis=1)
 
-        # Get average Unit Price by dividing Usage Amount by duration
-        final_df[unit_price] = (
-            final_df[usage_amount] / final_df["Duration (Hours)"]
-        )
+def total_sales_of_worksheets(
+    file_path,
+    sheet_names,
+    translations,
+    already_translated=False,
+    output_translations=False,
+    translate_only=False,
+    add_to=False,
+    worksheet_to_add="Monthly Sales Calculation",
+    create_new_spreadsheet=True,
+    new_filename="Result.xlsx",
+    untranslated=None,
+    chunk_size=None,
+    use_cache=True,
+    output_format="xlsx",
+    state_file=None,
+    run_report=None,
+    progress=None,
+    cancel=None,
+    max_workers=None,
+    backend=None,
+    memory_cache=None,
+    rollups=False,
+):
+    """
+    Calculate total sales of several worksheets of the same spreadsheet, returning a dictionary of worksheet name to report
 
-        # Round off duration to 2 decimal places
-        final_df['Duration (Hours)'] = final_df['Duration (Hours)'].round(2)
+    The spreadsheet is hashed and opened once, and its worksheets are read and calculated concurrently in threads.
+    The reports are then written in one pass, as worksheets named after the raw data worksheets in the new
+    spreadsheet (formats holding a single table get one file per worksheet instead), and as worksheets named
+    "<worksheet> - <worksheet_to_add>" in the existing spreadsheet. Translated raw data is saved the same way.
 
-        return final_df
-    
-    # Get translations guidelines
-    translations = parse_translations(translation_sheet)
+    Each worksheet's stages are recorded in the run report's "worksheet_stages" detail, without memory use,
+    as tracemalloc cannot tell apart memory used by different threads.
 
-    # If file is not already translated, translate the worksheet data first
-    if not already_translated:
-        sales_df = translate_spreadsheet_data(
-            file_path, sheet_name, translations, output_translations
-        )
-        # If user only wants to translate the worksheet, return and exit out of program
-        if translate_only:
-            return
-    # If file has already been translated, directly read it
-    else:
-        sales_df = pd.read_excel(file_path, sheet_name)
+    With `rollups`, the rollup of each worksheet's report is saved next to it as "<worksheet> Rollup".
+    """
+    sheet_names = list(dict.fromkeys(sheet_names))
+    backend = get_backend(backend)
+    if state_file and (output_translations or translate_only):
+        raise ValueError("Translated raw data cannot be saved when only processing new rows.")
+    if chunk_size and output_translations and not already_translated:
+        raise ValueError("Translated raw data of several worksheets cannot be saved when reading in chunks.")
+
+    is_zipped = zipfile.is_zipfile(file_path)
+    content_hash = file_hash(file_path) if use_cache else None
+
+    # Rows of every worksheet, to report reading progress over all of them
+    rows_total = {sheet_name: worksheet_rows(file_path, sheet_name) for sheet_name in sheet_names} if progress else {}
+    rows_read = dict.fromkeys(sheet_names, 0)
+    progress_lock = threading.Lock()
+
+    def worksheet_progress(sheet_name):
+        if progress is None:
+            return None
+
+        def send_progress(stage, rows_done, rows):
+            with progress_lock:
+                if stage != "read":
+                    progress(stage, rows_done, rows)
+                    return
+                rows_read[sheet_name] = rows_done
+                totals = list(rows_total.values())
+                progress("read", sum(rows_read.values()), None if None in totals else sum(totals))
+        return send_progress
+
+    plan = dtype_plan(translations)
+
+    with SharedWorkbook(file_path) as workbook:
+        def read(file_path, sheet_name):
+            if not is_zipped:
+                return read_excel(file_path, sheet_name=sheet_name, dtype=read_dtypes(plan))
+            return read_worksheet_in_chunks(
+                file_path, sheet_name, worksheet_progress(sheet_name), cancel, workbook.get(streaming=False), plan
+            )
+
+        def process_worksheet(sheet_name):
+            sheet_untranslated = {}
+            sheet_report = RunReport(trace_memory=False) if run_report is not None else None
+            sheet_progress = worksheet_progress(sheet_name)
+            translated_df = None
+            check_cancelled(cancel)
+
+            if state_file:
+                with measure(sheet_report, "read_new_rows") as stage:
+                    state = incremental_sales_state(
+                        file_path,
+                        sheet_name,
+                        translations,
+                        already_translated,
+                        sheet_untranslated,
+                        worksheet_state_file(state_file, sheet_name),
+                        chunk_size if chunk_size else 100000,
+                        stage,
+                        sheet_progress,
+                        cancel,
+                        workbook.get(),
+                        backend,
+                    )
+                sales_df = None
+            elif chunk_size:
+                with measure(sheet_report, "read_in_chunks") as stage:
+                    state = streamed_sales_state(
+                        file_path,
+                        sheet_name,
+                        translations,
+                        already_translated,
+                        untranslated=sheet_untranslated,
+                        chunk_size=chunk_size,
+                        stats=stage,
+                        progress=sheet_progress,
+                        cancel=cancel,
+                        workbook=workbook.get(),
+                        backend=backend,
+                    )
+                sales_df = None
+            else:
+                def load():
+                    if use_cache:
+                        df = load_cached_worksheet(file_path, sheet_name, read, content_hash)
+                    else:
+                        df = read(file_path, sheet_name)
+                    return apply_dtype_plan(df, plan)
+
+                with measure(sheet_report, "read") as stage:
+                    if memory_cache is not None:
+                        sales_df = memory_cache.load(worksheet_memory_key(file_path, sheet_name, plan), file_path, load)
+                    else:
+                        sales_df = load()
+                    stage["rows"] = len(sales_df)
+                if sheet_progress:
+                    sheet_progress("read", len(sales_df), len(sales_df))
+
+                if not already_translated:
+                    check_cancelled(cancel)
+                    with measure(sheet_report, "translate") as stage:
+                        sales_df = backend.translate(sales_df, translations, sheet_untranslated)
+                        stage["rows"] = len(sales_df)
+                    if output_translations:
+                        translated_df = sales_df
+
+            output = None
+            if not translate_only:
+                check_cancelled(cancel)
+                with measure(sheet_report, "hourly_and_postpaid_sales" if sales_df is not None else "finalize_sales_state") as stage:
+                    if sales_df is None:
+                        output = finalize_sales_state(state, translations)
+                        stage["rows"] = len(output)
+                    else:
+                        output = hourly_and_postpaid_sales(sales_df, translations, backend)
+                        stage["rows"] = len(sales_df)
+                output = output[report_columns(translations)]
+
+                if rollups:
+                    with measure(sheet_report, "rollups") as stage:
+                        rollup = sales_rollup(output, translations)
+                        stage["rows"] = len(rollup)
+                    output = (output, rollup)
+
+            return sheet_name, output, translated_df, sheet_untranslated, sheet_report
 
-    # Get english translation for the particular column names and values required for our calculations
+        report_progress(progress, "read", 0, None)
+        with measure(run_report, "process_worksheets") as stage:
+            workers = max_workers if max_workers else min(len(sheet_names), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+                results = list(executor.map(process_worksheet, sheet_names))
+            stage["rows"] = len(results)
+
+    # Gather the untranslated columns and values and the stages of every worksheet
+    for sheet_name, _, _, sheet_untranslated, sheet_report in results:
+        if untranslated is not None:
+            untranslated.setdefault("missing_columns", [])
+            untranslated.setdefault("values", {})
+            for col in sheet_untranslated.get("missing_columns", []):
+                if col not in untranslated["missing_columns"]:
+                    untranslated["missing_columns"].append(col)
+            for col, values in sheet_untranslated.get("values", {}).items():
+                for value in values:
+                    if value not in untranslated["values"].setdefault(col, []):
+                        untranslated["values"][col].append(value)
+        if sheet_report is not None:
+            run_report.details.setdefault("worksheet_stages", {})[str(sheet_name)] = sheet_report.stages
+
+    translated = {str(sheet_name): df for sheet_name, _, df, _, _ in results if df is not None}
+    if translated:
+        check_cancelled(cancel)
+        with measure(run_report, "write_translations") as stage:
+            write_dataframes(translated, translation_output_path(file_path, output_format), output_format)
+            stage["rows"] = sum(len(df) for df in translated.values())
+
+    if translate_only:
+        return
+
+    outputs = {}
+    rollup_outputs = {}
+    for sheet_name, output, _, _, _ in results:
+        if rollups:
+            output, rollup_outputs[str(sheet_name)] = output
+        outputs[str(sheet_name)] = output
+
+    def with_rollups(worksheets):
+        # Each report followed by its rollup
+        named = {}
+        for sheet_name, output in worksheets.items():
+            named[sheet_name] = outputs[output]
+            if output in rollup_outputs:
+                named[rollup_worksheet_name(sheet_name)] = rollup_outputs[output]
+        return named
+
+    if add_to:
+        # Add every report to the existing spreadsheet in one pass, this is the last point at which the report can be cancelled
+        check_cancelled(cancel)
+        with measure(run_report, "add_to_existing_spreadsheet") as stage:
+            append_worksheets(
+                file_path,
+                with_rollups({f"{sheet_name} - {worksheet_to_add}"[:31]: sheet_name for sheet_name in outputs}),
+            )
+            stage["rows"] = sum(len(output) for output in outputs.values())
+
+    if create_new_spreadsheet:
+        if not add_to:
+            check_cancelled(cancel)
+        with measure(run_report, "write_new_spreadsheet") as stage:
+            report_progress(progress, "write_new_spreadsheet", 0, None)
+            write_dataframes(
+                with_rollups({sheet_name: sheet_name for sheet_name in outputs}),
+                with_output_format(new_filename, output_format),
+                output_format,
+            )
+            stage["rows"] = sum(len(output) for output in outputs.values())
+
+    return outputs
+
+
+def worksheet_state_file(state_file, sheet_name):
+    """
+    State file of one worksheet when several worksheets are processed together
+    """
+    stem, extension = os.path.splitext(state_file)
+    return f"{stem}_{sheet_name}{extension}"
+
+
+def report_columns(translations):
+    """
+    Columns of the final report, in order
+    """
     (
         project_id,
         resource_id,
@@ -140,71 +528,860 @@ def total_sales(
         usage_amount,
         monthly,
         delete_refund
-    ) = [
+    ) = important_variables(translations)
+
+    return [
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_start_time,
+        order_end_time,
+        "Duration (Hours)",
+        unit_price,
+        usage_amount,
+    ]
+
+
+def rollup_worksheet_name(sheet_name):
+    """
+    Name of the worksheet holding the rollup of a report saved in `sheet_name`, within Excel's limit of 31 characters
+    """
+    suffix = " " + rollup_worksheet
+    return str(sheet_name)[:31 - len(suffix)] + suffix
+
+
+def sales_rollup(report, translations):
+    """
+    Totals and subtotals of the usage amount, duration and number of resources of a report, for every combination
+    of project, region, resource type and billing method (including the grand total)
+
+    The finest combination is grouped from the report, one row per Resource ID, and every coarser one from it,
+    so the raw data is not read again. Columns which are rolled up hold "All", and the "Grouped By" column lists
+    the columns each row is grouped by.
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    dimensions = [project_id, region, resource_type, billing_method]
+    duration = "Duration (Hours)"
+    measures = [usage_amount, duration, "Resources"]
+
+    finest = (
+        report.assign(Resources=1)
+        .groupby(dimensions, observed=True, dropna=False)[measures]
+        .sum()
+        .reset_index()
+    )
+    # Plain values so that rolled up columns can hold the rollup label
+    finest[dimensions] = finest[dimensions].astype(object)
+
+    rollups = []
+    for size in range(len(dimensions) + 1):
+        for grouped in itertools.combinations(dimensions, size):
+            if grouped:
+                rollup = finest.groupby(list(grouped), dropna=False)[measures].sum().reset_index()
+            else:
+                rollup = finest[measures].sum().to_frame().T
+            for col in dimensions:
+                if col not in grouped:
+                    rollup[col] = rollup_total
+            rollup.insert(0, "Grouped By", " + ".join(grouped) if grouped else "Grand Total")
+            rollups.append(rollup)
+
+    rollup = pd.concat(rollups, ignore_index=True)[["Grouped By"] + dimensions + measures]
+    rollup[duration] = rollup[duration].astype(float).round(2)
+    rollup["Resources"] = rollup["Resources"].astype("int64")
+    return rollup
+
+
+def report_progress(progress, stage, rows_done, rows_total=None):
+    """
+    Send the progress of a stage to the progress callback, if there is one
+    """
+    if progress is not None:
+        progress(stage, rows_done, rows_total)
+
+
+def check_cancelled(cancel):
+    """
+    Stop the report by raising ReportCancelled if it has been cancelled
+    """
+    if cancel is not None and cancel.is_set():
+        raise ReportCancelled("Report cancelled")
+
+
+def worksheet_rows(file_path, sheet_name):
+    """
+    Number of rows below the header of a worksheet, from the dimension stored in the spreadsheet (None if unknown)
+    """
+    try:
+        worksheets = list_worksheets(file_path)
+    except Exception:
+        return None
+
+    if isinstance(sheet_name, int):
+        matches = worksheets[sheet_name:sheet_name + 1]
+    else:
+        matches = [worksheet for worksheet in worksheets if worksheet[0] == sheet_name]
+    if not matches or matches[0][1] is None:
+        return None
+    return max(matches[0][1] - 1, 0)
+
+
+def write_in_chunks(df, file_path, output_format, sheet_name, stage, progress=None, cancel=None, extra_worksheets=None):
+    """
+    Write a DataFrame into a new file a chunk of rows at a time, reporting progress and checking for cancellation
+    between chunks. The file is removed if writing does not finish.
+
+    Small DataFrames in `extra_worksheets` (a dictionary of worksheet name to DataFrame) are written after it, as further
+    worksheets of Excel files or as files named after the worksheet for other formats
+    """
+    extra_worksheets = extra_worksheets or {}
+    file_paths = [file_path]
+    if output_format != "xlsx":
+        file_paths += [worksheet_output_path(file_path, name, output_format) for name in extra_worksheets]
+
+    try:
+        with open_chunk_writer(file_path, output_format, sheet_name) as writer:
+            # An empty DataFrame is still written once for its header
+            for start in range(0, max(len(df), 1), progress_chunk_size):
+                check_cancelled(cancel)
+                writer.write(df.iloc[start:start + progress_chunk_size])
+                report_progress(progress, stage, min(start + progress_chunk_size, len(df)), len(df))
+
+            if output_format == "xlsx":
+                for name, extra_df in extra_worksheets.items():
+                    writer.add_worksheet(name)
+                    writer.write(extra_df)
+
+        for (name, extra_df), extra_path in zip(extra_worksheets.items(), file_paths[1:]):
+            check_cancelled(cancel)
+            write_dataframe(extra_df, extra_path, output_format)
+    except BaseException:
+        for path in file_paths:
+            if os.path.exists(path):
+                os.remove(path)
+        raise
+
+
+def important_variables(translations):
+    """
+    Get english translation for the column names and values required for our calculations
+    """
+    return [
         val
         for val in translations[translated_col_and_values_sheet].values()
         ]
 
-    # Calculate hourly and postpaid sales
-    output = hourly_and_postpaid_sales(sales_df)
 
-    # Reorganize columns and exclude columns not required for our final output
-    output = output[
-        [
-            project_id,
-            resource_id,
-            resource_name,
-            resource_type,
-            region,
-            billing_method,
-            configuration,
-            order_start_time,
-            order_end_time,
-            "Duration (Hours)",
-            unit_price,
-            usage_amount,
-        ]
-    ]
+def hourly_and_postpaid_sales(sales_df, translations, backend=None):
+    """
+    Calculate hourly and postpaid sales
 
-    if add_to:
-        with pd.ExcelWriter(file_path, engine="openpyxl", mode="a") as writer:
-            # Write the DataFrame to a new worksheet
-            output.to_excel(writer, sheet_name=worksheet_to_add, index=False)
-    
-    if create_new_spreadsheet:
-        with pd.ExcelWriter(new_filename, engine="openpyxl") as writer:
-            # Write the DataFrame to a new worksheet
-            output.to_excel(writer, sheet_name=new_worksheet, index=False)
+    All per Resource ID details are gathered in a single grouped pass over the data, by the pandas backend unless another `backend` is given
+    """
+    return finalize_sales_state(get_backend(backend).sales_state(sales_df, translations), translations)
+
+
+def sales_state(sales_df, translations, timestamp_formats=None):
+    """
+    Get the per Resource ID state of hourly and postpaid sales
+
+    In one pass, get the first row in which a particular id appears (key details and the Order Start Time),
+    the last row's Order Type, Start and End Time (used to get overall Order End Time) and the total usage amount.
+    States of consecutive chunks of rows can be merged with `combine_sales_states`.
+
+    Order Start and End Times are parsed before grouping, so the state holds timestamps rather than strings.
+    Chunks of the same worksheet share a `timestamp_formats` dictionary, see `parse_timestamps`.
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    # Filter out hourly and postpaid sales by getting all non-monthly sales
+    hourly_and_postpaid_df = sales_df[sales_df[billing_method] != monthly]
+    hourly_and_postpaid_df = hourly_and_postpaid_df.assign(
+        **{
+            order_start_time: parse_timestamps(hourly_and_postpaid_df[order_start_time], timestamp_formats),
+            order_end_time: parse_timestamps(hourly_and_postpaid_df[order_end_time], timestamp_formats),
+        }
+    )
+
+    aggregations = {
+        col: (col, "first")
+        for col in hourly_and_postpaid_df.columns
+        if col not in [resource_id, usage_amount]
+    }
+    aggregations[order_type + "_last_row"] = (order_type, "last")
+    aggregations[order_start_time + "_last_row"] = (order_start_time, "last")
+    aggregations[order_end_time + "_last_row"] = (order_end_time, "last")
+    aggregations[usage_amount] = (usage_amount, "sum")
+
+    return hourly_and_postpaid_df.groupby(resource_id, observed=True).agg(**aggregations)
+
+
+def streamed_sales_state(
+    file_path,
+    sheet_name,
+    translations,
+    already_translated=False,
+    output_translations=False,
+    translate_only=False,
+    untranslated=None,
+    chunk_size=100000,
+    output_format="xlsx",
+    stats=None,
+    progress=None,
+    cancel=None,
+    workbook=None,
+    backend=None,
+):
+    """
+    Read the worksheet in chunks of rows, translating each chunk and merging its per Resource ID state into the running state
 
+    Peak memory is bounded by the chunk size plus the number of distinct Resource IDs.
+    If a `stats` dictionary is given, its "rows" is set to the number of rows read.
+    The translated raw data is removed if the run is cancelled or fails before it is fully written.
+    """
+    backend = get_backend(backend)
+    if stats is None:
+        stats = {}
+    stats["rows"] = 0
+    rows_total = worksheet_rows(file_path, sheet_name) if progress else None
+    report_progress(progress, "read", 0, rows_total)
+
+    state = None
+    # Timestamp formats detected in the first chunk, used for the rest of the worksheet
+    timestamp_formats = {}
+    writer = None
+    output_path = translation_output_path(file_path, output_format)
+    if output_translations and not already_translated:
+        writer = open_chunk_writer(output_path, output_format)
+
+    try:
+        for chunk in read_excel_chunks(file_path, sheet_name, chunk_size, workbook=workbook):
+            check_cancelled(cancel)
+            stats["rows"] += len(chunk)
+            if not already_translated:
+                chunk = backend.translate(chunk, translations, untranslated)
+            if writer:
+                writer.write(chunk)
+            if not translate_only:
+                state = combine_sales_states(
+                    [state, backend.sales_state(chunk, translations, timestamp_formats)], translations
+                )
+            report_progress(progress, "read", stats["rows"], rows_total)
+    except BaseException:
+        if writer:
+            writer.close()
+            os.remove(output_path)
+        raise
+
+    if writer:
+        writer.close()
+    return state
+
+
+def incremental_sales_state(
+    file_path,
+    sheet_name,
+    translations,
+    already_translated=False,
+    untranslated=None,
+    state_file="sales_state.pickle",
+    chunk_size=100000,
+    stats=None,
+    progress=None,
+    cancel=None,
+    workbook=None,
+    backend=None,
+):
+    """
+    Merge rows added to the worksheet since the last run into the per Resource ID state saved in `state_file`
+
+    The saved state is only used if it was made with the same worksheet and translations, and the rows processed
+    last time are unchanged, which is checked against a hash of every row processed. Otherwise every row is processed
+    again. Every row is read either way, but rows processed last time are only hashed, not translated or grouped.
+    The new state is saved for the next run.
+    If a `stats` dictionary is given, its "rows" is set to the number of rows processed in this run.
+    """
+    fingerprint = {
+        # Changed whenever the saved state holds different data, so that older states are not merged with newer ones
+        "version": 3,
+        "sheet_name": str(sheet_name),
+        "already_translated": already_translated,
+        "translations": hashlib.sha256(pickle.dumps(translations)).hexdigest(),
+    }
+    saved = load_sales_state(state_file, fingerprint)
+    rows_total = worksheet_rows(file_path, sheet_name) if progress else None
+
+    result = None
+    rows_before = 0
+    if saved:
+        rows_digest = hashlib.sha256()
+        chunks = read_excel_chunks(file_path, sheet_name, chunk_size, workbook=workbook)
+        rows, columns, new_chunks = hash_processed_rows(chunks, saved["rows"], rows_digest)
+        if rows == saved["rows"] and columns == saved["columns"] and rows_digest.hexdigest() == saved["rows_hash"]:
+            result = fold_sales_chunks(
+                new_chunks,
+                translations,
+                already_translated,
+                untranslated,
+                saved,
+                progress,
+                cancel,
+                rows_total,
+                backend,
+                rows_digest,
+            )
+            rows_before = saved["rows"]
+        else:
+            chunks.close()
+            print("Worksheet has changed since the last run, processing all rows...")
 
-def parse_translations(file_path="Language Translation.xlsx"):
+    if result is None:
+        result = fold_sales_chunks(
+            read_excel_chunks(file_path, sheet_name, chunk_size, workbook=workbook),
+            translations,
+            already_translated,
+            untranslated,
+            None,
+            progress,
+            cancel,
+            rows_total,
+            backend,
+            hashlib.sha256(),
+        )
+
+    save_sales_state(state_file, dict(result, fingerprint=fingerprint))
+
+    if stats is not None:
+        stats["rows"] = result["rows"] - rows_before
+
+    return result["state"]
+
+
+def hash_processed_rows(chunks, rows, rows_digest):
+    """
+    Add the first `rows` rows of chunks of a worksheet to a hash, without processing them
+
+    Returns the number of rows hashed, the header and the chunks of the rows after them
+    """
+    rows_hashed = 0
+    columns = None
+    for chunk in chunks:
+        columns = list(chunk.columns)
+        processed = chunk.iloc[:rows - rows_hashed]
+        update_rows_digest(rows_digest, processed)
+        rows_hashed += len(processed)
+        if rows_hashed >= rows:
+            return rows_hashed, columns, itertools.chain([chunk.iloc[len(processed):]], chunks)
+    return rows_hashed, columns, iter(())
+
+
+def fold_sales_chunks(
+    chunks,
+    translations,
+    already_translated=False,
+    untranslated=None,
+    saved=None,
+    progress=None,
+    cancel=None,
+    rows_total=None,
+    backend=None,
+    rows_digest=None,
+):
+    """
+    Translate chunks of rows and merge them into a saved per Resource ID state (or a new state)
+
+    Returns the state with the number of rows processed, the header, the timestamp formats of the worksheet
+    (which are used again for rows added later) and, if a `rows_digest` is given, the hash of every row
+    processed so far after adding the rows of the chunks to it
+    """
+    backend = get_backend(backend)
+    result = saved if saved else {"state": None, "rows": 0, "columns": None}
+    result = {key: result[key] for key in ["state", "rows", "columns"]}
+    # States saved before timestamp formats were kept detect them again
+    result["timestamp_formats"] = dict(saved.get("timestamp_formats", {})) if saved else {}
+    report_progress(progress, "read", result["rows"], rows_total)
+
+    for chunk in chunks:
+        check_cancelled(cancel)
+        if chunk.empty:
+            continue
+        result["rows"] += len(chunk)
+        result["columns"] = list(chunk.columns)
+        if rows_digest is not None:
+            update_rows_digest(rows_digest, chunk)
+
+        if not already_translated:
+            chunk = backend.translate(chunk, translations, untranslated)
+        result["state"] = combine_sales_states(
+            [result["state"], backend.sales_state(chunk, translations, result["timestamp_formats"])], translations
+        )
+        report_progress(progress, "read", result["rows"], rows_total)
+
+    if rows_digest is not None:
+        result["rows_hash"] = rows_digest.hexdigest()
+    return result
+
+
+def update_rows_digest(rows_digest, df):
+    """
+    Add the rows of a DataFrame to a hash of the rows of a worksheet, in order
+
+    Each row is hashed on its own, so the hash does not depend on how the rows were split into chunks. Values are
+    hashed as text, with numbers as floats and missing values as empty text, as the type of a column depends on
+    the other rows read in the same chunk.
+    """
+    if df.empty:
+        return
+    text = {}
+    for col in df.columns:
+        values = df[col]
+        if pd.api.types.is_bool_dtype(values):
+            text[col] = values.astype(str)
+        elif pd.api.types.is_numeric_dtype(values):
+            text[col] = values.astype("float64").astype(str)
+        else:
+            numbers = pd.to_numeric(values, errors="coerce") if values.dtype == object else None
+            text[col] = values.astype(str)
+            if numbers is not None and numbers.notna().any():
+                text[col] = text[col].where(numbers.isna(), numbers.astype(str))
+        text[col] = text[col].where(values.notna(), "")
+    row_hashes = pd.util.hash_pandas_object(pd.DataFrame(text), index=False)
+    rows_digest.update(row_hashes.to_numpy().tobytes())
+
+
+def load_sales_state(state_file, fingerprint):
+    """
+    Load the per Resource ID state saved by the last run, if it was made with the same worksheet and translations
+    """
+    try:
+        with open(state_file, "rb") as file:
+            saved = pickle.load(file)
+    except (OSError, pickle.PickleError, EOFError, AttributeError, ValueError):
+        return None
+
+    if saved.get("fingerprint") != fingerprint or saved.get("rows", 0) <= 0:
+        return None
+    return saved
+
+
+def save_sales_state(state_file, result):
+    """
+    Save the per Resource ID state for the next run
+    """
+    folder = os.path.dirname(os.path.abspath(state_file))
+    os.makedirs(folder, exist_ok=True)
+    atomic_write_bytes(os.path.abspath(state_file), pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL))
+
+
+def combine_sales_states(states, translations):
+    """
+    Merge per Resource ID states of consecutive chunks of rows (in the order the rows appear) into one state
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    states = [state for state in states if state is not None]
+    if len(states) == 1:
+        return states[0]
+
+    combined_df = pd.concat(states)
+
+    # First of the first rows, last of the last rows and sum of the usage amounts
+    aggregations = {col: "first" for col in combined_df.columns}
+    for col in [order_type, order_start_time, order_end_time]:
+        aggregations[col + "_last_row"] = "last"
+    aggregations[usage_amount] = "sum"
+
+    return combined_df.groupby(level=0, observed=True).agg(aggregations)
+
+
+def finalize_sales_state(state, translations):
+    """
+    Calculate duration and average unit price of each Resource ID from its state
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    final_df = state.reset_index()
+
+    # Column names for the details taken from the last row in which a Resource ID appears
+    last_row_order_type = order_type + "_last_row"
+    last_row_start = order_start_time + "_last_row"
+    last_row_end = order_end_time + "_last_row"
+
+    # If last row is a cancellation, use the last row's Order Start Time as the overall Order End Time
+    # Else use the last row's Order End Time as the overall Order End Time
+    final_df[order_end_time] = final_df[last_row_end].where(
+        final_df[last_row_order_type] != delete_refund, final_df[last_row_start]
+    )
+
+    # Drop columns only needed to get the overall Order End Time
+    final_df = final_df.drop(
+        [last_row_order_type, last_row_start, last_row_end], axis=1
+    )
+
+    # Calculate duration in hours rounded off to 2 decimal places.
+    # Times are parsed by `sales_state`, this only parses times in states saved before they were
+    final_df[order_start_time] = parse_timestamps(final_df[order_start_time])
+    final_df[order_end_time] = parse_timestamps(final_df[order_end_time])
+
+    # Calculate the duration in hours
+    final_df['Duration (Hours)'] = ((final_df[order_end_time] - final_df[order_start_time]).dt.total_seconds() / 3600)
+
+    # Get average Unit Price by dividing Usage Amount by duration
+    final_df[unit_price] = (
+        final_df[usage_amount] / final_df["Duration (Hours)"]
+    )
+
+    # Round off duration to 2 decimal places
+    final_df['Duration (Hours)'] = final_df['Duration (Hours)'].round(2)
+
+    return final_df
+
+def parse_translations(file_path="Language Translation.xlsx", use_cache=True):
     """
     Read translations spreadsheet into a dictionary
 
     Each worksheet's name is a key to a dictionary where the Chinese phrases are mapped to the English translation
+
+    The compiled dictionaries are cached on disk and reused until the translations spreadsheet changes
     """
-    spreadsheet = pd.ExcelFile(file_path)
+    if use_cache:
+        return load_cached_translations(file_path, read_translations)
+    return read_translations(file_path)
+
+
+def load_translations(file_path, use_cache=True, memory_cache=None):
+    """
+    Parse the translations spreadsheet, reusing the translations kept in `memory_cache` if it is given
+    """
+    if memory_cache is None:
+        return parse_translations(file_path, use_cache)
+    return memory_cache.load(
+        ("translations", os.path.abspath(file_path)),
+        file_path,
+        lambda: parse_translations(file_path, use_cache),
+    )
+
+
+def read_translations(file_path):
+    """
+    Read every worksheet of the translations spreadsheet once and map the first column to the second
+    """
+    worksheets = read_excel(file_path, sheet_name=None)
 
     return {
-        sheet: dict(
-            zip(
-                spreadsheet.parse(sheet).iloc[:, 0], spreadsheet.parse(sheet).iloc[:, 1]
-            )
+        sheet: dict(zip(df.iloc[:, 0], df.iloc[:, 1]))
+        for sheet, df in worksheets.items()
+    }
+
+
+def read_worksheet(file_path, sheet_name, use_cache=True, progress=None, cancel=None, plan=None, memory_cache=None):
+    """
+    Read a worksheet into a DataFrame, reusing the parsed worksheet from the cache if the spreadsheet is unchanged
+
+    If a `progress` callback or `cancel` event is given, the worksheet is read in chunks of rows so that
+    progress can be reported and the read stopped part way through
+
+    Columns named in the dtype `plan` (see `dtype_plan`) are given their compact dtype as they are parsed
+
+    If a `memory_cache` is given, worksheets parsed by earlier runs in the same process are reused from memory
+    """
+    if plan is None:
+        plan = {}
+
+    if memory_cache is not None:
+        df = memory_cache.load(
+            worksheet_memory_key(file_path, sheet_name, plan),
+            file_path,
+            lambda: read_worksheet(file_path, sheet_name, use_cache, progress, cancel, plan),
         )
-        for sheet in spreadsheet.sheet_names
+        report_progress(progress, "read", len(df), len(df))
+        return df
+
+    if progress is None and cancel is None:
+        def read(file_path, sheet_name):
+            return read_excel(file_path, sheet_name=sheet_name, dtype=read_dtypes(plan))
+    else:
+        def read(file_path, sheet_name):
+            return read_worksheet_in_chunks(file_path, sheet_name, progress, cancel, plan=plan)
+
+    report_progress(progress, "read", 0, None)
+    if use_cache:
+        df = load_cached_worksheet(file_path, sheet_name, read)
+    else:
+        df = read(file_path, sheet_name)
+    # Only converts the columns that are not compact yet, such as those of worksheets cached before the plan was used
+    return apply_dtype_plan(df, plan)
+
+
+def prefetch_worksheets(
+    file_path,
+    sheet_names,
+    translation_sheet,
+    memory_cache=None,
+    use_cache=True,
+    progress=None,
+    cancel=None,
+):
+    """
+    Read worksheets ahead of a report into the worksheet cache (and into `memory_cache` if given), so that
+    total_sales run later with the same translations finds them already parsed, even in another process
+
+    A report started in the same process with the same `memory_cache` while a worksheet is still being read
+    waits for this read instead of starting another one
+    """
+    translations = load_translations(translation_sheet, use_cache, memory_cache)
+    plan = dtype_plan(translations)
+    for sheet_name in sheet_names:
+        check_cancelled(cancel)
+        read_worksheet(file_path, sheet_name, use_cache, progress, cancel, plan, memory_cache)
+
+
+def worksheet_memory_key(file_path, sheet_name, plan):
+    """
+    Key of a parsed worksheet in a `caching.MemoryCache`, worksheets parsed with different dtype plans are kept apart
+    """
+    return ("worksheet", os.path.abspath(file_path), sheet_name, tuple(sorted(plan.items())))
+
+
+def read_worksheet_in_chunks(file_path, sheet_name, progress=None, cancel=None, workbook=None, plan=None):
+    """
+    Read a whole worksheet a chunk of rows at a time, reporting progress and checking for cancellation between chunks
+
+    Each chunk is given the compact dtypes of the `plan` before the chunks are joined
+    """
+    if plan is None:
+        plan = {}
+
+    rows_total = worksheet_rows(file_path, sheet_name) if progress else None
+    report_progress(progress, "read", 0, rows_total)
+
+    chunks = []
+    rows = 0
+    for chunk in read_excel_chunks(file_path, sheet_name, progress_chunk_size, workbook=workbook, streaming=False):
+        check_cancelled(cancel)
+        chunks.append(apply_dtype_plan(chunk, plan))
+        rows += len(chunk)
+        report_progress(progress, "read", rows, rows_total)
+
+    # Worksheets without any rows below the header
+    if not chunks:
+        return read_excel(file_path, sheet_name=sheet_name)
+    return concat_chunks(chunks)
+
+
+def dtype_plan(translations):
+    """
+    Compact dtype of each column used in the calculations, derived from the "IMPT VARS - DO NOT DELETE" worksheet
+
+    Text columns with values repeated on many rows become categoricals, usage amounts are checked to be numbers and
+    unit prices are converted to numbers. Columns are listed under their English name and under each raw data name translated to it in "Header".
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    plan = {
+        col: category
+        for col in [project_id, resource_id, resource_name, resource_type, region, billing_method, configuration, order_type]
     }
+    plan[unit_price] = price
+    plan[usage_amount] = amount
+
+    for raw_col, english_col in translations.get("Header", {}).items():
+        if english_col in plan:
+            plan.setdefault(raw_col, plan[english_col])
+    return plan
 
 
 def translate_spreadsheet_data(
-    file_path, sheet_name, translations, output_translations=False
+    file_path,
+    sheet_name,
+    translations,
+    output_translations=False,
+    untranslated=None,
+    use_cache=True,
+    output_format="xlsx",
+    run_report=None,
+    progress=None,
+    cancel=None,
+    backend=None,
+    memory_cache=None,
 ):
     """
     Takes in a spreadsheet file and a worksheet name, then using a translation guide, translate the values in the rows and columns.
 
-    User can output the data into the worksheet using `output_translations`
+    User can output the data into the worksheet using `output_translations`, saved in the `output_format` file format
+
+    If an `untranslated` dictionary is given, it is filled with the values and columns that could not be translated
     """
     # Open sheet to translate
-    untranslated_df = pd.read_excel(file_path, sheet_name=sheet_name)
+    with measure(run_report, "read") as stage:
+        untranslated_df = read_worksheet(
+            file_path, sheet_name, use_cache, progress, cancel, dtype_plan(translations), memory_cache
+        )
+        stage["rows"] = len(untranslated_df)
+
+    check_cancelled(cancel)
+    with measure(run_report, "translate") as stage:
+        report_progress(progress, "translate", 0, len(untranslated_df))
+        translated_df = get_backend(backend).translate(untranslated_df, translations, untranslated)
+        stage["rows"] = len(translated_df)
+        report_progress(progress, "translate", len(translated_df), len(translated_df))
+
+    # If user specifies to output translations, create a new spreadsheet containing the translated raw data
+    if output_translations:
+        # Write to excel
+        with measure(run_report, "write_translations") as stage:
+            write_in_chunks(
+                translated_df,
+                translation_output_path(file_path, output_format),
+                output_format,
+                "Sheet1",
+                "write_translations",
+                progress,
+                cancel,
+            )
+            stage["rows"] = len(translated_df)
+
+    return translated_df
+
+
+def translation_output_path(file_path, output_format="xlsx"):
+    """
+    Filepath to save translation output
+    """
+    return with_output_format(
+        os.path.join(os.path.dirname(file_path), "en_" + os.path.basename(file_path)), output_format
+    )
+
+
+def output_paths(options):
+    """
+    Filepaths written by total_sales when it is called with `options`
+    """
+    defaults = {
+        name: parameter.default
+        for name, parameter in inspect.signature(total_sales).parameters.items()
+        if parameter.default is not inspect.Parameter.empty
+    }
+    options = dict(defaults, **options)
+    output_format = options["output_format"]
+    sheet_names = options["sheet_name"] if isinstance(options["sheet_name"], list) else None
+
+    def paths(file_path, rollups=False):
+        if output_format == "xlsx":
+            return [file_path]
+        if not sheet_names:
+            rollup_paths = [worksheet_output_path(with_output_format(file_path, output_format), rollup_worksheet, output_format)]
+            return [with_output_format(file_path, output_format)] + (rollup_paths if rollups else [])
+        worksheets = []
+        for sheet_name in sheet_names:
+            worksheets += [sheet_name, rollup_worksheet_name(sheet_name)] if rollups else [sheet_name]
+        return [worksheet_output_path(file_path, sheet_name, output_format) for sheet_name in worksheets]
+
+    outputs = []
+    if options["output_translations"] or options["translate_only"]:
+        outputs += paths(translation_output_path(options["file_path"], output_format))
+    if not options["translate_only"]:
+        if options["add_to"]:
+            outputs.append(options["file_path"])
+        if options["create_new_spreadsheet"]:
+            outputs += paths(options["new_filename"], options["rollups"])
+    return outputs
+
+
+def translate_dataframe(untranslated_df, translations, untranslated=None):
+    """
+    Translate the values in the columns with a translation worksheet, then rename the header titles
+
+    Each column is factorized into integer codes so that only its unique values are looked up in the translation guide.
+
+    If an `untranslated` dictionary is given, it is filled in with
+    - "missing_columns": translation worksheets without a matching column in the data
+    - "values": the unique values of each column that have no English translation
+    """
+    if untranslated is None:
+        untranslated = {}
+    untranslated.setdefault("missing_columns", [])
+    untranslated.setdefault("values", {})
 
     # Replace column values with their english translation
     cols_to_translate = [
@@ -213,24 +1390,62 @@ def translate_spreadsheet_data(
         if worksheet not in [translated_col_and_values_sheet, "Header"]
         ]
 
+    translated_df = untranslated_df.copy(deep=False)
+
     for col in cols_to_translate:
-        try:
-            untranslated_df.replace({col: translations[col]}, inplace=True)
-        except KeyError:
-            print(f"Values in column {col} not translated!")
+        if col not in translated_df.columns:
+            untranslated["missing_columns"].append(col)
+            continue
+
+        translated_df[col], missing_values = translate_column(translated_df[col], translations[col])
+
+        # Only list each value once when chunks of the same worksheet are translated
+        for value in missing_values:
+            if value not in untranslated["values"].setdefault(col, []):
+                untranslated["values"][col].append(value)
 
     # Rename header titles
-    untranslated_df.rename(columns=translations["Header"], inplace=True)
+    return translated_df.rename(columns=translations["Header"])
 
-    # If user specifies to output translations, create a new spreadsheet containing the translated raw data
-    if output_translations:
-        # Filepath to save translation output
-        new_file_path = os.path.join(os.path.dirname(file_path), "en_" + os.path.basename(file_path))
 
-        # Write to excel
-        with pd.ExcelWriter(new_file_path, engine="openpyxl", mode="w") as writer:
-            untranslated_df.to_excel(
-                writer, sheet_name="Sheet1", index=False
-            )
+def translate_column(column, translation):
+    """
+    Map the unique values of a column through the translation, returning the translated column and the values without a translation
+
+    Only the categories of categorical columns are translated, and the column is kept categorical
+    """
+    is_categorical = isinstance(column.dtype, pd.CategoricalDtype)
+    if is_categorical:
+        codes, uniques = column.cat.codes.to_numpy(), column.cat.categories
+    else:
+        codes, uniques = pd.factorize(column)
+
+    english_values = set(translation.values())
+    translated_uniques = []
+    missing_values = []
+    for value in uniques:
+        if value in translation:
+            translated_uniques.append(translation[value])
+        else:
+            translated_uniques.append(value)
+            # Values which are already in English do not need a translation
+            if value not in english_values:
+                missing_values.append(value)
+
+    # Nothing to translate, keep the column as it is
+    if len(missing_values) == len(uniques):
+        return column, missing_values
+
+    # Categories can be renamed as long as no two of them have the same translation
+    if (
+        is_categorical
+        and len(set(translated_uniques)) == len(translated_uniques)
+        and not pd.isna(translated_uniques).any()
+    ):
+        translated = pd.Categorical.from_codes(codes, categories=translated_uniques)
+        return pd.Series(translated, index=column.index, name=column.name), missing_values
 
-    return untranslated_df
+    # Rebuild the column from the codes, the NaN added at the end is picked up by missing values (code -1)
+    translated_uniques = np.array(translated_uniques + [np.nan], dtype=object)
+    translated = pd.Series(translated_uniques.take(codes), index=column.index, name=column.name).infer_objects()
+    return (translated.astype("category") if is_categorical else translated), missing_values
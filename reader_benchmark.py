@@ -0,0 +1,109 @@
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+import pandas as pd
+from excel_io import calamine_streaming_max_mb, excel_engine, installed_engines, read_excel, read_excel_chunks
+from generate_sample_data import generate_sample_data
+from monthly_sales_calculations import dtype_plan, parse_translations, read_dtypes
+
+try:
+    import resource
+except ImportError:
+    # Peak memory is not measured on Windows
+    resource = None
+
+# Ways a worksheet is read by total_sales: whole with pandas, or streamed a chunk of rows at a time
+read_modes = ["whole", "streamed"]
+
+
+def peak_memory_mb():
+    """
+    Peak memory of this process, including memory used outside Python (such as by calamine), None if unknown
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+
+def time_read(file_path, sheet_name, engine, mode, plan):
+    """
+    Read a worksheet with an engine, returning the time taken, peak memory, rows and a hash of the values read
+    """
+    start = time.perf_counter()
+    if mode == "whole":
+        df = read_excel(file_path, sheet_name=sheet_name, engine=engine, dtype=read_dtypes(plan))
+        rows = len(df)
+        values_hash = int(pd.util.hash_pandas_object(df.astype(str), index=False).sum())
+    else:
+        rows = 0
+        values_hash = 0
+        for chunk in read_excel_chunks(file_path, sheet_name, 100000, engine=engine):
+            rows += len(chunk)
+            values_hash += int(pd.util.hash_pandas_object(chunk.astype(str), index=False).sum())
+    return {
+        "seconds": time.perf_counter() - start,
+        "peak_mb": peak_memory_mb(),
+        "rows": rows,
+        "hash": values_hash % 2**64,
+    }
+
+
+def measure_read(file_path, sheet_name, engine, mode, plan):
+    # Each read runs in a new process, so the peak memory of one read does not hide that of the next
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        return executor.submit(time_read, file_path, sheet_name, engine, mode, plan).result()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Compare the speed and peak memory of the engines which read Excel worksheets on generated billing data.")
+    parser.add_argument("-r", "--rows", type=int, nargs="+", default=[10000], help="Dataset sizes to read (default: 10000)")
+    parser.add_argument("-d", "--data-dir", default="sample_data", help="Folder of generated spreadsheets, missing datasets are generated (default: sample_data)")
+    parser.add_argument("--engine", nargs="+", default=installed_engines(), choices=installed_engines(), help="Engines to compare (default: every installed engine)")
+    parser.add_argument("-o", "--output", help="File to save results in as JSON")
+    args = parser.parse_args(argv)
+
+    translation_file = os.path.join(args.data_dir, "Language Translation.xlsx")
+    results = {"datasets": {}}
+    mismatches = 0
+
+    for rows in args.rows:
+        file_path = os.path.join(args.data_dir, f"billing_{rows}_zh.xlsx")
+        if not os.path.exists(file_path) or not os.path.exists(translation_file):
+            print(f"Generating {rows:,} rows...")
+            generate_sample_data(rows, args.data_dir)
+        plan = dtype_plan(parse_translations(translation_file, False))
+        file_mb = os.path.getsize(file_path) / (1024 * 1024)
+
+        print(f"Reading {rows:,} rows ({file_mb:.1f} MB file), engines chosen: "
+              f"{excel_engine(file_path)} whole, {excel_engine(file_path, streaming=True)} streamed")
+        result = {"file_mb": file_mb, "reads": {}}
+        for mode in read_modes:
+            expected = None
+            for engine in args.engine:
+                read = measure_read(file_path, "Data", engine, mode, plan)
+                result["reads"][f"{engine} {mode}"] = read
+                peak = f"{read['peak_mb']:>8.0f} MB peak" if read["peak_mb"] is not None else ""
+                print(f"    {engine + ' ' + mode:<20}{read['seconds']:>10.3f}s{peak}")
+                if expected is None:
+                    expected = read
+                elif (read["rows"], read["hash"]) != (expected["rows"], expected["hash"]):
+                    mismatches += 1
+                    print(f"MISMATCH {engine} {mode}: values differ from {args.engine[0]}")
+        results["datasets"][str(rows)] = result
+
+    print(f"Large files read in chunks are streamed with openpyxl above {calamine_streaming_max_mb} MB, "
+          "as calamine loads the whole worksheet first.")
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"Saved results to {args.output}")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+import argparse
+import inspect
+import json
+import sys
+import threading
+import time
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from caching import MemoryCache
+from instrumentation import RunReport
+from monthly_sales_calculations import output_paths, total_sales
+
+# The server reads and writes any file the user can, so it only accepts connections from this computer
+host = "127.0.0.1"
+default_port = 8765
+
+# Host headers the server answers to. Checking them stops web pages reaching the server through a DNS name pointing at this computer
+allowed_hosts = ["127.0.0.1", "localhost"]
+
+# Options of total_sales which are filled in by the server instead of the job
+server_options = ["translations", "untranslated", "run_report", "progress", "cancel", "memory_cache"]
+job_options = [name for name in inspect.signature(total_sales).parameters if name not in server_options]
+
+
+class JobError(Exception):
+    """
+    Raised when a report job is not valid
+    """
+
+
+def parse_job(body):
+    """
+    Read the options of a report job from the JSON body of a request
+
+    Returns the options for total_sales and whether the report rows should be returned
+    """
+    try:
+        job = json.loads(body or b"{}")
+    except ValueError as e:
+        raise JobError(f"Request body is not valid JSON: {e}")
+    if not isinstance(job, dict):
+        raise JobError("Request body must be a JSON object of total_sales options")
+
+    return_report = bool(job.pop("return_report", False))
+    unknown = [name for name in job if name not in job_options]
+    if unknown:
+        raise JobError(f"Unknown options: {', '.join(unknown)}. Options are: {', '.join(job_options)}")
+    for name in ["file_path", "sheet_name"]:
+        if name not in job:
+            raise JobError(f"Missing option {name}")
+    return job, return_report
+
+
+def report_records(report):
+    """
+    Rows of a report (or of each report of several worksheets) which can be sent as JSON
+    """
+    if report is None:
+        return None
+    if isinstance(report, dict):
+        return {sheet_name: report_records(df) for sheet_name, df in report.items()}
+    return json.loads(report.to_json(orient="records", date_format="iso"))
+
+
+class ReportServer(ThreadingHTTPServer):
+    """
+    HTTP server running report jobs with total_sales, keeping translations and parsed worksheets in memory between jobs
+
+    At most `workers` jobs run at the same time, later jobs wait for one to finish
+    """
+    daemon_threads = True
+
+    def __init__(self, port=default_port, cache_size_mb=1024, workers=2):
+        super().__init__((host, port), ReportRequestHandler)
+        self.memory_cache = MemoryCache(cache_size_mb)
+        self.job_slots = threading.Semaphore(max(1, workers))
+
+    def run_job(self, options, return_report=False):
+        """
+        Run a report job, returning its outputs, untranslated values, stages and (if asked for) report rows
+        """
+        untranslated = {}
+        run_report = RunReport(trace_memory=False)
+        start = time.perf_counter()
+        with self.job_slots:
+            report = total_sales(
+                untranslated=untranslated,
+                run_report=run_report,
+                memory_cache=self.memory_cache,
+                **options,
+            )
+
+        result = {
+            "status": "ok",
+            "seconds": time.perf_counter() - start,
+            "outputs": output_paths(options),
+            "untranslated": untranslated,
+            "stages": run_report.stages,
+        }
+        if return_report:
+            result["report"] = report_records(report)
+        return result
+
+
+class ReportRequestHandler(BaseHTTPRequestHandler):
+    """
+    Routes of the report server
+
+    - POST /reports runs a report job, the body is a JSON object of total_sales options
+      (with "return_report": true to also get the report rows)
+    - GET /cache shows the entries and memory use of the cache, DELETE /cache empties it
+    - GET /health checks that the server is running
+
+    Requests must be addressed to localhost or 127.0.0.1, and report jobs must be sent as application/json,
+    which web pages on other sites cannot send without the browser asking the server first
+    """
+    def send_json(self, status, data):
+        body = json.dumps(data, default=str, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def allowed(self):
+        """
+        Check the Host header of the request, sending an error and returning False if it is not this computer
+        """
+        request_host = self.headers.get("Host", "").rsplit(":", 1)[0].lower()
+        if request_host not in allowed_hosts:
+            self.send_json(403, {"status": "failed", "error": f"Requests must be sent to {' or '.join(allowed_hosts)}"})
+            return False
+        return True
+
+    def do_GET(self):
+        if not self.allowed():
+            return
+        if self.path == "/health":
+            self.send_json(200, {"status": "ok"})
+        elif self.path == "/cache":
+            self.send_json(200, self.server.memory_cache.info())
+        else:
+            self.send_json(404, {"status": "failed", "error": f"Unknown path {self.path}"})
+
+    def do_DELETE(self):
+        if not self.allowed():
+            return
+        if self.path == "/cache":
+            self.server.memory_cache.clear()
+            self.send_json(200, self.server.memory_cache.info())
+        else:
+            self.send_json(404, {"status": "failed", "error": f"Unknown path {self.path}"})
+
+    def do_POST(self):
+        if not self.allowed():
+            return
+        if self.path != "/reports":
+            self.send_json(404, {"status": "failed", "error": f"Unknown path {self.path}"})
+            return
+        content_type = self.headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if content_type != "application/json":
+            self.send_json(415, {"status": "failed", "error": "Report jobs must be sent with Content-Type application/json"})
+            return
+
+        body = self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        try:
+            options, return_report = parse_job(body)
+        except JobError as e:
+            self.send_json(400, {"status": "failed", "error": str(e)})
+            return
+
+        try:
+            result = self.server.run_job(options, return_report)
+        except Exception as e:
+            self.send_json(500, {"status": "failed", "error": f"{type(e).__name__}: {e}"})
+            return
+        self.send_json(200, result)
+
+
+def submit_report(port=default_port, timeout=None, **options):
+    """
+    Send a report job with total_sales options to a running report server, returning its response
+
+    Raises urllib.error.HTTPError if the job is not valid or fails, with the error in the JSON body
+    """
+    request = urllib.request.Request(
+        f"http://{host}:{port}/reports",
+        data=json.dumps(options).encode("utf-8"),
+        headers={"Content-Type": "application/json"},
+        method="POST",
+    )
+    with urllib.request.urlopen(request, timeout=timeout) as response:
+        return json.load(response)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run a local server which generates monthly sales reports, keeping parsed workbooks and translations in memory between reports."
+    )
+    parser.add_argument("-p", "--port", type=int, default=default_port, help=f"Port to listen on at {host} (default: {default_port})")
+    parser.add_argument("--cache-size-mb", type=float, default=1024, help="Memory to keep parsed worksheets and translations in, least recently used ones are removed first (default: 1024)")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Number of reports generated at the same time (default: 2)")
+    args = parser.parse_args(argv)
+
+    server = ReportServer(args.port, args.cache_size_mb, args.workers)
+    print(f"Serving reports at http://{host}:{args.port} with a {args.cache_size_mb:g} MB cache, press Ctrl+C to stop", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,4 +1,5 @@
 from excel_form import ExcelForm
+import multiprocessing
 import sys
 from PyQt5.QtWidgets import QApplication
 
@@ -11,4 +12,6 @@ def main():
     sys.exit(app.exec_())
 
 if __name__ == "__main__":
+    # Reports run in worker processes, which need this in an executable built with pyinstaller
+    multiprocessing.freeze_support()
     main()
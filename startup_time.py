@@ -0,0 +1,81 @@
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+
+def run_child():
+    """
+    Start the user interface, printing a line once the window is shown and another once the calculation engine is loaded
+    """
+    from PyQt5.QtWidgets import QApplication
+    from excel_form import ExcelForm
+
+    app = QApplication(sys.argv)
+    excel_form = ExcelForm()
+    excel_form.show()
+    app.processEvents()
+    print("window", flush=True)
+
+    excel_form.engine_loader.wait()
+    print("engine", flush=True)
+
+
+def measure_startup(offscreen=False):
+    """
+    Launch the user interface in a new Python process, returning the seconds until the window is shown
+    and until the calculation engine is loaded in the background
+    """
+    env = dict(os.environ)
+    if offscreen:
+        env["QT_QPA_PLATFORM"] = "offscreen"
+
+    start = time.perf_counter()
+    child = subprocess.Popen(
+        [sys.executable, os.path.abspath(__file__), "--child"],
+        stdout=subprocess.PIPE,
+        text=True,
+        env=env,
+        cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+    timings = {}
+    for line in child.stdout:
+        timings[line.strip()] = time.perf_counter() - start
+    if child.wait() != 0 or "window" not in timings:
+        raise RuntimeError("The user interface did not start")
+    return timings["window"], timings.get("engine")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure how long the user interface takes to show its window.")
+    parser.add_argument("--repeat", type=int, default=5, help="Number of launches to measure (default: 5)")
+    parser.add_argument("--max-seconds", type=float, help="Exit with a non-zero status if the median time to the first window is longer than this")
+    parser.add_argument("--offscreen", action="store_true", help="Do not draw the window on screen, for machines without a display")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.child:
+        run_child()
+        return 0
+
+    window_times = []
+    engine_times = []
+    for i in range(args.repeat):
+        window, engine = measure_startup(args.offscreen)
+        window_times.append(window)
+        engine_times.append(engine)
+        print(f"Launch {i + 1}: window shown after {window:.2f}s, engine loaded after {engine:.2f}s")
+
+    median_window = statistics.median(window_times)
+    print(f"Median: window shown after {median_window:.2f}s, engine loaded after {statistics.median(engine_times):.2f}s")
+
+    if args.max_seconds is not None and median_window > args.max_seconds:
+        print(f"Time to the first window is longer than {args.max_seconds:.2f}s")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
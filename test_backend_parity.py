@@ -0,0 +1,23 @@
+import pytest
+from backend_parity import cases, check_case, column_variants
+from generate_sample_data import generated_translations
+from monthly_sales_calculations import backends, dtype_plan
+
+
+def parity_cases():
+    """
+    The cases backend_parity.py checks, on a small dataset so that they run quickly
+    """
+    plan = dtype_plan(generated_translations())
+    for name, df, already_translated in cases([500], [0]):
+        for variant, raw_df in column_variants(df, plan).items():
+            for chunk_size in [None, 200]:
+                label = f"{name}, {variant} columns" + (f", chunks of {chunk_size}" if chunk_size else "")
+                yield pytest.param(raw_df, already_translated, chunk_size, id=label)
+
+
+@pytest.mark.parametrize("backend", [backend for backend in backends if backend != "pandas"])
+@pytest.mark.parametrize("raw_df, already_translated, chunk_size", list(parity_cases()))
+def test_backend_matches_pandas(backend, raw_df, already_translated, chunk_size):
+    pytest.importorskip("pyarrow")
+    assert check_case(raw_df, generated_translations(), already_translated, chunk_size, backend) == []
@@ -0,0 +1,17 @@
+import os
+from batch_runner import colliding_inputs
+
+
+def test_workbooks_with_the_same_filename_collide_in_one_output_folder():
+    files = [os.path.join("march", "billing.xlsx"), os.path.join("april", "billing.xlsx"), os.path.join("april", "other.xlsx")]
+
+    assert colliding_inputs(files, "0", "reports", "xlsx", None) == [files[:2]]
+    # Saved next to each workbook, only their states collide
+    assert colliding_inputs(files, "0", None, "xlsx", None) == []
+    assert colliding_inputs(files, "0", None, "xlsx", "states") == [files[:2]]
+
+
+def test_workbooks_with_the_same_name_and_other_extensions_collide():
+    files = ["billing.xls", "billing.xlsx"]
+
+    assert colliding_inputs(files, ["March", "April"], None, "csv", None) == [files]
@@ -0,0 +1,119 @@
+import datetime
+import zipfile
+import numpy as np
+import openpyxl
+import pandas as pd
+import pytest
+from excel_io import ArrowChunkWriter, append_worksheet, append_worksheets
+
+
+@pytest.mark.parametrize("output_format", ["parquet", "feather"])
+@pytest.mark.parametrize(
+    "chunks, expected",
+    [
+        # A column which only has missing values in the first chunk, such as a remarks column
+        ([[None, None], ["x", None]], [None, None, "x", None]),
+        ([[np.nan, np.nan], ["x", None]], [None, None, "x", None]),
+        # Whole numbers in the first chunk followed by decimals
+        ([[1, 2], [0.1191, 2]], [1.0, 2.0, 0.1191, 2.0]),
+    ],
+    ids=["null first chunk", "NaN first chunk", "integer first chunk"],
+)
+def test_arrow_chunk_writer_keeps_types_across_chunks(tmp_path, output_format, chunks, expected):
+    pytest.importorskip("pyarrow")
+    file_path = tmp_path / f"chunks.{output_format}"
+
+    with ArrowChunkWriter(file_path, output_format) as writer:
+        for values in chunks:
+            writer.write(pd.DataFrame({"Remarks": values}))
+
+    df = pd.read_parquet(file_path) if output_format == "parquet" else pd.read_feather(file_path)
+    assert [None if pd.isna(value) else value for value in df["Remarks"]] == expected
+
+
+def existing_workbook(file_path):
+    """
+    A spreadsheet with two worksheets, one of them with a formatted date, to append worksheets to
+    """
+    workbook = openpyxl.Workbook()
+    raw_data = workbook.active
+    raw_data.title = "Raw Data"
+    raw_data.append(["Resource ID", "Order Start Time", "Usage Amount"])
+    raw_data.append(["r-1", datetime.datetime(2024, 3, 5, 10, 30), 1.5])
+    raw_data["B2"].number_format = "yyyy/mm/dd hh:mm"
+    notes = workbook.create_sheet("Notes")
+    notes["A1"] = "Kept as it is"
+    workbook.save(file_path)
+
+
+def test_append_worksheets_adds_worksheets_after_the_existing_ones(tmp_path):
+    file_path = tmp_path / "existing.xlsx"
+    existing_workbook(file_path)
+    with zipfile.ZipFile(file_path) as archive:
+        existing_parts = {name: archive.read(name) for name in ["xl/worksheets/sheet1.xml", "xl/worksheets/sheet2.xml"]}
+    report = pd.DataFrame(
+        {
+            "Resource ID": ["r-1", "r-2"],
+            "Order Start Time": pd.to_datetime(["2024-03-05 10:30:00", "2024-03-31 23:59:59"]),
+            "Usage Amount": [1.5, 0.1191],
+            "Remarks": ["a & <b>", None],
+        }
+    )
+
+    append_worksheets(file_path, {"Report": report, "Totals": pd.DataFrame({"Total": [1.6191]})})
+
+    workbook = openpyxl.load_workbook(file_path)
+    assert workbook.sheetnames == ["Raw Data", "Notes", "Report", "Totals"]
+    rows = list(workbook["Report"].iter_rows(values_only=True))
+    assert rows == [
+        ("Resource ID", "Order Start Time", "Usage Amount", "Remarks"),
+        ("r-1", datetime.datetime(2024, 3, 5, 10, 30), 1.5, "a & <b>"),
+        ("r-2", datetime.datetime(2024, 3, 31, 23, 59, 59), 0.1191, None),
+    ]
+    assert workbook["Report"]["B2"].is_date
+    assert workbook["Report"]["B3"].is_date
+    assert list(workbook["Totals"].iter_rows(values_only=True)) == [("Total",), (1.6191,)]
+
+    # The existing worksheets are copied over unchanged
+    assert workbook["Raw Data"]["B2"].value == datetime.datetime(2024, 3, 5, 10, 30)
+    assert workbook["Raw Data"]["B2"].number_format == "yyyy/mm/dd hh:mm"
+    assert workbook["Notes"]["A1"].value == "Kept as it is"
+    with zipfile.ZipFile(file_path) as archive:
+        assert {name: archive.read(name) for name in existing_parts} == existing_parts
+
+
+@pytest.mark.parametrize(
+    "sheet_names",
+    [
+        ["Raw Data"],
+        ["raw data"],
+        ["Report", "REPORT"],
+        [""],
+        ["Usage/Region"],
+        ["Report [March]"],
+        ["A name longer than thirty-one characters"],
+    ],
+    ids=["existing", "existing in other case", "added twice", "empty", "slash", "brackets", "too long"],
+)
+def test_append_worksheets_rejects_names_excel_does_not_allow(tmp_path, sheet_names):
+    file_path = tmp_path / "existing.xlsx"
+    existing_workbook(file_path)
+    before = file_path.read_bytes()
+
+    with pytest.raises(ValueError):
+        append_worksheets(file_path, {sheet_name: pd.DataFrame({"Total": [1.0]}) for sheet_name in sheet_names})
+
+    # The spreadsheet is left as it was
+    assert file_path.read_bytes() == before
+    assert list(tmp_path.iterdir()) == [file_path]
+
+
+def test_append_worksheet_adds_one_worksheet(tmp_path):
+    file_path = tmp_path / "existing.xlsx"
+    existing_workbook(file_path)
+
+    append_worksheet(file_path, pd.DataFrame({"Total": [2.5]}), "Monthly Sales Calculation")
+
+    workbook = openpyxl.load_workbook(file_path)
+    assert workbook.sheetnames == ["Raw Data", "Notes", "Monthly Sales Calculation"]
+    assert workbook["Monthly Sales Calculation"]["A2"].value == 2.5
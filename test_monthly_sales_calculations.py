@@ -0,0 +1,202 @@
+import numpy as np
+import pandas as pd
+import pytest
+from dtypes import apply_dtype_plan
+from generate_sample_data import english_billing_data, generate_billing_data, generated_translations, write_billing_workbook
+from monthly_sales_calculations import (
+    dtype_plan,
+    finalize_sales_state,
+    fold_sales_chunks,
+    hourly_and_postpaid_sales,
+    important_variables,
+    incremental_sales_state,
+    report_columns,
+)
+
+
+def merge_and_apply_sales(sales_df, translations):
+    """
+    Hourly and postpaid sales calculated as they were before the single grouped pass, by merging the first and
+    last rows of each Resource ID and picking the overall Order End Time row by row
+    """
+    (
+        project_id,
+        resource_id,
+        resource_name,
+        resource_type,
+        region,
+        billing_method,
+        configuration,
+        order_type,
+        order_start_time,
+        order_end_time,
+        unit_price,
+        usage_amount,
+        monthly,
+        delete_refund
+    ) = important_variables(translations)
+
+    hourly_and_postpaid_df = sales_df[sales_df[billing_method] != monthly]
+    first_row = hourly_and_postpaid_df.groupby(resource_id).first().reset_index()
+    last_row = hourly_and_postpaid_df.groupby(resource_id).last().reset_index()
+    merged_df = pd.merge(
+        first_row,
+        last_row[[resource_id, order_type, order_start_time, order_end_time]],
+        on=resource_id,
+        how="left",
+        suffixes=("_first_row", "_last_row"),
+    )
+
+    order_end_overall = order_end_time + "_first_row"
+    last_row_start = order_start_time + "_last_row"
+    last_row_end = order_end_time + "_last_row"
+    last_row_order_type = order_type + "_last_row"
+    if len(merged_df):
+        merged_df[order_end_overall] = merged_df.apply(
+            lambda row: row[last_row_start]
+            if row[last_row_order_type] == delete_refund
+            else row[last_row_end],
+            axis=1,
+        )
+    merged_df = merged_df.drop([last_row_order_type, last_row_start, last_row_end], axis=1)
+    merged_df = merged_df.rename(
+        columns={
+            order_start_time + "_first_row": order_start_time,
+            order_end_overall: order_end_time,
+        }
+    )
+
+    merged_df[order_start_time] = pd.to_datetime(merged_df[order_start_time])
+    merged_df[order_end_time] = pd.to_datetime(merged_df[order_end_time])
+    merged_df["Duration (Hours)"] = (merged_df[order_end_time] - merged_df[order_start_time]).dt.total_seconds() / 3600
+
+    usage_total = hourly_and_postpaid_df.groupby(resource_id)[usage_amount].sum().reset_index()
+    final_df = pd.merge(merged_df, usage_total, on=resource_id, how="left", suffixes=("_hourly", "_total"))
+    final_df = final_df.rename(columns={usage_amount + "_total": usage_amount})
+    final_df = final_df.drop([usage_amount + "_hourly"], axis=1)
+    final_df[unit_price] = final_df[usage_amount] / final_df["Duration (Hours)"]
+    final_df["Duration (Hours)"] = final_df["Duration (Hours)"].round(2)
+    return final_df
+
+
+def sales_cases():
+    """
+    English billing data, with missing values and Resource IDs which have no hourly or postpaid rows
+    """
+    df = english_billing_data(generate_billing_data(2000, seed=1))
+    rng = np.random.default_rng(1)
+    cases = {"generated": df}
+
+    missing_values = df.copy()
+    missing_values.loc[rng.random(len(df)) < 0.05, "Usage Amount"] = np.nan
+    missing_values.loc[missing_values["Resource ID"] == missing_values["Resource ID"].iloc[-1], "Usage Amount"] = np.nan
+    first_rows = ~missing_values["Resource ID"].duplicated()
+    missing_values.loc[first_rows, "Region"] = None
+    missing_values.loc[first_rows, "Order Start Time"] = None
+    missing_values.loc[rng.random(len(df)) < 0.05, "Order End Time"] = None
+    missing_values.loc[rng.random(len(df)) < 0.05, "Order Type"] = None
+    cases["missing values"] = missing_values
+
+    only_monthly = df.copy()
+    only_monthly.loc[only_monthly["Resource ID"].isin(only_monthly["Resource ID"].unique()[:5]), "Billing Method"] = "Monthly"
+    cases["resources with only monthly rows"] = only_monthly
+
+    cases["no hourly or postpaid rows"] = df.assign(**{"Billing Method": "Monthly"})
+    return cases
+
+
+@pytest.mark.parametrize("name", list(sales_cases()))
+def test_hourly_and_postpaid_sales_matches_merge_and_apply(name):
+    translations = generated_translations()
+    sales_df = sales_cases()[name]
+
+    # Only the columns of the report are kept, as total_sales does
+    columns = report_columns(translations)
+    expected = merge_and_apply_sales(sales_df, translations)[columns]
+    actual = hourly_and_postpaid_sales(sales_df, translations)[columns]
+
+    pd.testing.assert_frame_equal(expected, actual)
+
+
+def test_chunks_with_only_ambiguous_dates_use_the_worksheet_format():
+    translations = generated_translations()
+    df = english_billing_data(generate_billing_data(400, seed=2))
+    # Day first times, where only the first chunk has days after the 12th
+    start = pd.to_datetime(df["Order Start Time"])
+    df = df[(start.dt.day > 12) | (np.arange(len(df)) >= 200)].copy()
+    df = df[(np.arange(len(df)) < 100) | (pd.to_datetime(df["Order End Time"]).dt.day <= 12)]
+    for col in ["Order Start Time", "Order End Time"]:
+        df[col] = pd.to_datetime(df[col]).dt.strftime("%d/%m/%Y %H:%M:%S")
+    first_chunk, second_chunk = df.iloc[:100], df.iloc[100:]
+    assert (pd.to_datetime(second_chunk["Order Start Time"], format="%d/%m/%Y %H:%M:%S").dt.day <= 12).all()
+
+    whole = fold_sales_chunks([df], translations, already_translated=True)
+    chunked = fold_sales_chunks([first_chunk, second_chunk], translations, already_translated=True)
+
+    assert chunked["timestamp_formats"]["Order Start Time"] == "%d/%m/%Y %H:%M:%S"
+    pd.testing.assert_frame_equal(
+        finalize_sales_state(whole["state"], translations), finalize_sales_state(chunked["state"], translations)
+    )
+
+
+def incremental_run(file_path, state_file, translations):
+    stats = {}
+    state = incremental_sales_state(
+        file_path, 0, translations, already_translated=True, state_file=state_file, chunk_size=150, stats=stats
+    )
+    return finalize_sales_state(state, translations), stats["rows"]
+
+
+def test_incremental_sales_state_processes_only_appended_rows(tmp_path):
+    translations = generated_translations()
+    df = english_billing_data(generate_billing_data(1000, seed=3))
+    file_path, state_file = tmp_path / "billing.xlsx", tmp_path / "state.pickle"
+
+    write_billing_workbook(df.iloc[:600], file_path)
+    assert incremental_run(file_path, state_file, translations)[1] == 600
+    write_billing_workbook(df, file_path)
+    appended, rows = incremental_run(file_path, state_file, translations)
+
+    assert rows == 400
+    full, _ = incremental_run(file_path, tmp_path / "full.pickle", translations)
+    pd.testing.assert_frame_equal(full, appended)
+
+
+def test_incremental_sales_state_processes_all_rows_when_an_earlier_row_changed(tmp_path):
+    translations = generated_translations()
+    df = english_billing_data(generate_billing_data(1000, seed=3))
+    file_path, state_file = tmp_path / "billing.xlsx", tmp_path / "state.pickle"
+
+    write_billing_workbook(df.iloc[:600], file_path)
+    incremental_run(file_path, state_file, translations)
+    # A row in the middle of the rows processed last time, not the last one
+    df.loc[df.index[300], "Usage Amount"] = 123456.0
+    write_billing_workbook(df, file_path)
+    changed, rows = incremental_run(file_path, state_file, translations)
+
+    assert rows == 1000
+    full, _ = incremental_run(file_path, tmp_path / "full.pickle", translations)
+    pd.testing.assert_frame_equal(full, changed)
+
+
+def test_unit_prices_which_are_not_numbers_are_left_blank():
+    translations = generated_translations()
+    df = english_billing_data(generate_billing_data(200, seed=4))
+    df["Unit Price"] = df["Unit Price"].astype(object)
+    df.loc[df.index[:3], "Unit Price"] = "-"
+
+    compacted = apply_dtype_plan(df.copy(), dtype_plan(translations))
+
+    assert compacted["Unit Price"].dtype == np.float64
+    assert compacted["Unit Price"].iloc[:3].isna().all()
+    pd.testing.assert_series_equal(compacted["Unit Price"].iloc[3:], df["Unit Price"].iloc[3:].astype("float64"))
+
+
+def test_usage_amounts_which_are_not_numbers_stop_the_report():
+    translations = generated_translations()
+    df = english_billing_data(generate_billing_data(200, seed=4))
+    df["Usage Amount"] = df["Usage Amount"].astype(object)
+    df.loc[df.index[5], "Usage Amount"] = "abc"
+
+    with pytest.raises(ValueError, match="Usage Amount"):
+        apply_dtype_plan(df, dtype_plan(translations))
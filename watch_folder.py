@@ -0,0 +1,409 @@
+import argparse
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import zipfile
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from batch_runner import init_worker, output_path, process_file, state_path
+from caching import atomic_write_bytes, file_hash, file_signature
+from excel_io import output_formats
+from monthly_sales_calculations import backends
+
+# Spreadsheets which are picked up from the watched folder
+watched_extensions = (".xlsx", ".xlsm", ".xls")
+
+# Files in the output folder recording the processed workbooks and every run
+ledger_filename = "watch_state.json"
+log_filename = "watch_log.jsonl"
+
+
+def init_watch_worker(translation_sheet, use_cache=True):
+    """
+    Parse the translations once when a worker process starts
+
+    Workers leave stopping to the service, which lets running jobs finish when it is interrupted
+    """
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    init_worker(translation_sheet, use_cache)
+
+
+def is_complete(file_path):
+    """
+    Check that a workbook is not still being written
+
+    Excel 2007+ workbooks are zip files, which are only readable once their central directory at the end is written
+    """
+    if file_path.lower().endswith(".xls"):
+        return True
+    return zipfile.is_zipfile(file_path)
+
+
+class FolderWatcher:
+    """
+    Process workbooks dropped into a folder with total_sales, on a pool of worker processes which keep the
+    translations parsed between jobs
+
+    A workbook is processed once its size and modification time have not changed for `settle_seconds`, so files
+    which are still being copied are not read. Processed workbooks are recorded in the output folder with the hash
+    of their contents, so after a restart only new or changed workbooks (and those which were being processed when
+    the service stopped) are processed. Every run is appended to the run log in the output folder.
+    """
+    def __init__(
+        self,
+        watch_dir,
+        output_dir,
+        sheet_name=0,
+        translation_sheet="Language Translation.xlsx",
+        options=None,
+        workers=1,
+        settle_seconds=5.0,
+        poll_seconds=2.0,
+        use_cache=True,
+        state_dir=None,
+        run_report=False,
+    ):
+        self.watch_dir = os.path.abspath(watch_dir)
+        self.output_dir = os.path.abspath(output_dir)
+        self.sheet_name = sheet_name
+        self.translation_sheet = translation_sheet
+        self.options = dict(options or {}, use_cache=use_cache)
+        self.workers = max(1, workers)
+        self.settle_seconds = settle_seconds
+        self.poll_seconds = poll_seconds
+        self.use_cache = use_cache
+        self.state_dir = state_dir
+        self.run_report = run_report
+
+        os.makedirs(self.output_dir, exist_ok=True)
+        self.ledger_path = os.path.join(self.output_dir, ledger_filename)
+        self.log_path = os.path.join(self.output_dir, log_filename)
+        self.ledger = self.load_ledger()
+
+        # Size and modification time of each file when last seen, and since when they have not changed
+        self.seen = {}
+        self.queue = deque()
+        self.queued = set()
+        # Workbook, signature and start time of each job given to the worker processes
+        self.running = {}
+        self.executor = None
+        self.translation_signature = None
+
+    def load_ledger(self):
+        """
+        Read the workbooks processed in earlier runs of the service
+        """
+        try:
+            with open(self.ledger_path, encoding="utf-8") as file:
+                return json.load(file).get("files", {})
+        except (OSError, ValueError):
+            return {}
+
+    def save_ledger(self):
+        data = json.dumps({"files": self.ledger}, indent=2, ensure_ascii=False)
+        atomic_write_bytes(self.ledger_path, data.encode("utf-8"))
+
+    def log(self, entry):
+        """
+        Append an entry to the run log and print it
+        """
+        with open(self.log_path, "a", encoding="utf-8") as file:
+            file.write(json.dumps(entry, ensure_ascii=False) + "\n")
+
+        status = "OK    " if entry["status"] == "ok" else "FAILED"
+        print(f"{status} {entry['file']} ({entry['seconds']:.2f}s)" + (f": {entry['error']}" if entry["error"] else ""), flush=True)
+
+    def watched_files(self):
+        """
+        Workbooks in the watched folder, without Excel lock files and the reports of the service if they are saved there
+        """
+        try:
+            names = os.listdir(self.watch_dir)
+        except OSError:
+            return []
+
+        is_output_dir = self.watch_dir == self.output_dir
+        files = []
+        for name in sorted(names):
+            file_path = os.path.join(self.watch_dir, name)
+            if (
+                name.lower().endswith(watched_extensions)
+                and not name.startswith("~$")
+                and not (is_output_dir and name.startswith("result_"))
+                and os.path.isfile(file_path)
+            ):
+                files.append(file_path)
+        return files
+
+    def is_processed(self, file_path, signature):
+        """
+        Check whether a workbook was already processed, hashing it only if its size or modification time changed
+        """
+        entry = self.ledger.get(file_path)
+        if entry is None:
+            return False
+        if [entry["size"], entry["mtime_ns"]] == list(signature):
+            return True
+        try:
+            content_hash = file_hash(file_path)
+        except OSError:
+            return False
+        if content_hash != entry["hash"]:
+            return False
+
+        # Same contents saved or copied again, remember the new signature to skip hashing it next time
+        entry["size"], entry["mtime_ns"] = signature
+        self.save_ledger()
+        return True
+
+    def scan(self, now=None):
+        """
+        Queue the workbooks which are new or changed and have finished being written
+        """
+        now = time.monotonic() if now is None else now
+        files = self.watched_files()
+
+        for file_path in files:
+            signature = file_signature(file_path)
+            if signature is None:
+                continue
+            last = self.seen.get(file_path)
+            if last is None or last[0] != signature:
+                # Still being written, or changed since the last scan, wait until it settles
+                self.seen[file_path] = (signature, now)
+                if self.settle_seconds > 0:
+                    continue
+            elif now - last[1] < self.settle_seconds:
+                continue
+
+            if file_path in self.queued or file_path in self.running_files():
+                continue
+            if self.is_processed(file_path, signature) or not is_complete(file_path):
+                continue
+            self.queue.append(file_path)
+            self.queued.add(file_path)
+
+        # Forget files which were removed
+        for file_path in set(self.seen) - set(files):
+            del self.seen[file_path]
+
+    def running_files(self):
+        return {file_path for file_path, _, _ in self.running.values()}
+
+    def start_pool(self):
+        """
+        Start the worker processes, each parsing the translations once
+        """
+        self.translation_signature = file_signature(self.translation_sheet)
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.workers,
+            initializer=init_watch_worker,
+            initargs=(self.translation_sheet, self.use_cache),
+        )
+
+    def restart_pool_if_translations_changed(self):
+        """
+        Restart the worker processes once running jobs finish if the translation source file changed
+
+        While the file is missing (for example while it is being saved again) the workers keep the translations they have
+        """
+        signature = file_signature(self.translation_sheet)
+        if signature is None or signature == self.translation_signature:
+            return
+        print("Translation source file changed, reloading translations...", flush=True)
+        self.wait_for_jobs()
+        self.executor.shutdown()
+        self.start_pool()
+
+    def submit_jobs(self):
+        """
+        Hand queued workbooks to the worker processes, keeping at most one job per worker in the pool
+        """
+        while self.queue and len(self.running) < self.workers:
+            file_path = self.queue.popleft()
+            self.queued.discard(file_path)
+            signature = file_signature(file_path)
+            if signature is None:
+                continue
+
+            output_format = self.options.get("output_format", "xlsx")
+            job_options = dict(
+                self.options,
+                new_filename=output_path(file_path, self.output_dir, output_format),
+                state_file=state_path(file_path, self.sheet_name, self.state_dir),
+            )
+            run_report_path = output_path(file_path, self.output_dir, "run.json") if self.run_report else None
+            future = self.executor.submit(process_file, file_path, self.sheet_name, job_options, run_report_path)
+            self.running[future] = (file_path, signature, time.time())
+
+    def collect_jobs(self, timeout=0):
+        """
+        Record the workbooks whose jobs have finished in the ledger and the run log
+        """
+        if not self.running:
+            return
+        done, _ = wait(list(self.running), timeout=timeout, return_when=FIRST_COMPLETED)
+        broken = False
+
+        for future in done:
+            file_path, signature, started = self.running.pop(future)
+            try:
+                elapsed, error, untranslated, summary = future.result()
+            except Exception as e:
+                # A worker process died or the translation source could not be parsed
+                broken = broken or isinstance(e, BrokenProcessPool)
+                elapsed, error, untranslated, summary = time.time() - started, f"{type(e).__name__}: {e}", {}, None
+
+            output_format = self.options.get("output_format", "xlsx")
+            output = output_path(file_path, self.output_dir, output_format) if not error else None
+            # Workbooks changed while they were processed get no hash, so that they are processed again
+            try:
+                content_hash = file_hash(file_path) if file_signature(file_path) == signature else None
+            except OSError:
+                content_hash = None
+
+            # Failed workbooks are also recorded, so they are only tried again once they change
+            self.ledger[file_path] = {
+                "size": signature[0],
+                "mtime_ns": signature[1],
+                "hash": content_hash,
+                "status": "failed" if error else "ok",
+                "output": output,
+                "finished": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            }
+            self.save_ledger()
+            self.log({
+                "file": file_path,
+                "status": "failed" if error else "ok",
+                "error": error,
+                "seconds": round(elapsed, 3),
+                "output": output,
+                "untranslated": untranslated,
+                "started": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(started)),
+                "finished": self.ledger[file_path]["finished"],
+                "run_report": summary,
+            })
+
+        if broken:
+            # A worker process died, start new ones for the remaining workbooks
+            for file_path, _, _ in self.running.values():
+                self.queue.appendleft(file_path)
+                self.queued.add(file_path)
+            self.running = {}
+            self.executor.shutdown(wait=False)
+            self.start_pool()
+
+    def wait_for_jobs(self):
+        while self.running:
+            self.collect_jobs(timeout=None)
+
+    def run(self, stop=None, once=False):
+        """
+        Watch the folder until `stop` (a threading.Event) is set, finishing running jobs before returning
+
+        If `once` is True, process the workbooks already in the folder and return
+        """
+        stop = stop if stop is not None else threading.Event()
+        print(f"Watching {self.watch_dir} with {self.workers} worker(s), saving results in {self.output_dir}", flush=True)
+        self.start_pool()
+        try:
+            while not stop.is_set():
+                self.restart_pool_if_translations_changed()
+                self.scan()
+                self.submit_jobs()
+                self.collect_jobs(timeout=self.poll_seconds if self.running else 0)
+
+                if once and not self.queue and not self.running and self.all_processed():
+                    break
+                if not self.running:
+                    stop.wait(self.poll_seconds)
+            # Workbooks still queued are not recorded, so they are processed after a restart
+            self.wait_for_jobs()
+        finally:
+            self.executor.shutdown()
+
+    def all_processed(self):
+        """
+        Check that every workbook in the folder which has finished being written has been processed
+        """
+        for file_path in self.watched_files():
+            signature = file_signature(file_path)
+            if signature is not None and is_complete(file_path) and not self.is_processed(file_path, signature):
+                return False
+        return True
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Watch a folder and generate monthly sales reports for every new or changed workbook."
+    )
+    parser.add_argument("watch_dir", help="Folder which raw data exports are saved into")
+    parser.add_argument("-o", "--output-dir", required=True, help="Folder to save reports, the run log and the list of processed workbooks in")
+    parser.add_argument("-s", "--sheet", nargs="+", default=["0"], help="Worksheet names or 0-based indexes to process in every workbook, a number is a name if a worksheet has that name (default: first worksheet)")
+    parser.add_argument("-t", "--translation", default="Language Translation.xlsx", help="Translation source file, translations are reloaded when it changes")
+    parser.add_argument("--already-translated", action="store_true", help="Raw data is already in English")
+    parser.add_argument("-f", "--format", default="xlsx", choices=output_formats, help="File format of the reports (default: xlsx)")
+    parser.add_argument("--new-worksheet", default="Sheet1", help="Worksheet name in the reports")
+    parser.add_argument("--rollups", action="store_true", help="Also save totals and subtotals by project, region, resource type and billing method")
+    parser.add_argument("--state-dir", help="Save the state of each workbook in this folder so that re-exported workbooks only process rows added since then")
+    parser.add_argument("--no-cache", action="store_true", help="Do not read from or save to the cache of parsed worksheets and translations")
+    parser.add_argument("--chunk-size", type=int, help="Read worksheets this many rows at a time to limit memory use on very large worksheets")
+    parser.add_argument("--backend", default="pandas", choices=backends, help="Library which translates and calculates the reports (default: pandas)")
+    parser.add_argument("--run-report", action="store_true", help="Save the time, memory use and rows of each stage as result_filename.run.json")
+    parser.add_argument("-w", "--workers", type=int, default=2, help="Number of worker processes (default: 2)")
+    parser.add_argument("--settle-seconds", type=float, default=5.0, help="Only process a workbook once it has not changed for this long, so that partially copied files are not read (default: 5)")
+    parser.add_argument("--poll-seconds", type=float, default=2.0, help="Check the folder for new workbooks this often (default: 2)")
+    parser.add_argument("--once", action="store_true", help="Process the workbooks already in the folder, then exit")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if not os.path.isfile(args.translation):
+        print(f"Translation source file {args.translation} not found")
+        return 1
+
+    options = dict(
+        already_translated=args.already_translated,
+        new_worksheet=args.new_worksheet,
+        chunk_size=args.chunk_size,
+        output_format=args.format,
+        backend=args.backend,
+        rollups=args.rollups,
+    )
+    watcher = FolderWatcher(
+        args.watch_dir,
+        args.output_dir,
+        # Numbers are worksheet indexes unless a workbook has a worksheet of that name, which is worked out for each workbook
+        args.sheet[0] if len(args.sheet) == 1 else args.sheet,
+        args.translation,
+        options,
+        workers=args.workers,
+        settle_seconds=args.settle_seconds,
+        poll_seconds=args.poll_seconds,
+        use_cache=not args.no_cache,
+        state_dir=args.state_dir,
+        run_report=args.run_report,
+    )
+
+    # Finish running jobs before exiting when the service is stopped
+    stop = threading.Event()
+
+    def request_stop(signum, frame):
+        print("Stopping once running jobs finish...", flush=True)
+        stop.set()
+
+    signal.signal(signal.SIGINT, request_stop)
+    signal.signal(signal.SIGTERM, request_stop)
+
+    watcher.run(stop, once=args.once)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())